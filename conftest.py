@@ -0,0 +1,20 @@
+import pytest
+
+from lib.workouts import workouts as workout_library
+from lib import benchmark
+
+
+# tests run against small synthetic workout libraries (see benchmark.write_synthetic_library), so every
+# weekly solve takes milliseconds. the library in use is restored after every test.
+
+@pytest.fixture(scope="session")
+def small_library_path(tmp_path_factory):
+    return benchmark.synthetic_library(str(tmp_path_factory.mktemp("library")), 30)
+
+
+@pytest.fixture
+def small_library(small_library_path):
+    catalog = workout_library.default_catalog
+    workout_library.use_library(small_library_path)
+    yield workout_library.default_catalog
+    workout_library.default_catalog = catalog
@@ -0,0 +1,127 @@
+import concurrent.futures
+import copy
+import datetime
+import os
+
+from .workouts import workouts as workout_library
+from . import periodization
+from . import workout_planner
+
+
+# batch planning for many athletes at once.
+#
+# every athlete is described by the same config dict the notebook uses, optionally with
+# "initial_fatigue" and "initial_fitness" dicts by sport. athletes are spread over a process pool;
+# each worker loads the workout library once and keeps its own solver between athletes.
+
+default_initial_fatigue = 30
+
+config_date_keys = ("start_date", "race_date")
+config_required_keys = config_date_keys + ("current_fitness", "max_weekly_training", "max_block_weeks")
+
+
+def config_from_json(data):
+    # config dict from parsed JSON, with dates as ISO strings: either the config itself or
+    # {"config": ..., "initial_fatigue": ..., "initial_fitness": ...}. raises ValueError when data is
+    # not a usable config.
+    if not isinstance(data, dict):
+        raise ValueError("a plan config must be a JSON object")
+    wrapped = "config" in data
+    config = data["config"] if wrapped else data
+    if not isinstance(config, dict):
+        raise ValueError("a plan config must be a JSON object")
+    config = dict(config)
+    if wrapped:
+        for key in ("initial_fatigue", "initial_fitness"):
+            if data.get(key) is not None:
+                config[key] = data[key]
+
+    missing = [key for key in config_required_keys if key not in config]
+    if missing:
+        raise ValueError("config is missing {}".format(", ".join(missing)))
+    for key in config_date_keys:
+        if isinstance(config[key], str):
+            config[key] = datetime.date.fromisoformat(config[key])
+    return config
+
+
+def initial_state(config):
+    incoming_fatigue = config.get("initial_fatigue", { "bike": default_initial_fatigue, "run": default_initial_fatigue, "swim": default_initial_fatigue })
+    incoming_fitness = config.get("initial_fitness", { "bike": config["current_fitness"], "run": config["current_fitness"], "swim": config["current_fitness"] })
+    return incoming_fatigue, incoming_fitness
+
+
+def create_training_plan(config, add_workouts_to_week_plan=workout_planner.add_workouts_to_week_plan_matrix):
+    # periodize the athlete's season and fill every week with workouts
+    week_plan = periodization.create_linear_periodization_plan(config)
+    incoming_fatigue, incoming_fitness = initial_state(config)
+    return workout_planner.add_workouts_to_weeks(week_plan, incoming_fatigue, incoming_fitness, config["max_weekly_training"], add_workouts_to_week_plan)
+
+
+def stream_training_plan(config, add_workouts_to_week_plan=workout_planner.add_workouts_to_week_plan_matrix):
+    # same as create_training_plan, but yields every week as soon as it is solved
+    week_plan = periodization.create_linear_periodization_plan(config)
+    incoming_fatigue, incoming_fitness = initial_state(config)
+    yield from workout_planner.iter_weeks_with_workouts(week_plan, incoming_fatigue, incoming_fitness, config["max_weekly_training"], add_workouts_to_week_plan)
+
+
+# worker side
+
+engines = ["matrix", "persistent"]
+
+worker_state = {}
+
+def init_worker(engine, compact=False):
+    # runs once per worker process: parse the library and set up the solver this worker keeps
+    workout_library.fetch_workouts_with_cache()
+    worker_state["engine"] = engine
+    worker_state["compact"] = compact
+    if engine == "persistent":
+        from .week_planner import WeekPlanner
+        worker_state["planner"] = WeekPlanner()
+
+
+def plan_athlete(athlete_idx, config):
+    if worker_state["engine"] == "persistent":
+        planner = worker_state["planner"]
+        # start every athlete from a clean solver state so results do not depend on which athletes
+        # this worker planned before
+        planner.reset()
+        week_plan = create_training_plan(config, planner.add_workouts_to_week_plan)
+    else:
+        week_plan = create_training_plan(config)
+    if worker_state.get("compact"):
+        # a few arrays to send back instead of every workout dict
+        from .compact_plan import CompactPlan
+        return athlete_idx, CompactPlan.from_week_plan(week_plan)
+    return athlete_idx, week_plan
+
+
+def plan_athletes(configs, workers=None, engine="matrix", ordered=False, compact=False, mp_context=None):
+    # yields (athlete index, plan) as plans finish. with ordered=True plans are yielded in input order
+    # instead, still as soon as every earlier plan is done. workers=0 plans in this process. with
+    # compact=True plans are compact_plan.CompactPlans. mp_context is the multiprocessing context of
+    # the pool, the platform's default when None.
+    if engine not in engines:
+        raise ValueError("unknown engine {}, expected one of {}".format(engine, engines))
+
+    configs = [copy.deepcopy(config) for config in configs]
+
+    if workers == 0:
+        init_worker(engine, compact)
+        for athlete_idx, config in enumerate(configs):
+            yield plan_athlete(athlete_idx, config)
+        return
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=init_worker, initargs=(engine, compact)) as executor:
+        futures = [executor.submit(plan_athlete, athlete_idx, config) for athlete_idx, config in enumerate(configs)]
+
+        if ordered:
+            for future in futures:
+                yield future.result()
+        else:
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
@@ -0,0 +1,436 @@
+import argparse
+import concurrent.futures
+import contextlib
+import csv
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from .workouts import workouts as workout_library
+from .workouts import binary_library
+from . import periodization
+from . import plan_check
+from . import solvers
+from . import workout_planner
+
+
+# benchmark harness for the planning pipeline.
+#
+# every case plans one synthetic season: a generated workout library of a given size, a horizon of
+# a given number of weeks, and one weekly engine. cases run one at a time, each in a fresh process so
+# peak memory is per case. week timings are split at the solver: model build is everything before
+# the solver is called, solve is the solver call itself, extraction is everything after it. results
+# are written as JSON and can be compared against an earlier run to flag regressions. everything
+# runs offline with the local solvers.
+#
+# the rolling engine plans a window of `horizon` weeks per solve (see rolling_horizon.py), so its
+# timings are per window. the speculative engine solves weeks on a pool of `workers` processes (see
+# speculative.py); its solve time is the solver time of every solve, its critical path what the plan
+# takes with as many workers as weeks. both are compared against the sequential matrix engine on the
+# same case: planning wall clock time, solve time, solver calls and the total fitness at the end of
+# the season.
+
+default_sizes = [30, 300, 3000]
+default_weeks = [4, 12]
+default_seed = 0
+default_weekly_hours = 8
+default_threshold = .2 # flag a metric that got more than 20% worse
+default_min_seconds = .05 # ... and by more than this, so timer noise on tiny cases is not flagged
+default_horizons = [3]
+default_workers = None # process counts of the speculative engine, None for one per cpu
+sequential_engine = "matrix" # what the rolling and speculative engines are compared against
+
+
+def weekly_engines():
+    from . import week_search
+    from . import presolve
+    return {
+        "rule": workout_planner.add_workouts_to_week_plan,
+        "matrix": workout_planner.add_workouts_to_week_plan_matrix,
+        "search": week_search.add_workouts_to_week_plan_search,
+        "presolve": presolve.add_workouts_to_week_plan_presolved
+    }
+
+
+# synthetic libraries
+
+week_blocks_choices = ["", "", "", "base", "build", "peak", "rest", "base build", "peak rest"]
+
+def write_synthetic_library(path, number_of_workouts, seed=default_seed):
+    # csv library in the format of workout_library/workouts_test.csv: all three sports in turn, a mix
+    # of week_blocks, and fatigue and fitness that grow with intensity and duration
+    rng = np.random.default_rng(seed)
+    with open(path, "wt", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["sport", " name", " intensity", " duration", " fatigue_increase", " fitness_gain", " week_blocks"])
+        for idx in range(number_of_workouts):
+            sport = workout_library.sports[idx % len(workout_library.sports)]
+            intensity = int(rng.integers(1, 11))
+            duration = int(rng.integers(3, 25)) * 5
+            fatigue = int(min(75, max(1, round(intensity ** 1.5 * duration / 40 * rng.uniform(.6, 1.4)))))
+            fitness = round(.2 + fatigue * .075 * rng.uniform(.8, 1.2), 1)
+            week_blocks = week_blocks_choices[int(rng.integers(len(week_blocks_choices)))]
+            writer.writerow([sport, "{} workout {}".format(sport, idx), intensity, duration, fatigue, fitness, week_blocks])
+    return path
+
+
+def synthetic_library(directory, number_of_workouts, library_format="csv", seed=default_seed):
+    csv_path = os.path.join(directory, "library_{}_{}.csv".format(number_of_workouts, seed))
+    if not os.path.exists(csv_path):
+        write_synthetic_library(csv_path, number_of_workouts, seed)
+    if library_format == "csv":
+        return csv_path
+    binary_path = os.path.join(directory, "library_{}_{}{}".format(number_of_workouts, seed, binary_library.binary_suffix))
+    if not os.path.exists(binary_path):
+        binary_library.compile_library([csv_path], binary_path)
+    return binary_path
+
+
+def synthetic_config(number_of_weeks, weekly_hours=default_weekly_hours):
+    start_date = datetime.date(2025, 1, 6) # a monday
+    return {
+        "start_date": start_date,
+        "race_date": start_date + datetime.timedelta(weeks=number_of_weeks),
+        "current_fitness": 50,
+        "max_weekly_training": weekly_hours,
+        "max_block_weeks": 4
+    }
+
+
+# timing
+
+class TimedBackend:
+    # wraps a solver backend and records when each solver call started and finished
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+        self.takes_start = backend.takes_start
+        self.calls = []
+
+    def timed(self, solve, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return solve(*args, **kwargs)
+        finally:
+            self.calls.append((started, time.perf_counter()))
+
+    def solve_model(self, model):
+        return self.timed(self.backend.solve_model, model)
+
+    def solve_arrays(self, *args, **kwargs):
+        return self.timed(self.backend.solve_arrays, *args, **kwargs)
+
+
+class WeekTimings:
+
+    def __init__(self):
+        self.build_seconds = 0.0
+        self.solve_seconds = 0.0
+        self.extract_seconds = 0.0
+        self.other_seconds = 0.0 # between solver calls, for engines that call the solver more than once
+        self.solver_calls = 0
+        self.weeks = 0
+
+    def add(self, started, finished, calls, weeks=1):
+        self.weeks += weeks
+        self.solver_calls += len(calls)
+        if not calls:
+            self.other_seconds += finished - started
+            return
+        build = calls[0][0] - started
+        solve = sum(end - start for start, end in calls)
+        extract = finished - calls[-1][1]
+        self.build_seconds += build
+        self.solve_seconds += solve
+        self.extract_seconds += extract
+        self.other_seconds += (finished - started) - build - solve - extract
+
+    def as_dict(self):
+        return {
+            "build_seconds": self.build_seconds,
+            "solve_seconds": self.solve_seconds,
+            "extract_seconds": self.extract_seconds,
+            "other_seconds": self.other_seconds,
+            "solver_calls": self.solver_calls,
+            "weeks_solved": self.weeks
+        }
+
+
+def peak_rss_kib():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak # bytes on macos, KiB elsewhere
+
+
+def run_case(case, library_path, trace_memory=False):
+    # plans one synthetic season and returns the case dict with its measurements. runs in its own
+    # process.
+    if trace_memory:
+        tracemalloc.start()
+    result = dict(case)
+    started = time.perf_counter()
+    try:
+        workout_library.use_library(library_path)
+        workout_library.fetch_workouts_with_cache()
+        result["library_load_seconds"] = time.perf_counter() - started
+
+        config = synthetic_config(case["weeks"])
+        periodization_started = time.perf_counter()
+        week_plan = periodization.create_linear_periodization_plan(config, method=case["periodization"], solver=case["solver"])
+        result["periodization_seconds"] = time.perf_counter() - periodization_started
+
+        backend = TimedBackend(solvers.get_backend(case["solver"], time_limit=case["time_limit"]))
+        timings = WeekTimings()
+        incoming_fatigue = { "bike": 30, "run": 30, "swim": 30 }
+        incoming_fitness = { "bike": config["current_fitness"], "run": config["current_fitness"], "swim": config["current_fitness"] }
+
+        planning_started = time.perf_counter()
+        if case["engine"] == "speculative":
+            from . import speculative
+            speculation = speculative.add_workouts_to_weeks_speculative(week_plan, incoming_fatigue, incoming_fitness, config["max_weekly_training"], case["workers"], case["solver"])
+            timings.solve_seconds = speculation.solve_seconds
+            timings.solver_calls = speculation.solves
+            timings.weeks = len(week_plan)
+            result["rounds"] = speculation.rounds
+            result["critical_path_seconds"] = speculation.critical_path_seconds
+        elif case["engine"] == "rolling":
+            from . import rolling_horizon
+            windows = rolling_horizon.iter_windows(week_plan, incoming_fatigue, incoming_fitness, config["max_weekly_training"], case["horizon"], solver=backend)
+            committed = 0
+            while True:
+                # a ready made backend keeps its time limit, so scale it to the next window here, as
+                # iter_windows does for the backends it creates
+                backend.backend.time_limit = case["time_limit"] * min(case["horizon"], len(week_plan) - committed)
+                backend.calls = []
+                window_started = time.perf_counter()
+                weeks = next(windows, None)
+                if weeks is None:
+                    break
+                timings.add(window_started, time.perf_counter(), backend.calls, len(weeks))
+                committed += len(weeks)
+        else:
+            engine = weekly_engines()[case["engine"]]
+
+            def timed_add_workouts_to_week_plan(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max):
+                backend.calls = []
+                week_started = time.perf_counter()
+                engine(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max, solver=backend)
+                timings.add(week_started, time.perf_counter(), backend.calls)
+                return week
+
+            workout_planner.add_workouts_to_weeks(week_plan, incoming_fatigue, incoming_fitness, config["max_weekly_training"], timed_add_workouts_to_week_plan)
+        result["planning_seconds"] = time.perf_counter() - planning_started
+
+        result.update(timings.as_dict())
+        result["final_fitness"] = week_plan[-1]["fitness_outcome"] if week_plan else None
+        result["final_fitness_total"] = sum(week_plan[-1]["fitness_outcome"].values()) if week_plan else None
+        # engines are checked against constraints 1-5 without a solver
+        check = plan_check.PlanCheck(week_plan, config["max_weekly_training"])
+        result["violations"] = len(check.evaluate_week_plans([week_plan], incoming_fatigue, incoming_fitness).violations(0))
+        result["error"] = None
+    except Exception as error:
+        result["error"] = "{}: {}".format(type(error).__name__, error)
+    result["total_seconds"] = time.perf_counter() - started
+    result["peak_rss_kib"] = peak_rss_kib()
+    if trace_memory:
+        result["traced_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def run_benchmark(sizes=default_sizes, weeks=default_weeks, engines=("matrix",), solver=None, library_format="csv",
+                  periodization_method="table", time_limit=10, seed=default_seed, trace_memory=False, directory=None, progress=None,
+                  horizons=default_horizons, workers=default_workers):
+    solver = solver or solvers.default_backend_name()
+    cases = [
+        {
+            "library_size": size,
+            "library_format": library_format,
+            "weeks": number_of_weeks,
+            "engine": engine,
+            "horizon": horizon,
+            "workers": number_of_workers,
+            "solver": solver,
+            "periodization": periodization_method,
+            "time_limit": time_limit,
+            "seed": seed
+        }
+        for size in sizes for number_of_weeks in weeks for engine in engines
+        for horizon in (horizons if engine == "rolling" else [None])
+        for number_of_workers in ((workers or [os.cpu_count() or 1]) if engine == "speculative" else [None])
+    ]
+
+    results = []
+    with contextlib.ExitStack() as stack:
+        if directory is None:
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+        for case in cases:
+            library_path = synthetic_library(directory, case["library_size"], library_format, seed)
+            # a fresh spawned process per case, so peak memory and caches start from nothing
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                result = executor.submit(run_case, case, library_path, trace_memory).result()
+            results.append(result)
+            if progress is not None:
+                progress(result)
+
+    return {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "solver": solver
+        },
+        "cases": results
+    }
+
+
+# regressions
+
+compared_metrics = ["library_load_seconds", "periodization_seconds", "build_seconds", "solve_seconds", "extract_seconds", "total_seconds", "peak_rss_kib"]
+case_key_fields = ["library_size", "library_format", "weeks", "engine", "horizon", "workers", "solver", "periodization"]
+
+def case_key(case):
+    return tuple(case.get(field) for field in case_key_fields)
+
+
+def find_regressions(baseline, current, threshold=default_threshold, min_seconds=default_min_seconds):
+    # metrics of matching cases that got worse by more than threshold (relative). timings must also
+    # have grown by min_seconds.
+    baseline_cases = {case_key(case): case for case in baseline["cases"]}
+    regressions = []
+    for case in current["cases"]:
+        before = baseline_cases.get(case_key(case))
+        if before is None:
+            continue
+        for metric in compared_metrics:
+            old, new = before.get(metric), case.get(metric)
+            if old is None or new is None:
+                continue
+            if metric.endswith("_seconds") and new - old < min_seconds:
+                continue
+            if new > old * (1 + threshold):
+                regressions.append({
+                    "case": dict(zip(case_key_fields, case_key(case))),
+                    "metric": metric,
+                    "baseline": old,
+                    "current": new,
+                    "ratio": new / old if old else float("inf")
+                })
+    return regressions
+
+
+def compare_with_sequential(results):
+    # every rolling and speculative case next to the sequential matrix case of the same library and
+    # season: planning and solve time, solver calls and total fitness at the end of the season
+    sequential = {
+        (case["library_size"], case["library_format"], case["weeks"], case["solver"], case["periodization"]): case
+        for case in results["cases"] if case["engine"] == sequential_engine and not case.get("error")
+    }
+    comparisons = []
+    for case in results["cases"]:
+        if case["engine"] not in ("rolling", "speculative") or case.get("error"):
+            continue
+        before = sequential.get((case["library_size"], case["library_format"], case["weeks"], case["solver"], case["periodization"]))
+        if before is None:
+            continue
+        comparisons.append({
+            "case": dict(zip(case_key_fields, case_key(case))),
+            "planning_seconds": case["planning_seconds"],
+            "sequential_planning_seconds": before["planning_seconds"],
+            "critical_path_seconds": case.get("critical_path_seconds"),
+            "solve_seconds": case["solve_seconds"],
+            "sequential_solve_seconds": before["solve_seconds"],
+            "solver_calls": case["solver_calls"],
+            "sequential_solver_calls": before["solver_calls"],
+            "final_fitness_total": case["final_fitness_total"],
+            "sequential_final_fitness_total": before["final_fitness_total"],
+            "fitness_gain": case["final_fitness_total"] - before["final_fitness_total"]
+        })
+    return comparisons
+
+
+def engine_label(case):
+    # the engine with its horizon or workers
+    if case.get("horizon") is not None:
+        return "{}/{}".format(case["engine"], case["horizon"])
+    if case.get("workers") is not None:
+        return "{}/{}".format(case["engine"], case["workers"])
+    return case["engine"]
+
+
+def format_result(result):
+    engine = engine_label(result)
+    if result.get("error"):
+        return "{library_size:>6} workouts {weeks:>3} weeks {engine:<10} error: {error}".format(**dict(result, engine=engine))
+    return "{library_size:>6} workouts {weeks:>3} weeks {engine:<10} build {build_seconds:8.3f}s  solve {solve_seconds:8.3f}s  extract {extract_seconds:8.3f}s  total {total_seconds:8.3f}s  fitness {final_fitness_total:8.2f}  peak {peak_rss_kib:>8} KiB".format(**dict(result, engine=engine))
+
+
+def format_comparison(comparison):
+    critical_path = "" if comparison["critical_path_seconds"] is None else "  critical path {:.3f}s".format(comparison["critical_path_seconds"])
+    return "{library_size:>6} workouts {weeks:>3} weeks {engine} vs {sequential}: planning {planning:.3f}s vs {sequential_planning:.3f}s{critical_path}  solve {solve:.3f}s vs {sequential_solve:.3f}s ({calls} vs {sequential_calls} calls)  fitness {fitness:.2f} vs {sequential_fitness:.2f} ({gain:+.2f})".format(
+        engine=engine_label(comparison["case"]), sequential=sequential_engine, critical_path=critical_path,
+        planning=comparison["planning_seconds"], sequential_planning=comparison["sequential_planning_seconds"],
+        solve=comparison["solve_seconds"], sequential_solve=comparison["sequential_solve_seconds"],
+        calls=comparison["solver_calls"], sequential_calls=comparison["sequential_solver_calls"],
+        fitness=comparison["final_fitness_total"], sequential_fitness=comparison["sequential_final_fitness_total"], gain=comparison["fitness_gain"],
+        **{key: value for key, value in comparison["case"].items() if key != "engine"}
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark the planning pipeline on synthetic workout libraries")
+    parser.add_argument("--sizes", type=int, nargs="+", default=default_sizes, help="workouts per synthetic library")
+    parser.add_argument("--weeks", type=int, nargs="+", default=default_weeks, help="season lengths in weeks")
+    parser.add_argument("--engines", nargs="+", default=["matrix"], choices=sorted(weekly_engines()) + ["rolling", "speculative"])
+    parser.add_argument("--horizons", type=int, nargs="+", default=default_horizons, help="weeks per window of the rolling engine")
+    parser.add_argument("--workers", type=int, nargs="+", default=default_workers, help="processes of the speculative engine (default: one per cpu)")
+    parser.add_argument("--solver", choices=sorted(solvers.backends), default=None)
+    parser.add_argument("--library-format", choices=["csv", "binary"], default="csv")
+    parser.add_argument("--periodization", choices=["table", "milp"], default="table")
+    parser.add_argument("--time-limit", type=float, default=10, help="solver time limit per week in seconds")
+    parser.add_argument("--seed", type=int, default=default_seed)
+    parser.add_argument("--trace-memory", action="store_true", help="also record the peak of python allocations (slows the run)")
+    parser.add_argument("-o", "--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=default_threshold)
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(
+        args.sizes, args.weeks, args.engines, args.solver, args.library_format, args.periodization,
+        args.time_limit, args.seed, args.trace_memory, progress=lambda result: print(format_result(result), file=sys.stderr),
+        horizons=args.horizons, workers=args.workers
+    )
+    results["comparisons"] = compare_with_sequential(results)
+    for comparison in results["comparisons"]:
+        print(format_comparison(comparison), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "wt") as file:
+            json.dump(results, file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, "rt") as file:
+            baseline = json.load(file)
+        regressions = find_regressions(baseline, results, args.threshold)
+        for regression in regressions:
+            print("regression: {case} {metric} {baseline:.4g} -> {current:.4g} ({ratio:.2f}x)".format(**regression), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
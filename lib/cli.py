@@ -0,0 +1,257 @@
+import argparse
+import csv
+import functools
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+# command line entry point: python -m lib.cli <command>
+#
+#   plan CONFIG          config -> plan -> CSV (or JSON lines), streamed week by week; --budget SECONDS
+#                        plans within one deadline, see solve_budget; --engine rolling solves --horizon
+#                        weeks in one model, see rolling_horizon; --engine speculative solves weeks
+#                        on --workers processes from guessed incoming states, see speculative
+#   periodize CONFIG     the periodized weeks only, no weekly solves
+#   library              workouts in the library, by strategy and sport
+#   worker               pre-warmed worker: loads the library and the solver once, then plans every
+#                        JSON request read from stdin, answering with one JSON line each
+#   check-imports        imports the modules of the pure data paths in fresh interpreters and checks
+#                        each stays within an import time budget without loading pyomo, scipy or highspy
+#
+# CONFIG is a JSON file ("-" for stdin) holding the notebook's config dict with dates as ISO strings,
+# or {"config": ..., "initial_fatigue": ..., "initial_fitness": ...}. only the plan and worker
+# commands import the solver stack, and only once a week is solved.
+
+engines = {
+    "matrix": ("workout_planner", "add_workouts_to_week_plan_matrix"),
+    "rule": ("workout_planner", "add_workouts_to_week_plan"),
+    "search": ("week_search", "add_workouts_to_week_plan_search"),
+    "presolve": ("presolve", "add_workouts_to_week_plan_presolved")
+}
+
+output_formats = ["csv", "jsonl"]
+
+default_import_budget = .25 # seconds per module, interpreter start up not included
+heavy_modules = ("pyomo", "scipy", "highspy")
+light_modules = ["cli", "workouts.workouts", "periodization", "plan_output", "telemetry", "batch", "week_matrix", "solvers", "workout_planner", "week_planner", "plan_check"]
+
+
+def package_module(name):
+    return importlib.import_module("." + name, __package__)
+
+
+def read_config(path):
+    batch = package_module("batch")
+    if path == "-":
+        return batch.config_from_json(json.load(sys.stdin))
+    with open(path) as file:
+        return batch.config_from_json(json.load(file))
+
+
+def get_engine(engine, solver=None):
+    # the weekly engine, imported on first use
+    if engine == "persistent":
+        planner = package_module("week_planner").WeekPlanner()
+        return planner.add_workouts_to_week_plan
+    module, name = engines[engine]
+    add_workouts_to_week_plan = getattr(package_module(module), name)
+    if solver is None:
+        return add_workouts_to_week_plan
+    return functools.partial(add_workouts_to_week_plan, solver=solver)
+
+
+def plan_writer(output, output_format):
+    plan_output = package_module("plan_output")
+    writer_class = plan_output.CsvPlanWriter if output_format == "csv" else plan_output.JsonlPlanWriter
+    if output in (None, "-"):
+        return writer_class(sys.stdout)
+    return writer_class(output)
+
+
+def write_plan(config, add_workouts_to_week_plan, output, output_format, plan=None):
+    batch = package_module("batch")
+    with plan_writer(output, output_format) as writer:
+        return writer.write_weeks(batch.stream_training_plan(config, add_workouts_to_week_plan), plan)
+
+
+def write_plan_rolling(config, horizon, commit_weeks, solver, output, output_format):
+    rolling_horizon = package_module("rolling_horizon")
+    with plan_writer(output, output_format) as writer:
+        return writer.write_weeks(rolling_horizon.stream_training_plan_rolling(config, horizon, commit_weeks, solver))
+
+
+def write_plan_speculative(config, workers, solver, output, output_format):
+    speculative = package_module("speculative")
+    with plan_writer(output, output_format) as writer:
+        return writer.write_weeks(speculative.create_training_plan_speculative(config, workers, solver).week_plan)
+
+
+def command_plan(args):
+    config = read_config(args.config)
+    if args.engine == "rolling" and args.budget is None:
+        write_plan_rolling(config, args.horizon, args.commit_weeks, args.solver, args.output, args.format)
+        return 0
+    if args.engine == "speculative" and args.budget is None:
+        write_plan_speculative(config, args.workers, args.solver, args.output, args.format)
+        return 0
+    if args.budget is not None:
+        # the matrix engine within one deadline for the whole plan
+        week_plan = package_module("periodization").create_linear_periodization_plan(config)
+        solve_budget = package_module("solve_budget")
+        mip_gap = args.mip_gap if args.mip_gap is not None else solve_budget.default_mip_gap
+        add_workouts_to_week_plan = solve_budget.SolveBudget(args.budget, week_plan, mip_gap, args.solver).add_workouts_to_week_plan
+    else:
+        add_workouts_to_week_plan = get_engine(args.engine, args.solver)
+    write_plan(config, add_workouts_to_week_plan, args.output, args.format)
+    return 0
+
+
+def command_periodize(args):
+    config = read_config(args.config)
+    week_plan = package_module("periodization").create_linear_periodization_plan(config, method=args.method)
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["week", "start_date", "end_date", "strategy", "start_block"])
+    for week_number, week in enumerate(week_plan):
+        writer.writerow([week_number, week["start_date"], week["end_date"], week["strategy"], week["start_block"]])
+    return 0
+
+
+def command_library(args):
+    workout_library = package_module("workouts.workouts")
+    if args.library:
+        workout_library.use_library(*args.library)
+    if args.list:
+        if args.sport:
+            workouts = workout_library.default_catalog.workouts_for_sport(args.sport, args.strategy)
+        elif args.strategy:
+            workouts = workout_library.GetWorkoutsForWeek(args.strategy)
+        else:
+            workouts = workout_library.fetch_workouts_with_cache()
+        writer = csv.writer(sys.stdout)
+        writer.writerow(["sport", "workout_name", "intensity", "duration", "fatigue_increase", "fitness_increase", "week_blocks"])
+        for workout in workouts:
+            writer.writerow([workout[key] for key in ("sport", "workout_name", "intensity", "duration", "fatigue_increase", "fitness_increase", "week_blocks")])
+        return 0
+
+    strategies = [args.strategy] if args.strategy else [None] + workout_library.week_strategies
+    print("{:<8} {:>7} {}".format("strategy", "total", " ".join("{:>6}".format(sport) for sport in workout_library.sports)))
+    for strategy in strategies:
+        counts = [len(workout_library.default_catalog.workouts_for_sport(sport, strategy)) for sport in workout_library.sports]
+        print("{:<8} {:>7} {}".format(strategy or "all", sum(counts), " ".join("{:>6}".format(count) for count in counts)))
+    return 0
+
+
+def warm_up(engine, solver=None):
+    # everything a first plan would otherwise pay for: the library, the engine's imports, the
+    # coefficient matrices of every strategy and one solve to load the solver
+    workout_library = package_module("workouts.workouts")
+    workout_library.fetch_workouts_with_cache()
+    add_workouts_to_week_plan = get_engine(engine, solver)
+    if engine != "rule":
+        workout_planner = package_module("workout_planner")
+        for strategy in workout_library.week_strategies:
+            workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(strategy))
+        import numpy as np
+        import scipy.sparse as sp
+        package_module("solvers").get_backend(solver).solve_arrays(np.ones(1), sp.csr_matrix(np.ones((1, 1))), np.ones(1))
+    return add_workouts_to_week_plan
+
+
+def command_worker(args):
+    started = time.perf_counter()
+    add_workouts_to_week_plan = warm_up(args.engine, args.solver)
+    print(json.dumps({"ready": True, "warm_up_seconds": time.perf_counter() - started}), flush=True)
+
+    # one JSON request per line: {"config": ..., "output": path, "format": "csv"}
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        started = time.perf_counter()
+        try:
+            request = json.loads(line)
+            config = package_module("batch").config_from_json(request)
+            weeks = write_plan(config, add_workouts_to_week_plan, request["output"], request.get("format", "csv"), request.get("plan"))
+            response = {"output": request["output"], "weeks": weeks, "seconds": time.perf_counter() - started}
+        except Exception as error:
+            response = {"error": repr(error)}
+        print(json.dumps(response), flush=True)
+    return 0
+
+
+def measure_import(module):
+    # import time of module in a fresh interpreter, and which heavy modules it loaded
+    code = (
+        "import importlib, json, sys, time\n"
+        "started = time.perf_counter()\n"
+        "importlib.import_module({!r})\n"
+        "print(json.dumps({{'seconds': time.perf_counter() - started, 'loaded': [name for name in {!r} if name in sys.modules]}}))\n"
+    ).format(module, heavy_modules)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def command_check_imports(args):
+    failures = 0
+    for name in light_modules:
+        module = "{}.{}".format(__package__, name)
+        measured = measure_import(module)
+        ok = measured["seconds"] <= args.budget and not measured["loaded"]
+        failures += not ok
+        print("{:<28} {:>8.3f}s {:<5} {}".format(module, measured["seconds"], "ok" if ok else "FAIL", " ".join(measured["loaded"])))
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m lib.cli", description="triathlon training plans")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    plan = commands.add_parser("plan", help="plan a season and write it out")
+    plan.add_argument("config", help="config JSON file, - for stdin")
+    plan.add_argument("-o", "--output", default=None, help="output file, appended to (default: stdout)")
+    plan.add_argument("--format", choices=output_formats, default="csv")
+    plan.add_argument("--engine", choices=sorted(engines) + ["persistent", "rolling", "speculative"], default="matrix")
+    plan.add_argument("--solver", choices=["glpk", "highs"], default=None)
+    plan.add_argument("--horizon", type=int, default=3, help="weeks solved together with --engine rolling")
+    plan.add_argument("--commit-weeks", type=int, default=1, help="weeks kept from each window with --engine rolling")
+    plan.add_argument("--workers", type=int, default=None, help="processes with --engine speculative (default: one per cpu)")
+    plan.add_argument("--budget", type=float, default=None, help="seconds for the whole plan, spread over its weeks (replaces --engine)")
+    plan.add_argument("--mip-gap", type=float, default=None, help="relative MIP gap weeks stop at with --budget")
+    plan.set_defaults(run=command_plan)
+
+    periodize = commands.add_parser("periodize", help="periodize a season without planning workouts")
+    periodize.add_argument("config", help="config JSON file, - for stdin")
+    periodize.add_argument("--method", choices=["table", "milp"], default="table")
+    periodize.set_defaults(run=command_periodize)
+
+    library = commands.add_parser("library", help="inspect the workout library")
+    library.add_argument("--library", nargs="+", default=None, help="library files (default: the configured library)")
+    library.add_argument("--strategy", default=None)
+    library.add_argument("--sport", default=None)
+    library.add_argument("--list", action="store_true", help="list workouts instead of counting them")
+    library.set_defaults(run=command_library)
+
+    worker = commands.add_parser("worker", help="plan JSON requests from stdin with a pre-warmed solver")
+    worker.add_argument("--engine", choices=sorted(engines) + ["persistent"], default="matrix")
+    worker.add_argument("--solver", choices=["glpk", "highs"], default=None)
+    worker.set_defaults(run=command_worker)
+
+    check_imports = commands.add_parser("check-imports", help="check import time budgets of the pure data paths")
+    check_imports.add_argument("--budget", type=float, default=default_import_budget, help="seconds per module")
+    check_imports.set_defaults(run=command_check_imports)
+
+    args = parser.parse_args(argv)
+    try:
+        return args.run(args)
+    except BrokenPipeError:
+        # output piped into something that stopped reading, like head
+        sys.stdout = None
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
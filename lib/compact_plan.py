@@ -0,0 +1,229 @@
+import datetime
+import struct
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from .workouts import workouts as workout_library
+from . import plan_output
+from .week_matrix import sports, number_of_days
+
+
+# compact form of a planned season.
+#
+# a week plan is a list of week dicts holding workout dicts, outcome dicts and dates. a CompactPlan
+# holds the same plan in a few arrays:
+#
+#   slots      int32 (weeks, days, 2)          catalog index of the workouts of each day, -1 when empty
+#   outcomes   float64 (weeks, 2, sports)      fitness_outcome and fatigue_outcome, in sports order
+#   dates      int32 (weeks, 2)                start_date and end_date as date ordinals
+#   strategy   uint8 (weeks)                   index into strategies
+#   start_block bool (weeks)
+#
+# plus a reference to the catalog tuple the workout indexes point into (fetch_workouts_with_cache()
+# by default). workout dicts, dates and csv rows are only built when asked for. plan[week_number] is a
+# read only dict-style view of one week with the keys of a planned week dict, so code reading week
+# plans works on either. only the schedule and the outcomes are kept, not telemetry or relaxation.
+#
+# pickling and to_bytes leave the catalog out and keep its fingerprint instead. the catalog is
+# attached again when the plan is loaded, in pool workers and the parent alike, and a plan loaded
+# against a different library is refused.
+
+slots_per_day = 2 # constraint 1: no more than 2 workouts per day
+
+magic = b"TRIPLN01"
+header_format = "<8sQQ64s" # magic, weeks, strategy table size, catalog fingerprint
+header_size = struct.calcsize(header_format)
+
+outcome_keys = ("fitness_outcome", "fatigue_outcome")
+
+# key order of the planners' outcome dicts, so written plans come out the same
+outcome_key_order = {
+    "fitness_outcome": ("run", "bike", "swim"),
+    "fatigue_outcome": ("swim", "bike", "run")
+}
+
+
+class CatalogIndex:
+    # catalog indexes of workout dicts: the same objects where possible, equal fields otherwise
+    # (plans sent between processes carry copies)
+
+    key_fields = ("sport", "workout_name", "duration", "fatigue_increase", "fitness_increase", "week_blocks")
+
+    def __init__(self, workouts):
+        self.by_identity = {id(workout): workout_id for workout_id, workout in enumerate(workouts)}
+        self.by_value = {}
+        for workout_id, workout in enumerate(workouts):
+            self.by_value.setdefault(self.key(workout), workout_id)
+
+    def key(self, workout):
+        return tuple(workout[field] for field in self.key_fields)
+
+    def ids(self, workouts):
+        return [self.by_identity[id(workout)] if id(workout) in self.by_identity else self.by_value[self.key(workout)] for workout in workouts]
+
+
+def default_workouts():
+    return workout_library.fetch_workouts_with_cache()
+
+
+class CompactWeek(Mapping):
+    # one week of a CompactPlan as a read only week dict
+
+    __slots__ = ("plan", "week_number")
+
+    keys_of_week = ("start_date", "end_date", "strategy", "start_block", "workouts", "fitness_outcome", "fatigue_outcome")
+
+    def __init__(self, plan, week_number):
+        self.plan = plan
+        self.week_number = week_number
+
+    def __getitem__(self, key):
+        return self.plan.week_field(self.week_number, key)
+
+    def __iter__(self):
+        return iter(self.keys_of_week)
+
+    def __len__(self):
+        return len(self.keys_of_week)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class CompactPlan(Sequence):
+
+    def __init__(self, slots, outcomes, dates, strategy, start_block, strategies=None, workouts=None):
+        self.slots = np.asarray(slots, dtype=np.int32)
+        self.outcomes = np.asarray(outcomes, dtype=np.float64)
+        self.dates = np.asarray(dates, dtype=np.int32)
+        self.strategy = np.asarray(strategy, dtype=np.uint8)
+        self.start_block = np.asarray(start_block, dtype=bool)
+        self.strategies = list(strategies if strategies is not None else workout_library.week_strategies)
+        self.workouts = workouts if workouts is not None else default_workouts()
+
+    @classmethod
+    def from_week_plan(cls, week_plan, workouts=None, catalog_index=None):
+        # catalog_index (a CatalogIndex of workouts) saves rebuilding it for every plan of a batch
+        workouts = workouts if workouts is not None else default_workouts()
+        catalog_index = catalog_index if catalog_index is not None else CatalogIndex(workouts)
+        number_of_weeks = len(week_plan)
+
+        slots = np.full((number_of_weeks, number_of_days, slots_per_day), -1, dtype=np.int32)
+        outcomes = np.empty((number_of_weeks, len(outcome_keys), len(sports)), dtype=np.float64)
+        dates = np.empty((number_of_weeks, 2), dtype=np.int32)
+        strategies = list(workout_library.week_strategies)
+        strategy = np.empty(number_of_weeks, dtype=np.uint8)
+        start_block = np.empty(number_of_weeks, dtype=bool)
+
+        for week_number, week in enumerate(week_plan):
+            for day, day_workouts in enumerate(week["workouts"]):
+                if len(day_workouts) > slots_per_day:
+                    raise ValueError("week {} day {} has {} workouts, at most {} fit".format(week_number, day, len(day_workouts), slots_per_day))
+                slots[week_number, day, :len(day_workouts)] = catalog_index.ids(day_workouts)
+            for outcome_idx, outcome in enumerate(outcome_keys):
+                outcomes[week_number, outcome_idx] = [week[outcome][sport] for sport in sports]
+            dates[week_number] = (week["start_date"].toordinal(), week["end_date"].toordinal())
+            if week["strategy"] not in strategies:
+                strategies.append(week["strategy"])
+            strategy[week_number] = strategies.index(week["strategy"])
+            start_block[week_number] = week["start_block"]
+
+        return cls(slots, outcomes, dates, strategy, start_block, strategies, workouts)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __getitem__(self, week_number):
+        if isinstance(week_number, slice):
+            return [self[idx] for idx in range(*week_number.indices(len(self)))]
+        if week_number < 0:
+            week_number += len(self)
+        if not 0 <= week_number < len(self):
+            raise IndexError("week {} out of range".format(week_number))
+        return CompactWeek(self, week_number)
+
+    # lazy fields
+
+    def week_field(self, week_number, key):
+        if key == "start_date":
+            return datetime.date.fromordinal(int(self.dates[week_number, 0]))
+        if key == "end_date":
+            return datetime.date.fromordinal(int(self.dates[week_number, 1]))
+        if key == "strategy":
+            return self.strategies[self.strategy[week_number]]
+        if key == "start_block":
+            return bool(self.start_block[week_number])
+        if key == "workouts":
+            return self.week_workouts(week_number)
+        if key in outcome_keys:
+            values = dict(zip(sports, self.outcomes[week_number, outcome_keys.index(key)].tolist()))
+            return {sport: values[sport] for sport in outcome_key_order[key]}
+        raise KeyError(key)
+
+    def week_workouts(self, week_number):
+        return [[self.workouts[workout_id] for workout_id in day_slots if workout_id >= 0] for day_slots in self.slots[week_number].tolist()]
+
+    def selections(self):
+        # (week, day, workout) rows, as plan_check.PlanCheck.evaluate takes them
+        weeks, days, slot = np.nonzero(self.slots >= 0)
+        return np.column_stack([weeks, days, self.slots[weeks, days, slot]]).astype(np.int64)
+
+    def to_week_plan(self):
+        # plain week dicts
+        return [dict(week) for week in self]
+
+    # serialization
+
+    def fingerprint(self):
+        return workout_library.library_fingerprint(self.workouts)
+
+    def to_bytes(self):
+        strategy_table = "\n".join(self.strategies).encode("utf-8")
+        header = struct.pack(header_format, magic, len(self), len(strategy_table), self.fingerprint().encode("ascii"))
+        return b"".join([
+            header, strategy_table,
+            self.slots.astype("<i4").tobytes(), self.outcomes.astype("<f8").tobytes(), self.dates.astype("<i4").tobytes(),
+            self.strategy.tobytes(), self.start_block.astype(np.uint8).tobytes()
+        ])
+
+    @classmethod
+    def from_bytes(cls, data, workouts=None):
+        data = memoryview(data)
+        file_magic, number_of_weeks, strategy_table_size, fingerprint = struct.unpack_from(header_format, data, 0)
+        if file_magic != magic:
+            raise ValueError("not a compact plan")
+        workouts = workouts if workouts is not None else default_workouts()
+        if workout_library.library_fingerprint(workouts) != fingerprint.decode("ascii"):
+            raise ValueError("compact plan was made with a different workout library")
+
+        offset = header_size
+        strategies = bytes(data[offset:offset + strategy_table_size]).decode("utf-8").split("\n")
+        offset += strategy_table_size
+
+        def section(dtype, shape):
+            nonlocal offset
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            array = np.frombuffer(data[offset:offset + size], dtype=dtype).reshape(shape)
+            offset += size
+            return array
+
+        slots = section("<i4", (number_of_weeks, number_of_days, slots_per_day))
+        outcomes = section("<f8", (number_of_weeks, len(outcome_keys), len(sports)))
+        dates = section("<i4", (number_of_weeks, 2))
+        strategy = section(np.uint8, (number_of_weeks,))
+        start_block = section(np.uint8, (number_of_weeks,)).astype(bool)
+        return cls(slots, outcomes, dates, strategy, start_block, strategies, workouts)
+
+    def __reduce__(self):
+        # the catalog stays behind, see from_bytes
+        return (self.__class__.from_bytes, (self.to_bytes(),))
+
+
+def compact_rows(plan, plan_number=None):
+    # csv rows of a whole plan with the plan and week number in front, as CsvPlanWriter writes them
+    for week_number in range(len(plan)):
+        week = plan[week_number]
+        prefix = [plan_number, week_number, week["strategy"]]
+        for row in plan_output.week_rows(week):
+            yield prefix + row
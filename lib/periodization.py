@@ -0,0 +1,219 @@
+import datetime
+import functools
+
+from . import solvers
+from . import telemetry
+
+
+available_week_types = {
+    0: "rest",
+    1: "peak",
+    2: "base",
+    3: "build"
+}
+
+
+# a season is periodized by assigning every week a type and deciding which weeks start a block.
+# the assignment only depends on the number of weeks and max_block_weeks, so it is solved exactly by
+# dynamic programming once per pair of inputs and looked up from then on. the original MILP is kept
+# as assign_strategy_to_weeks_milp to cross-check the table against.
+
+base_weeks_before_build = 12 # weeks up to this index must not be build weeks
+peak_weeks = 2 # the last weeks must be rest or peak weeks
+
+
+def create_linear_periodization_plan(config, method="table", solver=None):
+    #TODO: validate incoming config (start date should be before race date, fitness should be in range, etc)
+
+    available_weeks = []
+    date_counter = config["start_date"] - datetime.timedelta(days=config["start_date"].weekday()) # weeks always start on monday
+    while date_counter < config["race_date"]:
+        next_week = date_counter + datetime.timedelta(days=7)
+        available_weeks.append({ "start_date": date_counter, "end_date": next_week }) # note: next week is the first day of the next week
+        date_counter = next_week
+
+    weeks_periodized = assign_strategy_to_weeks(available_weeks,config,method,solver)
+    return weeks_periodized
+
+
+def assign_strategy_to_weeks(available_weeks, config, method="table", solver=None):
+    # method "table" looks the assignment up in the dynamic programming table, "milp" solves the
+    # reference model with the given solver backend
+    if method == "milp":
+        return assign_strategy_to_weeks_milp(available_weeks, config, solver)
+    if method != "table":
+        raise ValueError("unknown periodization method {}, expected table or milp".format(method))
+
+    solve_started = telemetry.clock()
+    assignment = periodization_table(len(available_weeks), config["max_block_weeks"])
+    solve_finished = telemetry.clock()
+    for week, (assigned_value, start_block) in zip(available_weeks, assignment):
+        week["strategy"] = available_week_types[assigned_value]
+        week["start_block"] = start_block
+
+    telemetry.report_periodization("table", len(available_weeks), config["max_block_weeks"], 0.0, solve_finished - solve_started, telemetry.clock() - solve_finished)
+    return available_weeks
+
+
+def max_assigned_value(week, number_of_weeks):
+    if week > number_of_weeks - 1 - peak_weeks:
+        return 1
+    if week <= base_weeks_before_build:
+        return 2
+    return 3
+
+
+def starts_conflict(last_start, start, number_of_weeks, max_block_weeks):
+    # two block starts conflict when one "at most one start in the last max_block_weeks - 1 weeks"
+    # window holds both. windows exist for weeks max_block_weeks + 1 .. number_of_weeks - 1.
+    return max(start + 1, max_block_weeks + 1) <= min(last_start + max_block_weeks - 1, number_of_weeks - 1)
+
+
+@functools.lru_cache(maxsize=None)
+def periodization_table(number_of_weeks, max_block_weeks):
+    # exact solution of the assign_strategy_to_weeks_milp model as a tuple of (assigned value, starts
+    # block) per week. state after a week is its assigned value and the weeks since the last block
+    # start: a block must start at least every max_block_weeks weeks, so that distance never grows
+    # past max_block_weeks, and only the last start can conflict with the next one.
+    if number_of_weeks == 0:
+        return ()
+    if max_block_weeks < 1:
+        raise ValueError("max_block_weeks must be at least 1")
+
+    values = range(len(available_week_types))
+
+    # best[(value, weeks since last start)] = (objective, tie break, backpointer). the tie break is a
+    # tuple of (no start, value) per week so far; among assignments of equal objective the larger one
+    # wins, which starts blocks as late as possible from the first week on: the longest first block,
+    # as the MILP returned through glpk.
+    best = {(value, 0): (value - 1, ((False, value),), None) for value in values if value <= max_assigned_value(0, number_of_weeks)}
+    history = [best]
+
+    for week in range(1, number_of_weeks):
+        upper = max_assigned_value(week, number_of_weeks)
+        candidates = {}
+        for (previous_value, since_start), (objective, tie_break, _) in sorted(best.items()):
+            for start in (False, True):
+                if start:
+                    # since_start counts from the previous week
+                    if starts_conflict(week - 1 - since_start, week, number_of_weeks, max_block_weeks):
+                        continue
+                    next_since_start = 0
+                else:
+                    next_since_start = since_start + 1
+                    # the next week's "a start in the last max_block_weeks weeks" window
+                    if week + 1 > max_block_weeks and week + 1 <= number_of_weeks - 1 and next_since_start >= max_block_weeks:
+                        continue
+                # raising the week type needs a block start, and by at most one step
+                for value in range(min(upper, previous_value + int(start)) + 1):
+                    state = (value, next_since_start)
+                    candidate = (objective + value - int(start), tie_break + ((not start, value),))
+                    if state not in candidates or candidate > candidates[state][:2]:
+                        candidates[state] = candidate + ((previous_value, since_start),)
+        if not candidates:
+            raise ValueError("no periodization of {} weeks with max_block_weeks {}".format(number_of_weeks, max_block_weeks))
+        best = candidates
+        history.append(best)
+
+    state = max(best, key=lambda state: best[state][:2])
+    assignment = []
+    for week in range(number_of_weeks - 1, -1, -1):
+        assignment.append((state[0], state[1] == 0))
+        state = history[week][state][2]
+    return tuple(reversed(assignment))
+
+
+def periodization_objective(weeks):
+    # objective of assign_strategy_to_weeks_milp for periodized weeks, to compare methods
+    week_type_values = {week_type: value for value, week_type in available_week_types.items()}
+    return sum(week_type_values[week["strategy"]] - int(week["start_block"]) for week in weeks)
+
+
+def assign_strategy_to_weeks_milp(available_weeks, config, solver=None):
+    build_started = telemetry.clock()
+    #TODO: validate weeks incoming
+    number_of_weeks = len(available_weeks)
+    max_block_weeks = config["max_block_weeks"]
+
+    #init pyomo model
+
+    import pyomo.environ as pyo # deferred, the table method does not need pyomo
+    model = pyo.ConcreteModel()
+    model.Weeks = pyo.RangeSet(0, number_of_weeks-1)
+
+    model.AssignedValues = pyo.Var(model.Weeks, domain=pyo.NonNegativeIntegers, bounds=(0, 3))
+    model.StartBlockWeeks = pyo.Var(model.Weeks, domain=pyo.Boolean)
+
+    # maximize base periods and build periods
+    model.obj = pyo.Objective(expr=sum(model.AssignedValues[n] for n in model.Weeks) - sum(model.StartBlockWeeks[n] for n in model.Weeks), sense=pyo.maximize)
+
+    # constraints
+
+    # last two weeks must not be assigned to base or build
+    def peak_period_constraint_rule(m, week):
+        if week > number_of_weeks - 3:
+            return m.AssignedValues[week]  <= 1
+        else:
+            return pyo.Constraint.Skip
+
+    model.peak_period_constraint = pyo.Constraint(model.Weeks, rule=peak_period_constraint_rule)
+
+    # must have 12 base weeks before build
+
+    def min_base_week_constraint_rule(m,week):
+        if week <= 12 :
+            return m.AssignedValues[week] <= 2
+        else:
+            return pyo.Constraint.Skip
+
+    model.rest_week_constraint = pyo.Constraint(model.Weeks, rule=min_base_week_constraint_rule)
+
+    # must start a block every time assigned[n] != assigned[n-1] - TODO: how to adjust this so it catches downward shifts as well?
+
+    def start_block_on_transition_rule(m,week):
+        if week == 0:
+            return m.StartBlockWeeks[week] >= 1
+        else:
+            return m.AssignedValues[week] - m.AssignedValues[week - 1] - m.StartBlockWeeks[week] <= 0
+
+    model.start_block_on_transition = pyo.Constraint(model.Weeks, rule=start_block_on_transition_rule)
+
+    # must start a transition block at least every {max_block_weeks} weeks
+
+    def start_block_periodically_rule(m,week):
+        if week > max_block_weeks:
+            week_window = range(week - max_block_weeks, week)
+            return sum(m.StartBlockWeeks[n] for n in week_window) >= 1
+        else:
+            return pyo.Constraint.Skip
+
+    model.start_block_periodically = pyo.Constraint(model.Weeks, rule=start_block_periodically_rule)
+
+    # must not start a transition block more than {max_block_weeks - 1} weeks
+
+    def start_block_periodically_rule_2(m,week):
+        if week > max_block_weeks:
+            week_window = range(week - (max_block_weeks - 1), week)
+            return sum(m.StartBlockWeeks[n] for n in week_window) <= 1
+        else:
+            return pyo.Constraint.Skip
+
+    model.start_block_periodically_2 = pyo.Constraint(model.Weeks, rule=start_block_periodically_rule_2)
+
+    # solve
+
+    backend = solvers.get_backend(solver, time_limit=5)
+    solve_started = telemetry.clock()
+    results = backend.solve_model(model)
+    solve_finished = telemetry.clock()
+
+    # add strategy and if it is the start of a block to each week
+    for idx, week in enumerate(available_weeks):
+        week["strategy"] = available_week_types[round(model.AssignedValues[idx].value)]
+        week["start_block"] = round(model.StartBlockWeeks[idx].value) == 1
+
+    telemetry.report_periodization(
+        "milp", number_of_weeks, max_block_weeks, solve_started - build_started, solve_finished - solve_started, telemetry.clock() - solve_finished,
+        results, telemetry.model_counts(model)
+    )
+    return available_weeks
@@ -0,0 +1,189 @@
+import numpy as np
+
+from .workouts import workouts as workout_library
+from . import batch
+from . import week_matrix
+from .compact_plan import CatalogIndex, CompactPlan
+from .week_matrix import sports, number_of_days
+
+
+# solver free evaluation of finished plans.
+#
+# a plan is given as an int array of selections, one row per selected workout: (week, day, workout),
+# or (plan, week, day, workout) for many plans of the same season at once. workout is an index into
+# the catalog (fetch_workouts_with_cache() by default). PlanCheck.evaluate computes, for every plan in
+# one pass of bincounts over the selections:
+#
+#   fitness   (plans, weeks, sports)  fitness outcome of every week, as week["fitness_outcome"]
+#   fatigue   (plans, weeks, sports)  fatigue outcome of every week, as week["fatigue_outcome"]
+#   excess    by constraint, how far each row of constraints 1-5 is above its limit (0 when met).
+#             names and shapes follow WeekMatrix.row_groups:
+#               max_workouts_per_day                    (plans, weeks, days)
+#               max_workouts_per_day_by_sport           (plans, weeks, days, sports)
+#               must_not_exceed_max_fatigue_by_sport    (plans, weeks, days, sports)
+#               must_not_exceed_max_total_fatigue       (plans, weeks, days)
+#               must_not_exceed_weekly_duration_limit   (plans, weeks)
+#               must_not_exceed_divergence_limit        (plans, weeks, divergence pairs)
+#               must_have_variability_in_workouts       (plans, weeks) pairs of the same workout too
+#                                                       close together
+#               workout_available                       (plans, weeks) workouts not in the week's
+#                                                       strategy
+#
+# every week starts from the evaluated outcomes of the week before, so a plan is checked as a whole
+# season and not against the incoming states its planner happened to use.
+
+feasibility_tolerance = 1e-6
+
+# constraint 5 as pairs: two selections of one workout share a window when they are at most
+# variability_spacing days apart and the later one is on or before the last day of any window
+variability_spacing = int(week_matrix.variability_window_mask.sum(axis=1).max()) - 1
+last_variability_day = int(np.flatnonzero(week_matrix.variability_window_mask.any(axis=0)).max())
+
+divergence_pair_ids = np.array([[week_matrix.sport_to_int[sport_a], week_matrix.sport_to_int[sport_b]] for sport_a, sport_b in week_matrix.divergence_pairs])
+
+
+def state_array(state):
+    # {"swim": .., "bike": .., "run": ..} in week_matrix.sports order
+    return np.array([state[sport] for sport in sports], dtype=np.float64)
+
+
+class PlanEvaluation:
+
+    def __init__(self, fitness, fatigue, excess):
+        self.fitness = fitness
+        self.fatigue = fatigue
+        self.excess = excess
+        self.violation_counts = {
+            name: (values > feasibility_tolerance).reshape(values.shape[0], values.shape[1], -1).sum(axis=2)
+            for name, values in excess.items()
+        } # (plans, weeks) per constraint
+        self.feasible = ~np.any([counts.any(axis=1) for counts in self.violation_counts.values()], axis=0)
+
+    def violations(self, plan=0):
+        # every violated row of one plan: dicts of constraint, week, the row's index within the week
+        # (day, sport, ...) and its excess
+        found = []
+        for name, values in self.excess.items():
+            for index in np.argwhere(values[plan] > feasibility_tolerance).tolist():
+                found.append({"constraint": name, "week": index[0], "index": tuple(index[1:]), "excess": float(values[plan][tuple(index)])})
+        return sorted(found, key=lambda violation: violation["week"])
+
+
+class PlanCheck:
+    # everything about one season that does not depend on the selections: the catalog columns, the
+    # weekly hour limits and the workouts available in every week. build once, evaluate many plans.
+
+    def __init__(self, week_plan, weekly_hours_max, workouts=None, fatigue_upper_bound=week_matrix.fatigue_upper_bound,
+                 total_fatigue_upper_bound=week_matrix.total_fatigue_upper_bound, max_divergence=week_matrix.max_divergence):
+        self.workouts = workout_library.fetch_workouts_with_cache() if workouts is None else workouts
+        self.columns = week_matrix.WeekColumns(self.workouts)
+        self.number_of_weeks = len(week_plan)
+        self.fatigue_upper_bound = fatigue_upper_bound
+        self.total_fatigue_upper_bound = total_fatigue_upper_bound
+        self.max_divergence = max_divergence
+
+        self.catalog_index = CatalogIndex(self.workouts)
+
+        self.hours_limit = np.array([
+            week_matrix.weekly_hours_limit(week, week_number < len(week_plan) - 1 and week_plan[week_number+1]["start_block"], weekly_hours_max)
+            for week_number, week in enumerate(week_plan)
+        ], dtype=np.float64)
+
+        strategies = sorted(set(week["strategy"] for week in week_plan))
+        self.week_strategy = np.array([strategies.index(week["strategy"]) for week in week_plan], dtype=np.int64)
+        self.available = np.zeros((len(strategies), len(self.workouts)), dtype=bool)
+        for strategy_id, strategy in enumerate(strategies):
+            self.available[strategy_id, self.workout_ids(workout_library.GetWorkoutsForWeek(strategy))] = True
+
+    def workout_ids(self, workouts):
+        return np.array(self.catalog_index.ids(workouts), dtype=np.int64)
+
+    def selections_from_week_plans(self, week_plans):
+        # (plan, week, day, workout) rows for planned week plans of this season. compact plans on the
+        # same catalog already hold the workout indexes.
+        if all(isinstance(week_plan, CompactPlan) and week_plan.workouts is self.workouts for week_plan in week_plans):
+            return np.concatenate([
+                np.column_stack([np.full(len(selections), plan), selections]) for plan, selections in enumerate(week_plan.selections() for week_plan in week_plans)
+            ] + [np.empty((0, 4), dtype=np.int64)])
+        rows = []
+        for plan, week_plan in enumerate(week_plans):
+            for week_number, week in enumerate(week_plan):
+                for day, workouts in enumerate(week["workouts"]):
+                    for workout_id in self.workout_ids(workouts).tolist():
+                        rows.append((plan, week_number, day, workout_id))
+        return np.array(rows, dtype=np.int64).reshape(-1, 4)
+
+    def evaluate(self, selections, initial_fatigue, initial_fitness, number_of_plans=None):
+        selections = np.asarray(selections, dtype=np.int64)
+        if selections.ndim != 2 or selections.shape[1] not in (3, 4):
+            raise ValueError("selections must have rows of (week, day, workout) or (plan, week, day, workout)")
+        if selections.shape[1] == 3:
+            selections = np.column_stack([np.zeros(len(selections), dtype=np.int64), selections])
+        plan, week, day, workout = selections.T
+
+        if number_of_plans is None:
+            number_of_plans = int(plan.max()) + 1 if len(plan) else 1
+        for name, values, size in (("plan", plan, number_of_plans), ("week", week, self.number_of_weeks), ("day", day, number_of_days), ("workout", workout, len(self.workouts))):
+            if len(values) and (values.min() < 0 or values.max() >= size):
+                raise ValueError("{} out of range 0..{}".format(name, size - 1))
+
+        P, W, D, S = number_of_plans, self.number_of_weeks, number_of_days, len(sports)
+        columns = self.columns
+        sport = columns.sport[workout]
+
+        # sums per (plan, week, day, sport)
+        cell = ((plan * W + week) * D + day) * S + sport
+        size = P * W * D * S
+        count = np.bincount(cell, minlength=size).reshape(P, W, D, S)
+        fatigue = np.bincount(cell, weights=columns.fatigue_increase[workout], minlength=size).reshape(P, W, D, S)
+        gain = np.bincount(cell, weights=columns.fitness_increase[workout] * week_matrix.fitness_multiplier, minlength=size).reshape(P, W, D, S).sum(axis=2)
+        duration = np.bincount(plan * W + week, weights=columns.duration[workout], minlength=P * W).reshape(P, W)
+
+        fatigue_outcome = fatigue[:, :, week_matrix.fatigue_outcome_days].sum(axis=2)
+        incoming_fatigue = np.empty((P, W, S))
+        incoming_fatigue[:, 0] = state_array(initial_fatigue)
+        incoming_fatigue[:, 1:] = fatigue_outcome[:, :-1]
+
+        # the only recurrence: fitness carried from week to week
+        fitness_outcome = np.empty((P, W, S))
+        incoming_fitness = np.broadcast_to(state_array(initial_fitness), (P, S))
+        for week_number in range(W):
+            fitness_outcome[:, week_number] = incoming_fitness * week_matrix.fitness_carryover + gain[:, week_number]
+            incoming_fitness = fitness_outcome[:, week_number]
+
+        excess = {}
+        excess["max_workouts_per_day"] = np.maximum(count.sum(axis=3) - 2, 0).astype(np.float64)
+        excess["max_workouts_per_day_by_sport"] = np.maximum(count - 1, 0).astype(np.float64)
+
+        window_fatigue = np.einsum("de,pwes->pwds", week_matrix.fatigue_window_mask.astype(np.float64), fatigue)
+        carried_fatigue = week_matrix.incoming_fatigue_coefs[None, None, :, None] * incoming_fatigue[:, :, None, :]
+        excess["must_not_exceed_max_fatigue_by_sport"] = np.maximum(carried_fatigue + window_fatigue - self.fatigue_upper_bound, 0)
+        excess["must_not_exceed_max_total_fatigue"] = np.maximum((carried_fatigue + window_fatigue).sum(axis=3) - self.total_fatigue_upper_bound, 0)
+
+        excess["must_not_exceed_weekly_duration_limit"] = np.maximum(duration - self.hours_limit * 60, 0)
+
+        divergence = fitness_outcome[:, :, divergence_pair_ids[:, 0]] - fitness_outcome[:, :, divergence_pair_ids[:, 1]]
+        excess["must_not_exceed_divergence_limit"] = np.maximum(divergence - self.max_divergence, 0)
+
+        # constraint 5: neighbouring selections of the same workout in the same plan and week
+        order = np.lexsort((day, workout, week, plan))
+        key = (plan * W + week)[order] * len(self.workouts) + workout[order]
+        sorted_days = day[order]
+        too_close = (key[1:] == key[:-1]) & (sorted_days[1:] - sorted_days[:-1] <= variability_spacing) & (sorted_days[1:] <= last_variability_day)
+        excess["must_have_variability_in_workouts"] = np.bincount((plan * W + week)[order][1:][too_close], minlength=P * W).reshape(P, W).astype(np.float64)
+
+        unavailable = ~self.available[self.week_strategy[week], workout]
+        excess["workout_available"] = np.bincount((plan * W + week)[unavailable], minlength=P * W).reshape(P, W).astype(np.float64)
+
+        return PlanEvaluation(fitness_outcome, fatigue_outcome, excess)
+
+    def evaluate_week_plans(self, week_plans, initial_fatigue, initial_fitness):
+        return self.evaluate(self.selections_from_week_plans(week_plans), initial_fatigue, initial_fitness, len(week_plans))
+
+
+def check_training_plan(config, week_plan, initial_fatigue=None, initial_fitness=None):
+    # violations of one planned season, [] when it meets every constraint
+    default_fatigue, default_fitness = batch.initial_state(config)
+    check = PlanCheck(week_plan, config["max_weekly_training"])
+    evaluation = check.evaluate_week_plans([week_plan], initial_fatigue or default_fatigue, initial_fitness or default_fitness)
+    return evaluation.violations(0)
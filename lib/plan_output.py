@@ -0,0 +1,107 @@
+import csv
+import datetime
+import json
+
+
+# streaming writers for solved weeks.
+#
+# one writer appends every week of a plan (or of a whole batch of plans) to a single buffered file,
+# so weeks can be written as they come out of iter_weeks_with_workouts or stream_training_plan
+# instead of opening one csv per week. both writers take a path (opened for appending) or an open
+# text file.
+
+default_buffer_size = 1 << 16
+
+csv_header = ["plan", "week", "strategy", "date", "sport", "name", "intensity", "duration"]
+
+
+def week_rows(week):
+    # one row per workout, the columns print_to_csv in the notebook writes
+    for day, day_workouts in enumerate(week["workouts"]):
+        date = week["start_date"] + datetime.timedelta(days=day)
+        for workout in day_workouts:
+            yield [date, workout["sport"], workout["workout_name"], workout["intensity"], workout["duration"]]
+
+
+def week_record(week):
+    # a week as plain JSON types
+    record = {
+        "start_date": week["start_date"].isoformat(),
+        "end_date": week["end_date"].isoformat(),
+        "strategy": week["strategy"],
+        "start_block": week["start_block"],
+        "workouts": [
+            [
+                {key: workout[key] for key in ("sport", "workout_name", "intensity", "duration", "fatigue_increase", "fitness_increase")}
+                for workout in day_workouts
+            ]
+            for day_workouts in week["workouts"]
+        ],
+        "fitness_outcome": dict(week["fitness_outcome"]),
+        "fatigue_outcome": dict(week["fatigue_outcome"])
+    }
+    if "relaxation" in week:
+        record["relaxation"] = week["relaxation"]
+    return record
+
+
+class PlanWriter:
+
+    def __init__(self, file, buffer_size=default_buffer_size):
+        self.owns_file = isinstance(file, str)
+        self.file = open(file, "at", buffering=buffer_size, newline="") if self.owns_file else file
+        self.weeks_written = 0
+
+    def write_plan(self, weeks, plan=None):
+        # writes weeks as the iterable produces them and yields them on, so a consumer can both
+        # stream a plan to disk and keep working with it
+        for week_number, week in enumerate(weeks):
+            self.write_week(week, plan, week_number)
+            yield week
+
+    def write_weeks(self, weeks, plan=None):
+        for week in self.write_plan(weeks, plan):
+            pass
+        return self.weeks_written
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CsvPlanWriter(PlanWriter):
+    # one row per workout, with the plan and week number in front
+
+    def __init__(self, file, buffer_size=default_buffer_size, header=True):
+        super().__init__(file, buffer_size)
+        self.writer = csv.writer(self.file)
+        # appending to a file that already has rows keeps its header
+        if header and not (self.file.seekable() and self.file.tell() > 0):
+            self.writer.writerow(csv_header)
+
+    def write_week(self, week, plan=None, week_number=None):
+        prefix = [plan, week_number, week["strategy"]]
+        self.writer.writerows(prefix + row for row in week_rows(week))
+        self.weeks_written += 1
+
+
+class JsonlPlanWriter(PlanWriter):
+    # one JSON object per week
+
+    def write_week(self, week, plan=None, week_number=None):
+        record = {"plan": plan, "week": week_number}
+        record.update(week_record(week))
+        self.file.write(json.dumps(record))
+        self.file.write("\n")
+        self.weeks_written += 1
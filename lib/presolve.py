@@ -0,0 +1,159 @@
+import numpy as np
+
+from .workouts import workouts as workout_library
+from . import week_matrix
+from . import workout_planner
+from . import solvers
+from . import telemetry
+from .week_matrix import number_of_days
+
+
+# presolve between the catalog and the weekly model: shrink the set of workouts the model is built
+# over without changing its optimal objective.
+#
+#   duplicates  workouts of one sport with the same duration, fatigue and fitness are merged into one
+#               variable that may be selected as often per constraint 5 window as there are copies
+#   dominated   a workout is dropped when at least min_dominating other workouts of the same sport
+#               and the same fitness need no more duration and no more fatigue. swapping it for one
+#               of them keeps every row satisfied: duration and fatigue only go down, fitness (and so
+#               the divergence rows) stays the same, and a spacing conflict can only come from the
+#               at most four same sport workouts on the two days either side. workouts with more
+#               fitness are not treated as dominating, because more fitness can break a divergence row.
+#
+# solved weeks are mapped back onto the original workouts: each use of a merged variable goes to the
+# first copy not used on the two days before, which always exists because the model lets a merged
+# variable into a window no more often than there are copies.
+
+min_dominating = 5 # the spacing rule blocks at most 4 same sport workouts around a day
+spacing_days = 2 # constraint 5 windows span three days, so a copy is free again two days after its use
+
+
+class PresolvedWorkouts:
+
+    def __init__(self, available_workouts):
+        self.workouts = available_workouts
+        full_columns = week_matrix.WeekColumns(available_workouts)
+        self.full_columns = full_columns
+
+        # duplicates: one group per distinct (sport, fitness, duration, fatigue)
+        keys = np.stack([full_columns.sport, full_columns.fitness_increase, full_columns.duration, full_columns.fatigue_increase], axis=1) if len(available_workouts) > 0 else np.zeros((0, 4))
+        unique_keys, first_index, group_of = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        group_of = np.asarray(group_of).reshape(-1)
+        members = [[] for _ in range(len(unique_keys))]
+        for workout_id, group in enumerate(group_of.tolist()):
+            members[group].append(workout_id)
+
+        # dominated: within one sport and fitness, walk groups by duration then fatigue, so every group
+        # that dominates another comes before it
+        multiplicity = np.array([len(group_members) for group_members in members], dtype=np.int64)
+        keep = np.ones(len(unique_keys), dtype=bool)
+        order = np.lexsort((unique_keys[:, 3], unique_keys[:, 2], unique_keys[:, 1], unique_keys[:, 0])) if len(unique_keys) > 0 else np.zeros(0, dtype=np.int64)
+        sorted_keys = unique_keys[order]
+        boundaries = np.flatnonzero(np.any(sorted_keys[1:, :2] != sorted_keys[:-1, :2], axis=1)) + 1
+        for block in np.split(np.arange(len(order)), boundaries):
+            kept_duration = []
+            kept_fatigue = []
+            kept_multiplicity = []
+            for position in block.tolist():
+                group = order[position]
+                _, _, duration, fatigue = unique_keys[group]
+                if kept_duration:
+                    dominating = (np.array(kept_duration) <= duration) & (np.array(kept_fatigue) <= fatigue)
+                    if np.array(kept_multiplicity)[dominating].sum() >= min_dominating:
+                        keep[group] = False
+                        continue
+                kept_duration.append(duration)
+                kept_fatigue.append(fatigue)
+                kept_multiplicity.append(multiplicity[group])
+
+        self.number_of_dominated = int(multiplicity[~keep].sum())
+        self.number_of_duplicates = int((multiplicity[keep] - 1).sum())
+
+        # representatives in the order of the original workouts
+        kept_groups = np.flatnonzero(keep)
+        kept_groups = kept_groups[np.argsort(first_index[kept_groups], kind="stable")]
+        self.members = [members[group] for group in kept_groups.tolist()]
+        self.multiplicity = multiplicity[kept_groups]
+        self.representatives = tuple(available_workouts[group_members[0]] for group_members in self.members)
+        self.columns = week_matrix.WeekColumns(self.representatives)
+        self.matrix = week_matrix.WeekMatrix(self.columns, self.multiplicity)
+
+    def stats(self):
+        n, k = len(self.workouts), len(self.representatives)
+        fixed_rows = self.matrix.number_of_rows - (number_of_days - 1) * k
+        return {
+            "workouts": n,
+            "kept": k,
+            "merged_duplicates": self.number_of_duplicates,
+            "dominated": self.number_of_dominated,
+            "variables_before": number_of_days * n,
+            "variables_after": number_of_days * k,
+            "rows_before": fixed_rows + (number_of_days - 1) * n,
+            "rows_after": self.matrix.number_of_rows
+        }
+
+    def expand(self, selection):
+        # (days, kept workouts) solution onto (days, original workouts)
+        full_selection = np.zeros((number_of_days, len(self.workouts)))
+        for representative, day_values in enumerate(np.asarray(selection).T.tolist()):
+            group_members = self.members[representative]
+            last_used = {}
+            for day, value in enumerate(day_values):
+                if value != 1:
+                    continue
+                blocked = set()
+                if day < number_of_days - 1: # the last day is in no constraint 5 window
+                    blocked = {workout_id for workout_id, used_day in last_used.items() if day - used_day <= spacing_days}
+                workout_id = next(workout_id for workout_id in group_members if workout_id not in blocked)
+                full_selection[day, workout_id] = 1
+                last_used[workout_id] = day
+        return full_selection
+
+
+presolve_cache = {}
+
+def presolve(available_workouts):
+    # presolved once per workout set; the catalog hands out the same tuple until the library changes
+    presolved = presolve_cache.get(id(available_workouts))
+    if presolved is None or presolved.workouts is not available_workouts:
+        if len(presolve_cache) > 16:
+            presolve_cache.clear()
+        presolved = PresolvedWorkouts(available_workouts)
+        presolve_cache[id(available_workouts)] = presolved
+    return presolved
+
+
+def add_workouts_to_week_plan_presolved(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max, solver=None):
+    # same inputs and outputs as add_workouts_to_week_plan, solved over the presolved workouts
+
+    build_started = telemetry.clock()
+    available_workouts = workout_library.GetWorkoutsForWeek(week["strategy"])
+
+    presolved = presolve(available_workouts)
+    matrix = presolved.matrix
+    hours_limit = week_matrix.weekly_hours_limit(week, is_last_week_of_block, weekly_hours_max)
+    backend = solvers.get_backend(solver, time_limit=10)
+    relaxed = workout_planner.add_relaxed_workouts_if_precheck_fails(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, backend, "presolve", build_started)
+    if relaxed is not None:
+        return relaxed
+    b = matrix.rhs(incoming_fatigue, incoming_fitness, hours_limit)
+
+    # solve
+    solve_started = telemetry.clock()
+    results = backend.solve_arrays(matrix.c, matrix.A, b)
+    solve_finished = telemetry.clock()
+    if not results.has_solution():
+        # softened over the full workout set, like the matrix engine
+        return workout_planner.add_relaxed_workouts_to_week_plan(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, backend, None, results.status, "presolve", build_started)
+
+    #parse results and add workouts to week
+    selection = presolved.expand(week_matrix.selection_from_solution(matrix, results.values))
+    week_matrix.apply_selection_to_week(week, presolved.full_columns, selection, incoming_fitness)
+
+    if telemetry.enabled():
+        telemetry.report_week(
+            week, "presolve", solve_started - build_started, solve_finished - solve_started, telemetry.clock() - solve_finished,
+            results, telemetry.matrix_counts(matrix), solver=backend.name, presolve=presolved.stats()
+        )
+
+    return week
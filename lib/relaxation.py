@@ -0,0 +1,145 @@
+import numpy as np
+
+from . import week_matrix
+from .week_matrix import sports, number_of_days
+
+
+# feasibility precheck and soft constraints for weeks that cannot meet every limit.
+#
+# selecting nothing meets every constraint whose right hand side is not negative, so a week can only
+# be infeasible through rows the incoming state pushes below zero:
+#
+#   fatigue by sport, total fatigue   incoming fatigue carried into a day above the limit. workouts
+#                                     only add fatigue, so no selection can meet the row.
+#   divergence                        incoming fitness of two sports further apart than the limit.
+#                                     the week can only close the gap by as much fitness as the
+#                                     lagging sport can gain: one workout a day, and no more than the
+#                                     weekly minutes at its best fitness per minute.
+#
+# precheck tests these rows from the incoming state and the workout columns alone, before a model is
+# built. it is a necessary condition: a week that passes can still be infeasible, which the solver
+# then reports. either way the week is solved again with the failed rows (or, after the solver found
+# nothing, every row of the soft groups) softened: each gets a slack column s >= 0, A x - s <= b,
+# and the objective loses penalty per unit of slack. the failed rows alone may not be enough, when
+# the rows left hard cannot be met together; the week is then softened on every row of the soft
+# groups as well. the week's relaxation is reported as week["relaxation"].
+
+default_penalty = 1000 # objective lost per unit of slack, well above the fitness a workout adds per unit
+
+soft_groups = ("must_not_exceed_max_fatigue_by_sport", "must_not_exceed_max_total_fatigue", "must_not_exceed_divergence_limit")
+
+feasibility_tolerance = 1e-9
+slack_tolerance = 1e-6
+
+
+def describe_row(constraint, row):
+    # the day, sport or sports a row of one of the soft groups stands for
+    if constraint == "must_not_exceed_max_fatigue_by_sport":
+        return {"day": row // len(sports), "sport": sports[row % len(sports)]}
+    if constraint == "must_not_exceed_max_total_fatigue":
+        return {"day": row}
+    if constraint == "must_not_exceed_divergence_limit":
+        return {"sports": list(week_matrix.divergence_pairs[row])}
+    return {}
+
+
+def max_fitness_gain(columns, weekly_hours_limit):
+    # upper bound on the fitness one week can add to each sport
+    gains = np.zeros(len(sports))
+    minutes = weekly_hours_limit * 60
+    for sport_idx, sport in enumerate(sports):
+        workout_ids = columns.workouts_for_sport(sport)
+        if len(workout_ids) == 0:
+            continue
+        fitness = columns.fitness_increase[workout_ids] * week_matrix.fitness_multiplier
+        duration = columns.duration[workout_ids]
+        gain = number_of_days * max(fitness.max(), 0.0)
+        if np.all(duration > 0):
+            gain = min(gain, max((fitness / duration).max(), 0.0) * minutes)
+        gains[sport_idx] = gain
+    return gains
+
+
+def precheck(columns, incoming_fatigue, incoming_fitness, weekly_hours_limit, fatigue_upper_bound=week_matrix.fatigue_upper_bound,
+             total_fatigue_upper_bound=week_matrix.total_fatigue_upper_bound, max_divergence=week_matrix.max_divergence):
+    # rows no selection can meet, as dicts of constraint, row (within its group in WeekMatrix), what it
+    # stands for and the shortfall. [] when the week may be feasible.
+    failures = []
+
+    def fail(constraint, row, shortfall):
+        failure = {"constraint": constraint, "row": row, "shortfall": float(shortfall)}
+        failure.update(describe_row(constraint, row))
+        failures.append(failure)
+
+    incoming_by_sport = np.array([incoming_fatigue[sport] for sport in sports], dtype=np.float64)
+    for day in range(number_of_days):
+        carried = week_matrix.incoming_fatigue_coefs[day] * incoming_by_sport
+        for sport_idx in range(len(sports)):
+            if fatigue_upper_bound - carried[sport_idx] < -feasibility_tolerance:
+                fail("must_not_exceed_max_fatigue_by_sport", day * len(sports) + sport_idx, carried[sport_idx] - fatigue_upper_bound)
+        if total_fatigue_upper_bound - carried.sum() < -feasibility_tolerance:
+            fail("must_not_exceed_max_total_fatigue", day, carried.sum() - total_fatigue_upper_bound)
+
+    gains = max_fitness_gain(columns, weekly_hours_limit)
+    for pair_idx, (sport_a, sport_b) in enumerate(week_matrix.divergence_pairs):
+        rhs = max_divergence - (incoming_fitness[sport_a] * week_matrix.fitness_carryover - incoming_fitness[sport_b] * week_matrix.fitness_carryover)
+        lowest = -gains[week_matrix.sport_to_int[sport_b]] # sport_a gains nothing, sport_b all it can
+        if lowest - rhs > feasibility_tolerance:
+            fail("must_not_exceed_divergence_limit", pair_idx, lowest - rhs)
+
+    return failures
+
+
+def soft_rows(matrix, failures=None):
+    # row indexes in matrix.A to soften: the failed rows, or every row of the soft groups
+    if failures:
+        return np.array([matrix.row_groups[failure["constraint"]].start + failure["row"] for failure in failures], dtype=np.int64)
+    return np.concatenate([np.arange(matrix.row_groups[group].start, matrix.row_groups[group].stop) for group in soft_groups])
+
+
+def solve_relaxed(matrix, b, backend, failures=None, reason="precheck", penalty=default_penalty):
+    # the week with soft rows. returns the solver result, with values cut back to the workout
+    # variables, and the relaxation to report on the week.
+    import scipy.sparse as sp
+    rows = soft_rows(matrix, failures)
+    number_of_slacks = len(rows)
+    slack = sp.csr_matrix((-np.ones(number_of_slacks), (rows, np.arange(number_of_slacks))), shape=(matrix.number_of_rows, number_of_slacks))
+    c = np.concatenate([matrix.c, np.full(number_of_slacks, -float(penalty))])
+    A = sp.hstack([matrix.A, slack], format="csr")
+
+    results = backend.solve_arrays(c, A, b, continuous_columns=number_of_slacks)
+
+    relaxation = {"reason": reason, "failed_checks": list(failures or []), "penalty": penalty, "relaxed_rows": []}
+    if not results.has_solution():
+        return results, relaxation
+
+    slack_values = results.values[matrix.number_of_variables:]
+    results.values = results.values[:matrix.number_of_variables]
+    results.objective = float(matrix.c @ results.values)
+    relaxation["relaxed_rows"] = relaxed_rows(matrix, rows, slack_values)
+    return results, relaxation
+
+
+def relaxed_rows(matrix, rows, slack_values):
+    # the rows (indices into matrix's rows, all in soft groups) that needed slack, as reported in
+    # week["relaxation"]["relaxed_rows"]
+    described = []
+    for row, value in zip(np.asarray(rows).tolist(), np.asarray(slack_values).tolist()):
+        if value > slack_tolerance:
+            constraint = next(group for group in soft_groups if matrix.row_groups[group].start <= row < matrix.row_groups[group].stop)
+            relaxed_row = {"constraint": constraint, "row": row - matrix.row_groups[constraint].start, "slack": value}
+            relaxed_row.update(describe_row(constraint, relaxed_row["row"]))
+            described.append(relaxed_row)
+    return described
+
+
+def relax_week(matrix, b, backend, failures=None, reason="precheck", penalty=default_penalty):
+    # solve_relaxed on the failed rows, and on every row of the soft groups when that finds nothing.
+    # rows of the other groups stay hard, but selecting nothing always meets them.
+    results, relaxation = solve_relaxed(matrix, b, backend, failures, reason, penalty)
+    if failures and not results.has_solution():
+        results, relaxation = solve_relaxed(matrix, b, backend, None, reason, penalty)
+        relaxation["failed_checks"] = list(failures)
+    if not results.has_solution():
+        raise RuntimeError("{} returned no solution for the relaxed week ({})".format(backend.name, results.termination_condition))
+    return results, relaxation
@@ -0,0 +1,153 @@
+import collections
+
+import numpy as np
+
+from .workouts import workouts as workout_library
+from . import workout_planner
+from . import week_matrix
+from . import solvers
+from . import telemetry
+from .week_matrix import number_of_days, sports
+
+
+# re-planning part of an existing plan.
+#
+# every week starts from the previous week's fatigue_outcome and fitness_outcome, so a change in one
+# week (missed sessions, a fatigue report that differs from the plan) only matters for the weeks after
+# it as long as it shows up in their outcomes. replan_from_week re-solves from the changed week on,
+# with the observed state as its incoming state, and stops as soon as a re-solved week's outcomes are
+# back within tolerance of the stored ones. weeks before the changed week and after that point are
+# the stored week dicts, untouched; only re-solved weeks are new dicts.
+#
+# weekly models usually have many optimal selections with different fatigue, so a re-solve that picks
+# any of them would rarely fall back onto the stored plan. the default engine therefore breaks ties
+# toward the stored week: each stored selection gets a bonus small enough that the sum of all bonuses
+# stays below the smallest step between two objective values, so the fitness gained is still optimal.
+# the bonus is far below the solver's default relative gap, which would let it stop at any optimal
+# selection, so these weeks are solved to a zero gap.
+
+default_tolerance = 1.0 # largest difference in any sport's fatigue or fitness outcome still treated as unchanged
+
+Replan = collections.namedtuple("Replan", ["week_plan", "resolved_weeks", "converged_at"])
+
+planned_keys = ("workouts", "fitness_outcome", "fatigue_outcome", "telemetry", "relaxation")
+
+
+def outcome_difference(week_a, week_b):
+    return max(
+        abs(week_a[outcome][sport] - week_b[outcome][sport])
+        for outcome in ("fatigue_outcome", "fitness_outcome")
+        for sport in sports
+    )
+
+
+def unplanned_copy(week):
+    # the week without what the weekly solve adds, so it can be solved again
+    return {key: value for key, value in week.items() if key not in planned_keys}
+
+
+def week_selection(columns, week):
+    # (days, workouts) array of the workouts a planned week selected
+    index = {id(workout): workout_id for workout_id, workout in enumerate(columns.workouts)}
+    by_name = {(workout["sport"], workout["workout_name"]): workout_id for workout_id, workout in enumerate(columns.workouts)}
+    selection = np.zeros((number_of_days, len(columns)))
+    for day, day_workouts in enumerate(week.get("workouts", [])):
+        for workout in day_workouts:
+            workout_id = index.get(id(workout), by_name.get((workout["sport"], workout["workout_name"])))
+            if workout_id is not None:
+                selection[day, workout_id] = 1
+    return selection
+
+
+def add_workouts_to_week_plan_near(stored_week):
+    # the matrix engine, breaking ties between optimal selections toward stored_week's
+    def add_workouts_to_week_plan(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max, solver=None):
+
+        build_started = telemetry.clock()
+        available_workouts = workout_library.GetWorkoutsForWeek(week["strategy"])
+
+        matrix = workout_planner.get_week_matrix(available_workouts)
+        hours_limit = week_matrix.weekly_hours_limit(week, is_last_week_of_block, weekly_hours_max)
+        backend = solvers.get_exact_backend(solver, time_limit=10)
+        relaxed = workout_planner.add_relaxed_workouts_if_precheck_fails(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, backend, "replan", build_started)
+        if relaxed is not None:
+            return relaxed
+        b = matrix.rhs(incoming_fatigue, incoming_fitness, hours_limit)
+
+        stored = week_selection(matrix.columns, stored_week).ravel()
+        bonus = week_matrix.objective_step(matrix.columns) / (stored.sum() + 1)
+        c = matrix.c + bonus * stored
+
+        # solve
+        solve_started = telemetry.clock()
+        results = backend.solve_arrays(c, matrix.A, b)
+        solve_finished = telemetry.clock()
+        if not results.has_solution():
+            return workout_planner.add_relaxed_workouts_to_week_plan(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, backend, None, results.status, "replan", build_started)
+
+        #parse results and add workouts to week
+        selection = week_matrix.selection_from_solution(matrix, results.values)
+        week_matrix.apply_selection_to_week(week, matrix.columns, selection, incoming_fitness)
+
+        if telemetry.enabled():
+            telemetry.report_week(
+                week, "replan", solve_started - build_started, solve_finished - solve_started, telemetry.clock() - solve_finished,
+                results, telemetry.matrix_counts(matrix), solver=backend.name, kept_stored=int((selection.ravel() * stored).sum())
+            )
+
+        return week
+
+    return add_workouts_to_week_plan
+
+
+def replan_from_week(week_plan, week_index, incoming_fatigue, incoming_fitness, weekly_hours_max,
+                     add_workouts_to_week_plan=None, tolerance=default_tolerance):
+    # week_plan is a planned season (every week has its outcomes), incoming_fatigue and
+    # incoming_fitness the state observed going into week_plan[week_index]. returns a Replan with the
+    # new plan, the indices of the weeks solved again, and the index of the first stored week reused
+    # after them (None when re-solving ran to the end of the plan). week_plan itself is not modified.
+    # without add_workouts_to_week_plan weeks are solved by add_workouts_to_week_plan_near.
+    if not 0 <= week_index < len(week_plan):
+        raise IndexError("week_index {} is outside a plan of {} weeks".format(week_index, len(week_plan)))
+
+    started = telemetry.clock()
+    new_plan = list(week_plan)
+    resolved_weeks = []
+    converged_at = None
+
+    for week_number in range(week_index, len(week_plan)):
+        if resolved_weeks and outcome_difference(new_plan[week_number - 1], week_plan[week_number - 1]) <= tolerance:
+            converged_at = week_number
+            break
+
+        if week_number > week_index:
+            incoming_fatigue = new_plan[week_number-1]["fatigue_outcome"]
+            incoming_fitness = new_plan[week_number-1]["fitness_outcome"]
+
+        is_last_week_of_block = False
+        if week_number < len(week_plan) - 1:
+            is_last_week_of_block = week_plan[week_number+1]["start_block"]
+
+        solve_week = add_workouts_to_week_plan or add_workouts_to_week_plan_near(week_plan[week_number])
+        week = unplanned_copy(week_plan[week_number])
+        solve_week(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max)
+        new_plan[week_number] = week
+        resolved_weeks.append(week_number)
+
+    if telemetry.enabled():
+        telemetry.emit("replan", {
+            "week_index": week_index,
+            "number_of_weeks": len(week_plan),
+            "resolved_weeks": list(resolved_weeks),
+            "converged_at": converged_at,
+            "tolerance": tolerance,
+            "seconds": telemetry.clock() - started
+        })
+
+    return Replan(new_plan, resolved_weeks, converged_at)
+
+
+def replan_training_plan(config, week_plan, week_index, incoming_fatigue, incoming_fitness,
+                         add_workouts_to_week_plan=None, tolerance=default_tolerance):
+    # replan_from_week for a plan made by batch.create_training_plan from config
+    return replan_from_week(week_plan, week_index, incoming_fatigue, incoming_fitness, config["max_weekly_training"], add_workouts_to_week_plan, tolerance)
@@ -0,0 +1,182 @@
+import numpy as np
+
+from .workouts import workouts as workout_library
+from . import batch
+from . import periodization
+from . import relaxation
+from . import workout_planner
+from . import week_matrix
+from . import solvers
+from . import telemetry
+from .week_matrix import sports, number_of_days
+
+
+# rolling horizon planning: horizon consecutive weeks in one model.
+#
+# the weekly model plans one week at a time and maximizes that week's fitness, whatever fatigue it
+# leaves the weeks after it. here the weekly models of a window of weeks are stacked block-diagonally,
+# x = [x_0, x_1, ..., x_K-1], and the state carried from week to week becomes linear terms across the
+# blocks instead of constants in b:
+#
+#   fatigue      the incoming fatigue of week k is the fatigue of week k-1 on fatigue_outcome_days,
+#                so the fatigue rows of week k get incoming_fatigue_coefs[day] times those
+#                coefficients on x_k-1. b holds the limits alone.
+#   fitness      the incoming fitness of week k is carryover^k times the fitness coming into the
+#                window plus carryover^(k-1-j) times the gains of every earlier week j of the window,
+#                so the divergence rows of week k get carryover^(k-j) times the gain differences on
+#                x_j. b holds the carried part of the fitness coming into the window.
+#
+# only the first week of a window starts from a known state. the objective is the fitness at the end
+# of the window, sum over k of carryover^(K-1-k) c @ x_k, which weighs the weeks as the fitness at the
+# end of the season does. the first commit_weeks weeks are committed and the window slides on from
+# their outcomes. a horizon of 1 is the sequential matrix engine, week by week.
+#
+# a window with no solution (a first week the incoming state already puts over a limit, say) commits
+# its first week through the matrix engine, which relaxes what it cannot meet (see relaxation.py).
+
+default_horizon = 3
+default_commit_weeks = 1
+default_time_limit = 10 # per week in the window, as add_workouts_to_week_plan_matrix
+
+
+class WindowModel:
+    # the joint model of the weeks of one window, from the state coming into its first week
+
+    def __init__(self, weeks, incoming_fatigue, incoming_fitness, hours_limits):
+        import scipy.sparse as sp
+        self.matrices = [workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(week["strategy"])) for week in weeks]
+        sizes = [matrix.number_of_variables for matrix in self.matrices]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        row_offsets = np.concatenate([[0], np.cumsum([matrix.number_of_rows for matrix in self.matrices])]).astype(np.int64)
+        self.number_of_variables = int(self.offsets[-1])
+        self.number_of_rows = int(row_offsets[-1])
+        number_of_weeks = len(weeks)
+
+        no_fatigue = {sport: 0.0 for sport in sports}
+        weights = week_matrix.fitness_carryover ** np.arange(number_of_weeks - 1, -1, -1, dtype=np.float64)
+        self.c = np.concatenate([weight * matrix.c for weight, matrix in zip(weights, self.matrices)])
+        self.b = np.concatenate([
+            matrix.rhs(
+                incoming_fatigue if week_number == 0 else no_fatigue,
+                {sport: incoming_fitness[sport] * week_matrix.fitness_carryover ** week_number for sport in sports},
+                hours_limit
+            )
+            for week_number, (matrix, hours_limit) in enumerate(zip(self.matrices, hours_limits))
+        ])
+
+        rows = []
+        cols = []
+        coefs = []
+        for week_number in range(1, number_of_weeks):
+            matrix = self.matrices[week_number]
+            row_start = row_offsets[week_number]
+
+            # fatigue carried in from the week before
+            before = self.matrices[week_number - 1]
+            carried_days = np.arange(number_of_days)[week_matrix.fatigue_outcome_days]
+            carried_cols = self.offsets[week_number - 1] + (carried_days[:, None] * before.number_of_workouts + np.arange(before.number_of_workouts)).ravel()
+            carried_sport = np.tile(before.columns.sport, len(carried_days))
+            carried_fatigue = np.tile(before.columns.fatigue_increase, len(carried_days))
+            for day in np.flatnonzero(week_matrix.incoming_fatigue_coefs):
+                coef = week_matrix.incoming_fatigue_coefs[day]
+                rows.append(row_start + matrix.row_groups["must_not_exceed_max_fatigue_by_sport"].start + day * len(sports) + carried_sport)
+                cols.append(carried_cols)
+                coefs.append(coef * carried_fatigue)
+                rows.append(np.full(len(carried_cols), row_start + matrix.row_groups["must_not_exceed_max_total_fatigue"].start + day))
+                cols.append(carried_cols)
+                coefs.append(coef * carried_fatigue)
+
+            # fitness gained in every earlier week of the window
+            divergence_start = row_start + matrix.row_groups["must_not_exceed_divergence_limit"].start
+            for earlier in range(week_number):
+                gains = self.matrices[earlier]
+                variable_sports = np.tile(gains.columns.sport, number_of_days)
+                variable_gain = week_matrix.fitness_carryover ** (week_number - earlier) * gains.c * week_matrix.fitness_multiplier
+                for pair_idx, (sport_a, sport_b) in enumerate(week_matrix.divergence_pairs):
+                    for sport, sign in ((sport_a, 1), (sport_b, -1)):
+                        in_sport = np.flatnonzero(variable_sports == week_matrix.sport_to_int[sport])
+                        rows.append(np.full(len(in_sport), divergence_start + pair_idx))
+                        cols.append(self.offsets[earlier] + in_sport)
+                        coefs.append(sign * variable_gain[in_sport])
+
+        linking = sp.csr_matrix(
+            (np.concatenate(coefs + [np.empty(0)]), (np.concatenate(rows + [np.empty(0, dtype=np.int64)]), np.concatenate(cols + [np.empty(0, dtype=np.int64)]))),
+            shape=(self.number_of_rows, self.number_of_variables)
+        )
+        self.A = (sp.block_diag([matrix.A for matrix in self.matrices], format="csr") + linking).tocsr()
+
+    def week_values(self, values, week_number):
+        return values[self.offsets[week_number]:self.offsets[week_number + 1]]
+
+    def counts(self):
+        return self.number_of_variables, self.number_of_rows
+
+
+def iter_windows(week_plan, incoming_fatigue, incoming_fitness, weekly_hours_max, horizon=default_horizon, commit_weeks=default_commit_weeks, solver=None, time_limit=None):
+    # plans the weeks of week_plan in place and yields the weeks committed by each window, in order
+    if horizon < 1 or not 1 <= commit_weeks <= horizon:
+        raise ValueError("need horizon >= 1 and 1 <= commit_weeks <= horizon, got {} and {}".format(horizon, commit_weeks))
+    number_of_weeks = len(week_plan)
+    hours_limits = [
+        week_matrix.weekly_hours_limit(week, week_number < number_of_weeks - 1 and week_plan[week_number+1]["start_block"], weekly_hours_max)
+        for week_number, week in enumerate(week_plan)
+    ]
+
+    committed = 0
+    while committed < number_of_weeks:
+        build_started = telemetry.clock()
+        window = range(committed, min(committed + horizon, number_of_weeks))
+        backend = solvers.get_backend(solver, time_limit=default_time_limit * len(window) if time_limit is None else time_limit)
+
+        first = week_plan[committed]
+        first_matrix = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(first["strategy"]))
+        results = None
+        if not relaxation.precheck(first_matrix.columns, incoming_fatigue, incoming_fitness, hours_limits[committed]):
+            model = WindowModel([week_plan[week_number] for week_number in window], incoming_fatigue, incoming_fitness, [hours_limits[week_number] for week_number in window])
+            solve_started = telemetry.clock()
+            results = backend.solve_arrays(model.c, model.A, model.b)
+            solve_finished = telemetry.clock()
+
+        if results is None or not results.has_solution():
+            # the matrix engine relaxes the first week
+            workout_planner.add_workouts_to_week_plan_matrix(first, incoming_fatigue, incoming_fitness, committed < number_of_weeks - 1 and week_plan[committed+1]["start_block"], weekly_hours_max, solver=backend)
+            incoming_fatigue, incoming_fitness = first["fatigue_outcome"], first["fitness_outcome"]
+            committed += 1
+            yield [first]
+            continue
+
+        weeks = [week_plan[week_number] for week_number in window[:commit_weeks]]
+        for week_number, week in enumerate(weeks):
+            extract_started = telemetry.clock()
+            matrix = model.matrices[week_number]
+            selection = week_matrix.selection_from_solution(matrix, model.week_values(results.values, week_number))
+            week_matrix.apply_selection_to_week(week, matrix.columns, selection, incoming_fitness)
+            telemetry.report_week(
+                week, "rolling", (solve_started - build_started) / len(weeks), (solve_finished - solve_started) / len(weeks), telemetry.clock() - extract_started,
+                results, model.counts, solver=backend.name, horizon=len(window), window_start=committed
+            )
+            incoming_fatigue, incoming_fitness = week["fatigue_outcome"], week["fitness_outcome"]
+        committed += len(weeks)
+        yield weeks
+
+
+def iter_weeks_rolling(week_plan, incoming_fatigue, incoming_fitness, weekly_hours_max, horizon=default_horizon, commit_weeks=default_commit_weeks, solver=None, time_limit=None):
+    for weeks in iter_windows(week_plan, incoming_fatigue, incoming_fitness, weekly_hours_max, horizon, commit_weeks, solver, time_limit):
+        yield from weeks
+
+
+def add_workouts_to_weeks_rolling(week_plan, incoming_fatigue, incoming_fitness, weekly_hours_max, horizon=default_horizon, commit_weeks=default_commit_weeks, solver=None, time_limit=None):
+    for week in iter_weeks_rolling(week_plan, incoming_fatigue, incoming_fitness, weekly_hours_max, horizon, commit_weeks, solver, time_limit):
+        pass
+    return week_plan
+
+
+def stream_training_plan_rolling(config, horizon=default_horizon, commit_weeks=default_commit_weeks, solver=None):
+    # as batch.stream_training_plan; weeks come out a window at a time
+    week_plan = periodization.create_linear_periodization_plan(config)
+    incoming_fatigue, incoming_fitness = batch.initial_state(config)
+    yield from iter_weeks_rolling(week_plan, incoming_fatigue, incoming_fitness, config["max_weekly_training"], horizon, commit_weeks, solver)
+
+
+def create_training_plan_rolling(config, horizon=default_horizon, commit_weeks=default_commit_weeks, solver=None):
+    return list(stream_training_plan_rolling(config, horizon, commit_weeks, solver))
@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+
+from . import batch
+from . import periodization
+from . import workout_planner
+from . import plan_output
+
+
+# planning behind a local HTTP/JSON endpoint.
+#
+#   POST /plan    body {"config": {...}, "initial_fatigue": {...}, "initial_fitness": {...}}, the
+#                 config dict the notebook uses with dates as ISO strings. the response streams one
+#                 JSON line per week (plan_output.week_record plus the week number) as weeks are
+#                 solved; a failed plan ends with an {"error": ...} line.
+#   GET /status   plans in flight, how many requests joined one of them, how many were turned away.
+#
+# periodization and every weekly solve run on a bounded process pool. plans submit one week at a time,
+# so weeks of concurrent plans interleave on the pool instead of one plan holding a worker for a
+# whole season. identical requests in flight share one computation: a request joining late is sent
+# the weeks solved so far and then follows along. at most max_pending plans are in flight; further
+# requests get 503 with Retry-After right away, so the time to finish a plan is bounded by
+# max_pending / workers seasons rather than by the length of a queue.
+
+default_max_pending = 32
+default_retry_after = 1 # seconds
+max_request_bytes = 1 << 20
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class BadRequest(Exception):
+    pass
+
+
+def parse_request(body):
+    # the planning config for a POST /plan body, with the initial state folded in the way
+    # batch.initial_state reads it
+    try:
+        request = json.loads(body)
+        if not isinstance(request, dict) or "config" not in request:
+            raise ValueError("expected {\"config\": ...}")
+        return batch.config_from_json(request)
+    except ValueError as error:
+        raise BadRequest("invalid plan request: {}".format(error))
+
+
+def request_key(config):
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+# worker side: the library is loaded once per process by batch.init_worker
+
+def periodize(config):
+    return periodization.create_linear_periodization_plan(config)
+
+
+def plan_week(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max):
+    return workout_planner.add_workouts_to_week_plan_matrix(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max)
+
+
+class PlanJob:
+    # one plan in flight and everyone waiting on it
+
+    def __init__(self, key):
+        self.key = key
+        self.weeks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self.changed = asyncio.Condition()
+
+    async def add_week(self, week):
+        async with self.changed:
+            self.weeks.append(week)
+            self.changed.notify_all()
+
+    async def finish(self, error=None):
+        async with self.changed:
+            self.error = error
+            self.done = True
+            self.changed.notify_all()
+
+    async def stream(self):
+        # every week from the first one, then each new one as it is solved
+        position = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: position < len(self.weeks) or self.done)
+                new_weeks = self.weeks[position:]
+                done, error = self.done, self.error
+            for week in new_weeks:
+                yield week
+            position += len(new_weeks)
+            if done and position == len(self.weeks):
+                if error is not None:
+                    raise error
+                return
+
+
+class PlanningService:
+
+    def __init__(self, workers=None, max_pending=default_max_pending, executor=None):
+        # spawned, not forked: forked workers would inherit the server's open sockets and keep
+        # finished responses from closing
+        self.executor = executor or concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=batch.init_worker, initargs=("matrix",)
+        )
+        self.max_pending = max_pending
+        self.jobs = {}
+        self.coalesced = 0
+        self.rejected = 0
+
+    def submit(self, config):
+        # the job planning config, joining one in flight for the same request
+        key = request_key(config)
+        job = self.jobs.get(key)
+        if job is not None:
+            self.coalesced += 1
+        else:
+            if len(self.jobs) >= self.max_pending:
+                self.rejected += 1
+                raise ServiceBusy("{} plans in flight".format(len(self.jobs)))
+            job = PlanJob(key)
+            self.jobs[key] = job
+            job.task = asyncio.ensure_future(self.run(job, config))
+        return job
+
+    async def follow(self, job):
+        # async generator of (week number, week) for a submitted job
+        job.subscribers += 1
+        try:
+            week_number = 0
+            async for week in job.stream():
+                yield week_number, week
+                week_number += 1
+        finally:
+            job.subscribers -= 1
+            # nobody is listening any more: stop submitting weeks
+            if job.subscribers == 0 and not job.done:
+                job.task.cancel()
+
+    def plan(self, config):
+        return self.follow(self.submit(config))
+
+    async def run(self, job, config):
+        loop = asyncio.get_running_loop()
+        error = None
+        try:
+            week_plan = await loop.run_in_executor(self.executor, periodize, config)
+            incoming_fatigue, incoming_fitness = batch.initial_state(config)
+            for week_number, week in enumerate(week_plan):
+                is_last_week_of_block = False
+                if week_number < len(week_plan) - 1:
+                    is_last_week_of_block = week_plan[week_number+1]["start_block"]
+                week = await loop.run_in_executor(self.executor, plan_week, week, incoming_fatigue, incoming_fitness, is_last_week_of_block, config["max_weekly_training"])
+                incoming_fatigue, incoming_fitness = week["fatigue_outcome"], week["fitness_outcome"]
+                await job.add_week(week)
+        except asyncio.CancelledError as cancelled:
+            # followers still get the error, and the task still ends cancelled
+            error = cancelled
+            raise
+        except Exception as failure:
+            error = failure
+        finally:
+            del self.jobs[job.key]
+            await job.finish(error)
+
+    def status(self):
+        return {
+            "in_flight": len(self.jobs),
+            "max_pending": self.max_pending,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected
+        }
+
+    def close(self):
+        for job in list(self.jobs.values()):
+            job.task.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# http
+
+reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+def json_line(data):
+    return (json.dumps(data, default=str) + "\n").encode("utf-8")
+
+
+async def write_response(writer, code, body, headers=()):
+    head = ["HTTP/1.1 {} {}".format(code, reasons[code]), "Content-Type: application/json", "Content-Length: {}".format(len(body)), "Connection: close"]
+    head.extend(headers)
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+def write_chunk(writer, data):
+    chunk = json_line(data)
+    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+
+
+async def stream_plan(writer, service, job):
+    writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+    weeks = service.follow(job)
+    try:
+        async for week_number, week in weeks:
+            record = {"week": week_number}
+            record.update(plan_output.week_record(week))
+            write_chunk(writer, record)
+            await writer.drain()
+    except asyncio.CancelledError:
+        # the client went away or the server is shutting down: end the response if the connection
+        # still takes it, without waiting on the client, and let the cancellation through
+        if not writer.is_closing():
+            write_chunk(writer, {"error": "cancelled"})
+            writer.write(b"0\r\n\r\n")
+        raise
+    except Exception as error:
+        write_chunk(writer, {"error": repr(error)})
+    finally:
+        # stop following the job, which cancels it when nobody else is listening. a generator left
+        # suspended would only let go of it when it is garbage collected.
+        await weeks.aclose()
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+async def handle_connection(service, reader, writer):
+    try:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if len(request_line) < 2:
+            return
+        method, path = request_line[0], request_line[1]
+
+        if path == "/status":
+            await write_response(writer, 200, json_line(service.status()))
+        elif path != "/plan":
+            await write_response(writer, 404, json_line({"error": "not found"}))
+        elif method != "POST":
+            await write_response(writer, 405, json_line({"error": "use POST"}))
+        else:
+            try:
+                length = int(headers.get("content-length", 0))
+            except ValueError:
+                length = -1
+            if length < 0:
+                await write_response(writer, 400, json_line({"error": "invalid Content-Length"}))
+                return
+            if length > max_request_bytes:
+                await write_response(writer, 413, json_line({"error": "request too large"}))
+                return
+            try:
+                # submitted before any header goes out, so a busy service can still answer 503
+                job = service.submit(parse_request(await reader.readexactly(length)))
+            except BadRequest as error:
+                await write_response(writer, 400, json_line({"error": str(error)}))
+                return
+            except ServiceBusy as error:
+                await write_response(writer, 503, json_line({"error": str(error)}), ["Retry-After: {}".format(default_retry_after)])
+                return
+            await stream_plan(writer, service, job)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host="127.0.0.1", port=8080, workers=None, max_pending=default_max_pending):
+    service = PlanningService(workers, max_pending)
+    server = await asyncio.start_server(lambda reader, writer: handle_connection(service, reader, writer), host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="serve training plans over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=None, help="solver processes (default: one per cpu)")
+    parser.add_argument("--max-pending", type=int, default=default_max_pending, help="plans in flight before requests are turned away")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_pending))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
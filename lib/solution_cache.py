@@ -0,0 +1,214 @@
+import collections
+import json
+import sqlite3
+
+import numpy as np
+
+from .workouts import workouts as workout_library
+from . import week_matrix
+from . import workout_planner
+from . import relaxation
+from . import telemetry
+from .week_matrix import sports
+
+
+# memoization in front of the weekly solve.
+#
+# weeks are keyed on everything the weekly model depends on: strategy, is_last_week_of_block,
+# weekly_hours_max, incoming fatigue and fitness rounded to a configurable quantum, and a hash of
+# the workouts available that week. the cache stores which workouts were selected on which day, and
+# the week's relaxation when it could not meet every limit; on a hit fitness_outcome and
+# fatigue_outcome are recomputed from the actual incoming state, so they are exactly what the solver
+# path would report for that selection.
+#
+# states in one quantum have different right hand sides, so a stored selection is checked against
+# the rows for the actual state before it is used. a selection that breaks a row is a miss and the
+# week is solved. a relaxed week may break the rows it relaxed, and no others; its relaxation is
+# reported again with the slack of the actual state.
+
+CacheInfo = collections.namedtuple("CacheInfo", ["hits", "misses", "disk_hits", "maxsize", "currsize"])
+
+
+def quantize(values, quantum):
+    if not quantum:
+        return [float(values[sport]) for sport in sports]
+    return [int(round(values[sport] / quantum)) for sport in sports]
+
+
+class WeeklySolutionCache:
+
+    def __init__(self, maxsize=4096, fatigue_quantum=1.0, fitness_quantum=1.0, path=None):
+        self.maxsize = maxsize
+        self.fatigue_quantum = fatigue_quantum
+        self.fitness_quantum = fitness_quantum
+        self.entries = collections.OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        # optional on-disk store, shared by every cache opened on the same file
+        self.connection = None
+        if path is not None:
+            self.connection = sqlite3.connect(path)
+            self.connection.execute("CREATE TABLE IF NOT EXISTS weekly_solutions (key TEXT PRIMARY KEY, selection TEXT NOT NULL)")
+            self.connection.commit()
+
+    def key(self, strategy, is_last_week_of_block, weekly_hours_max, incoming_fatigue, incoming_fitness, fingerprint):
+        return json.dumps([
+            strategy,
+            bool(is_last_week_of_block),
+            weekly_hours_max,
+            quantize(incoming_fatigue, self.fatigue_quantum),
+            quantize(incoming_fitness, self.fitness_quantum),
+            fingerprint
+        ])
+
+    def lookup(self, key):
+        # (entry, read from disk) for a key, without counting it as a hit or a miss. an entry is a dict
+        # of the selection and the week's relaxation (None when every limit was met).
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            return entry, False
+
+        if self.connection is not None:
+            row = self.connection.execute("SELECT selection FROM weekly_solutions WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                entry = json.loads(row[0])
+                if isinstance(entry, list):
+                    entry = {"selection": entry, "relaxation": None} # stored before entries carried relaxations
+                self.remember(key, entry)
+                return entry, True
+
+        return None, False
+
+    def count(self, entry, from_disk):
+        if entry is None:
+            self.misses += 1
+            return
+        self.hits += 1
+        if from_disk:
+            self.disk_hits += 1
+
+    def get(self, key):
+        entry, from_disk = self.lookup(key)
+        self.count(entry, from_disk)
+        return entry
+
+    def put(self, key, entry):
+        self.remember(key, entry)
+        if self.connection is not None:
+            self.connection.execute("INSERT OR REPLACE INTO weekly_solutions (key, selection) VALUES (?, ?)", (key, json.dumps(entry)))
+            self.connection.commit()
+
+    def remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, self.disk_hits, self.maxsize, len(self.entries))
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def wrap(self, add_workouts_to_week_plan):
+        # returns a drop-in replacement for add_workouts_to_week_plan that answers from the cache when
+        # it can and calls through to the solver otherwise
+        def cached_add_workouts_to_week_plan(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max):
+            lookup_started = telemetry.clock()
+            available_workouts = workout_library.GetWorkoutsForWeek(week["strategy"])
+            key = self.key(week["strategy"], is_last_week_of_block, weekly_hours_max, incoming_fatigue, incoming_fitness, workout_library.library_fingerprint(available_workouts))
+
+            entry, from_disk = self.lookup(key)
+            if entry is not None:
+                matrix = workout_planner.get_week_matrix(available_workouts)
+                hours_limit = week_matrix.weekly_hours_limit(week, is_last_week_of_block, weekly_hours_max)
+                week_relaxation = check_cached_selection(matrix, entry, incoming_fatigue, incoming_fitness, hours_limit)
+                if week_relaxation is False:
+                    entry = None
+            self.count(entry, from_disk)
+            if entry is not None:
+                lookup_finished = telemetry.clock()
+                apply_cached_selection(week, matrix, entry["selection"], incoming_fitness)
+                if week_relaxation is not None:
+                    week["relaxation"] = week_relaxation
+                telemetry.report_week(week, "cache", lookup_finished - lookup_started, 0.0, telemetry.clock() - lookup_finished)
+                return week
+
+            add_workouts_to_week_plan(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max)
+            selection = selection_positions(week, available_workouts)
+            if selection is not None:
+                self.put(key, {"selection": selection, "relaxation": week.get("relaxation")})
+            return week
+
+        return cached_add_workouts_to_week_plan
+
+
+def workout_key(workout):
+    return tuple(workout[field] for field in workout_library.fingerprint_fields)
+
+
+def selection_positions(week, available_workouts):
+    # the solved week as positions into the available workouts, one list per day. engines may hand back
+    # equal copies rather than the catalog's records, so workouts not found by identity are looked up
+    # by their fields. None when a workout is not available at all; such weeks are not cached.
+    positions = {id(workout): workout_id for workout_id, workout in enumerate(available_workouts)}
+    by_key = {}
+    selection = []
+    for day_workouts in week["workouts"]:
+        day_positions = []
+        for workout in day_workouts:
+            workout_id = positions.get(id(workout))
+            if workout_id is None:
+                if not by_key:
+                    by_key = {workout_key(available): workout_id for workout_id, available in reversed(list(enumerate(available_workouts)))}
+                workout_id = by_key.get(workout_key(workout))
+                if workout_id is None:
+                    return None
+            day_positions.append(workout_id)
+        selection.append(day_positions)
+    return selection
+
+
+def selection_values(matrix, selection):
+    values = np.zeros((week_matrix.number_of_days, matrix.number_of_workouts))
+    for day, workout_ids in enumerate(selection):
+        values[day, workout_ids] = 1
+    return values
+
+
+def check_cached_selection(matrix, entry, incoming_fatigue, incoming_fitness, weekly_hours_limit):
+    # the relaxation to report for a stored selection in the actual state: None when it meets every
+    # row, the stored relaxation with the actual slack when it only breaks rows that were relaxed, and
+    # False when it cannot be used
+    b = matrix.rhs(incoming_fatigue, incoming_fitness, weekly_hours_limit)
+    excess = matrix.A @ selection_values(matrix, entry["selection"]).ravel() - b
+    broken = set(np.flatnonzero(excess > relaxation.feasibility_tolerance).tolist())
+    stored = entry.get("relaxation")
+    if stored is None:
+        return None if not broken else False
+
+    relaxed = [matrix.row_groups[row["constraint"]].start + row["row"] for row in stored["relaxed_rows"]]
+    if not broken <= set(relaxed):
+        return False
+    # in the stored order, so a hit reports its rows as the solve did
+    broken = np.array([row for row in relaxed if row in broken], dtype=int)
+    week_relaxation = dict(stored)
+    week_relaxation["failed_checks"] = relaxation.precheck(matrix.columns, incoming_fatigue, incoming_fitness, weekly_hours_limit) if stored["failed_checks"] else []
+    week_relaxation["relaxed_rows"] = relaxation.relaxed_rows(matrix, broken, excess[broken])
+    return week_relaxation
+
+
+def apply_cached_selection(week, matrix, selection, incoming_fitness):
+    return week_matrix.apply_selection_to_week(week, matrix.columns, selection_values(matrix, selection), incoming_fitness)
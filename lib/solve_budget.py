@@ -0,0 +1,183 @@
+import numpy as np
+
+from .workouts import workouts as workout_library
+from . import batch
+from . import periodization
+from . import workout_planner
+from . import week_matrix
+from . import week_search
+from . import solvers
+from . import telemetry
+
+
+# one time budget for a whole plan instead of a fixed time limit per solve.
+#
+# SolveBudget takes the seconds a plan may use and hands every week a time limit out of what is left:
+# the remaining time is split over the remaining weeks in proportion to how long weeks of their
+# strategy have taken so far, so hard weeks get more than easy ones and the plan still ends on time.
+# solves stop at a relative MIP gap, and a week that runs out of time keeps the solver's best
+# incumbent. a week the solver found nothing for within its limit, or that starts after the deadline,
+# is filled by the branch and bound search of week_search with a node limit.
+#
+# every week is marked in week["solve_budget"]["quality"]:
+#   optimal      solved to optimality
+#   gap_limited  the solver's incumbent, within mip_gap of optimal or stopped by the time limit
+#                (week["solve_budget"]["mip_gap"] has the gap it reached, None for glpk, which does
+#                not report it)
+#   heuristic    the search's best week, without a bound
+#   relaxed      a week no selection meets every limit of, solved softened (see relaxation.py and
+#                week["relaxation"])
+
+default_mip_gap = 1e-3
+default_min_week_seconds = .2 # no week gets less, even when the budget is spent
+default_week_seconds = 1.0 # expected solve time of a strategy before any of its weeks was solved
+difficulty_smoothing = .5 # weight of the latest week in a strategy's expected solve time
+heuristic_node_limit = 2000
+
+quality_optimal = "optimal"
+quality_gap_limited = "gap_limited"
+quality_heuristic = "heuristic"
+quality_relaxed = "relaxed"
+
+optimal_gap = 1e-9
+
+
+class SolveBudget:
+
+    def __init__(self, total_seconds, week_plan, mip_gap=default_mip_gap, solver=None, min_week_seconds=default_min_week_seconds):
+        self.total_seconds = total_seconds
+        self.deadline = telemetry.clock() + total_seconds
+        self.strategies = [week["strategy"] for week in week_plan]
+        self.mip_gap = mip_gap
+        self.solver = solver
+        self.min_week_seconds = min_week_seconds
+        self.week_number = 0
+        self.difficulty = {} # strategy -> expected solve seconds
+
+    def remaining_seconds(self):
+        return self.deadline - telemetry.clock()
+
+    def expected_seconds(self, strategy):
+        if strategy in self.difficulty:
+            return self.difficulty[strategy]
+        if self.difficulty:
+            return float(np.mean(list(self.difficulty.values())))
+        return default_week_seconds
+
+    def week_time_limit(self):
+        # this week's share of the remaining time, weighed by the expected time of every week left
+        remaining_weeks = self.strategies[self.week_number:] or [None]
+        expected = [self.expected_seconds(strategy) for strategy in remaining_weeks]
+        remaining = self.remaining_seconds()
+        share = remaining * expected[0] / sum(expected)
+        # leave every later week at least its minimum
+        cap = remaining - self.min_week_seconds * (len(remaining_weeks) - 1)
+        return max(self.min_week_seconds, min(share, cap))
+
+    def observe(self, strategy, seconds, timed_out):
+        # a week that hit its limit would have taken at least twice as long as we gave it, as a guess
+        observed = seconds * 2 if timed_out else seconds
+        previous = self.difficulty.get(strategy)
+        self.difficulty[strategy] = observed if previous is None else (1 - difficulty_smoothing) * previous + difficulty_smoothing * observed
+
+    def backend(self, time_limit):
+        # a backend per week, since the time limit changes from week to week. a backend instance is
+        # copied with its options, as solvers.get_exact_backend does, with the gap and limit set here.
+        backend = solvers.get_backend(self.solver, time_limit)
+        if backend.name not in solvers.gap_options or not hasattr(backend, "options"):
+            return backend
+        options = dict(backend.options)
+        options[solvers.gap_options[backend.name]] = self.mip_gap
+        return solvers.backends[backend.name](time_limit=time_limit, options=options)
+
+    def add_workouts_to_week_plan(self, week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max):
+        # same inputs and outputs as add_workouts_to_week_plan, for weeks planned in order
+
+        build_started = telemetry.clock()
+        available_workouts = workout_library.GetWorkoutsForWeek(week["strategy"])
+
+        matrix = workout_planner.get_week_matrix(available_workouts)
+        hours_limit = week_matrix.weekly_hours_limit(week, is_last_week_of_block, weekly_hours_max)
+
+        time_limit = self.week_time_limit()
+        solve_started = telemetry.clock()
+        relaxed = workout_planner.add_relaxed_workouts_if_precheck_fails(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, self.backend(time_limit), "budget", build_started)
+        if relaxed is not None:
+            return self.mark_relaxed(relaxed, time_limit, solve_started)
+        b = matrix.rhs(incoming_fatigue, incoming_fitness, hours_limit)
+
+        engine = None
+        results = None
+        if self.remaining_seconds() > self.min_week_seconds:
+            backend = self.backend(time_limit)
+            engine = backend.name
+            results = backend.solve_arrays(matrix.c, matrix.A, b)
+        solve_finished = telemetry.clock()
+
+        if results is not None and results.has_solution():
+            values = results.values
+            # a backend that does not report its gap (glpk with a gap option) is only gap_limited
+            optimal = results.status == solvers.status_optimal and results.mip_gap is not None and results.mip_gap <= optimal_gap
+            quality = quality_optimal if optimal else quality_gap_limited
+            mip_gap = results.mip_gap
+        else:
+            # nothing within the limit: the search's best week
+            search = week_search.WeekSearch(matrix, b).run(heuristic_node_limit)
+            if search.values is None:
+                # no week meets every limit, or none was found in time
+                reason = results.status if results is not None else "budget spent"
+                relaxed = workout_planner.add_relaxed_workouts_to_week_plan(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, self.backend(time_limit), None, reason, "budget", build_started)
+                return self.mark_relaxed(relaxed, time_limit, solve_started)
+            values = search.values
+            quality = quality_optimal if search.proven_optimal else quality_heuristic
+            mip_gap = None
+            engine = "search"
+        search_finished = telemetry.clock()
+
+        timed_out = results is not None and results.termination_condition == solvers.TerminationCondition.maxTimeLimit
+        self.observe(week["strategy"], solve_finished - solve_started, timed_out)
+        self.week_number += 1
+
+        #parse results and add workouts to week
+        selection = week_matrix.selection_from_solution(matrix, values)
+        week_matrix.apply_selection_to_week(week, matrix.columns, selection, incoming_fitness)
+
+        week["solve_budget"] = {
+            "quality": quality,
+            "engine": engine,
+            "time_limit": time_limit,
+            "solve_seconds": search_finished - solve_started,
+            "mip_gap": mip_gap,
+            "remaining_seconds": self.remaining_seconds()
+        }
+
+        telemetry.report_week(
+            week, "budget", solve_started - build_started, search_finished - solve_started, telemetry.clock() - search_finished,
+            results, telemetry.matrix_counts(matrix), solver=engine, quality=quality, time_limit=time_limit
+        )
+
+        return week
+
+    def mark_relaxed(self, week, time_limit, solve_started):
+        # a week solved softened by workout_planner.add_relaxed_workouts_to_week_plan
+        solve_seconds = telemetry.clock() - solve_started
+        self.observe(week["strategy"], solve_seconds, False)
+        self.week_number += 1
+        week["solve_budget"] = {
+            "quality": quality_relaxed,
+            "engine": self.backend(time_limit).name,
+            "time_limit": time_limit,
+            "solve_seconds": solve_seconds,
+            "mip_gap": None,
+            "remaining_seconds": self.remaining_seconds()
+        }
+        return week
+
+
+def create_training_plan_with_budget(config, total_seconds, mip_gap=default_mip_gap, solver=None):
+    # batch.create_training_plan within total_seconds, periodization included
+    started = telemetry.clock()
+    week_plan = periodization.create_linear_periodization_plan(config)
+    budget = SolveBudget(total_seconds - (telemetry.clock() - started), week_plan, mip_gap, solver)
+    incoming_fatigue, incoming_fitness = batch.initial_state(config)
+    return workout_planner.add_workouts_to_weeks(week_plan, incoming_fatigue, incoming_fitness, config["max_weekly_training"], budget.add_workouts_to_week_plan)
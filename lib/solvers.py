@@ -0,0 +1,337 @@
+import enum
+import importlib.util
+import os
+import tempfile
+
+import numpy as np
+
+
+# solver backends for the planning models.
+#
+# a backend solves either a pyomo model (solve_model) or a binary maximization problem given as
+# arrays, maximize c @ x subject to A @ x <= b (solve_arrays), optionally with continuous columns
+# x >= 0 at the end. backends carry their own time limit and options, so callers pick the solver per
+# call instead of hard-coding glpk and tmlim.
+#
+#   glpk  - writes an LP file and runs glpsol through pyomo, as the planner always has
+#   highs - runs HiGHS in process through highspy, no files and no subprocess
+#
+# pyomo and highspy are imported the first time a backend needs them, so code that only builds or
+# reads plans does not pay for them. solving arrays with highs never imports pyomo.
+
+status_optimal = "optimal"
+status_feasible = "feasible" # stopped early (time or gap limit) with an incumbent
+status_infeasible = "infeasible"
+status_no_solution = "no_solution"
+
+
+class TerminationCondition(str, enum.Enum):
+    # termination conditions of array solves that never go through pyomo, named like pyomo's
+    optimal = "optimal"
+    infeasible = "infeasible"
+    maxTimeLimit = "maxTimeLimit"
+    other = "other"
+
+    def __str__(self):
+        return self.value
+
+
+def load_highspy():
+    import highspy
+    return highspy
+
+
+def highspy_available():
+    return importlib.util.find_spec("highspy") is not None
+
+
+class SolveResult:
+
+    def __init__(self, status, termination_condition, values=None, objective=None, mip_gap=None, duals=None):
+        self.status = status
+        self.termination_condition = termination_condition
+        self.values = values
+        self.objective = objective
+        self.mip_gap = mip_gap
+        self.duals = duals # relaxed solves only: change of the objective per unit of each row's b
+
+    def has_solution(self):
+        return self.status in (status_optimal, status_feasible)
+
+
+def status_from_termination(termination_condition, has_solution):
+    # by name, so pyomo's enums and TerminationCondition read the same
+    name = getattr(termination_condition, "name", termination_condition)
+    if name == "optimal":
+        return status_optimal
+    if name in ("infeasible", "infeasibleOrUnbounded"):
+        return status_infeasible
+    if has_solution:
+        return status_feasible
+    return status_no_solution
+
+
+feasibility_tolerance = 1e-7 # how far below 0 the rhs of a row without terms may be, highs's default
+
+def infeasible_empty_rows(A, b):
+    # rows without terms whose rhs is below 0: 0 <= b can never hold, whatever x is
+    A = A.tocsr()
+    return np.flatnonzero((np.diff(A.indptr) == 0) & (np.asarray(b, dtype=np.float64) < -feasibility_tolerance))
+
+
+def write_lp(c, A, b, file, relaxed=False, continuous_columns=0):
+    # CPLEX LP file for maximize c @ x, A @ x <= b, x binary (0 <= x <= 1 when relaxed), one term per
+    # line as pyomo writes them. variables are named x<column>, rows r<row>. rows without terms are
+    # skipped, which needs them to be satisfied (b >= 0): rows that are not (infeasible_empty_rows) are
+    # an error, so they never silently drop out. the last continuous_columns variables are continuous,
+    # x >= 0.
+    infeasible_rows = infeasible_empty_rows(A, b)
+    if len(infeasible_rows) > 0:
+        raise ValueError("rows {} have no terms and a negative right hand side".format(infeasible_rows.tolist()))
+    number_of_variables = len(c)
+    number_of_binaries = number_of_variables - continuous_columns
+    term_names = ["x{}".format(col) for col in range(number_of_variables)]
+
+    def terms(coefs, cols):
+        return "".join("{}{!r} {}\n".format("+" if coef >= 0 else "", coef, term_names[col]) for coef, col in zip(coefs, cols))
+
+    file.write("\\* binary maximization problem *\\\n\nmaximize\nobj:\n")
+    file.write(terms(np.asarray(c, dtype=np.float64).tolist(), range(number_of_variables)))
+    file.write("\nsubject to\n")
+
+    A = A.tocsr()
+    indptr = A.indptr.tolist()
+    indices = A.indices.tolist()
+    data = A.data.tolist()
+    upper_bounds = np.asarray(b, dtype=np.float64).tolist()
+    for row in range(A.shape[0]):
+        start, end = indptr[row], indptr[row + 1]
+        if start == end:
+            continue
+        file.write("\nr{}:\n".format(row))
+        file.write(terms(data[start:end], indices[start:end]))
+        file.write("<= {!r}\n".format(upper_bounds[row]))
+
+    # continuous columns keep the LP format's default bounds, 0 <= x
+    if relaxed:
+        file.write("\nbounds\n")
+        file.write("".join("0 <= {} <= 1\n".format(name) for name in term_names[:number_of_binaries]))
+    else:
+        file.write("\nbinary\n")
+        file.write("".join(name + "\n" for name in term_names[:number_of_binaries]))
+    file.write("\nend\n")
+
+
+class GlpkBackend:
+    name = "glpk"
+    takes_start = False # glpsol reads no MIP start
+
+    def __init__(self, time_limit=None, options=None):
+        self.time_limit = time_limit
+        self.options = dict(options or {})
+
+    def available(self):
+        import pyomo.environ as pyo
+        return bool(pyo.SolverFactory('glpk').available(exception_flag=False))
+
+    def solver(self):
+        import pyomo.environ as pyo
+        solver = pyo.SolverFactory('glpk')
+        for key, value in self.options.items():
+            solver.options[key] = value
+        if self.time_limit is not None:
+            solver.options['tmlim'] = self.time_limit
+        return solver
+
+    def solve_model(self, model):
+        # loading the solutions into the model clears them from the results, so they are loaded here,
+        # after the results have told whether a time limited solve found one
+        results = self.solver().solve(model, load_solutions=False)
+        termination_condition = results.solver.termination_condition
+        has_solution = len(results.solution) > 0
+        if has_solution:
+            model.solutions.load_from(results)
+        return SolveResult(status_from_termination(termination_condition, has_solution), termination_condition)
+
+    def solve_arrays(self, c, A, b, relaxed=False, start=None, continuous_columns=0):
+        # one LP file written straight from the arrays, read by glpsol. glpsol takes no MIP start, so
+        # start is ignored. a row without terms and a negative rhs cannot be written to the file, and
+        # makes the problem infeasible without asking glpsol.
+        if len(infeasible_empty_rows(A, b)) > 0:
+            return SolveResult(status_infeasible, TerminationCondition.infeasible)
+        with tempfile.TemporaryDirectory() as directory:
+            lp_path = os.path.join(directory, "model.lp")
+            with open(lp_path, "wt") as file:
+                write_lp(c, A, b, file, relaxed, continuous_columns)
+            results = self.solver().solve(lp_path)
+
+        termination_condition = results.solver.termination_condition
+        status = status_from_termination(termination_condition, len(results.solution) > 0)
+        if status not in (status_optimal, status_feasible):
+            return SolveResult(status, termination_condition)
+
+        solution = results.solution(0)
+        values = np.zeros(len(c), dtype=np.float64)
+        for name, data in solution.variable.items():
+            values[int(name[1:])] = data["Value"]
+        objective = next(iter(solution.objective.values()))["Value"] if len(solution.objective) > 0 else None
+        # glpsol does not report the gap it stopped at: "optimal" is only exact when no gap was allowed
+        mip_gap = 0.0 if status == status_optimal and (relaxed or not self.options.get(gap_options[self.name])) else None
+        return SolveResult(status, termination_condition, values, objective, mip_gap)
+
+
+class HighsBackend:
+    name = "highs"
+    takes_start = True
+
+    def __init__(self, time_limit=None, options=None):
+        self.time_limit = time_limit
+        self.options = dict(options or {})
+
+    def available(self):
+        return highspy_available()
+
+    def solve_model(self, model):
+        import pyomo.environ as pyo
+        solver = pyo.SolverFactory('appsi_highs')
+        solver.config.time_limit = self.time_limit
+        solver.highs_options = dict(self.options)
+        results = solver.solve(model, load_solutions=False)
+        termination_condition = results.solver.termination_condition
+
+        # the legacy results report the incumbent as the lower bound of a maximization and the upper
+        # bound of a minimization
+        if model_sense_is_max(model):
+            objective, objective_bound = results.problem.lower_bound, results.problem.upper_bound
+        else:
+            objective, objective_bound = results.problem.upper_bound, results.problem.lower_bound
+        has_solution = objective is not None and np.isfinite(objective)
+
+        status = status_from_termination(termination_condition, has_solution)
+        if not has_solution:
+            return SolveResult(status, termination_condition)
+
+        solver.load_vars()
+        snap_integer_values(model)
+        mip_gap = None
+        if objective_bound is not None and np.isfinite(objective_bound):
+            mip_gap = abs(objective_bound - objective) / max(abs(objective), 1e-10)
+        return SolveResult(status, termination_condition, objective=objective, mip_gap=mip_gap)
+
+    def solve_arrays(self, c, A, b, relaxed=False, start=None, continuous_columns=0):
+        # relaxed solves the LP relaxation; start is a 0/1 vector handed to HiGHS as a MIP start. the
+        # last continuous_columns variables are continuous, x >= 0.
+        highspy = load_highspy()
+        A = A.tocsc()
+        number_of_variables = len(c)
+        number_of_binaries = number_of_variables - continuous_columns
+
+        lp = highspy.HighsLp()
+        lp.num_col_ = number_of_variables
+        lp.num_row_ = A.shape[0]
+        lp.sense_ = highspy.ObjSense.kMaximize
+        lp.col_cost_ = np.asarray(c, dtype=np.float64)
+        lp.col_lower_ = np.zeros(number_of_variables)
+        lp.col_upper_ = np.concatenate([np.ones(number_of_binaries), np.full(continuous_columns, highspy.kHighsInf)])
+        lp.row_lower_ = np.full(A.shape[0], -highspy.kHighsInf)
+        lp.row_upper_ = np.asarray(b, dtype=np.float64)
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_ = A.indptr
+        lp.a_matrix_.index_ = A.indices
+        lp.a_matrix_.value_ = A.data
+        if not relaxed:
+            lp.integrality_ = [highspy.HighsVarType.kInteger] * number_of_binaries + [highspy.HighsVarType.kContinuous] * continuous_columns
+
+        highs = highspy.Highs()
+        highs.setOptionValue("output_flag", False)
+        if self.time_limit is not None:
+            highs.setOptionValue("time_limit", float(self.time_limit))
+        for key, value in self.options.items():
+            highs.setOptionValue(key, value)
+        highs.passModel(lp)
+        if start is not None and not relaxed:
+            solution = highspy.HighsSolution()
+            solution.col_value = np.asarray(start, dtype=np.float64)
+            solution.value_valid = True
+            highs.setSolution(solution)
+        highs.run()
+
+        model_status = highs.getModelStatus()
+        info = highs.getInfo()
+        has_solution = info.primal_solution_status == highspy.kSolutionStatusFeasible
+
+        if model_status == highspy.HighsModelStatus.kOptimal:
+            status, termination_condition = status_optimal, TerminationCondition.optimal
+        elif model_status == highspy.HighsModelStatus.kInfeasible:
+            status, termination_condition = status_infeasible, TerminationCondition.infeasible
+        elif model_status == highspy.HighsModelStatus.kTimeLimit:
+            status, termination_condition = (status_feasible if has_solution else status_no_solution), TerminationCondition.maxTimeLimit
+        else:
+            status, termination_condition = (status_feasible if has_solution else status_no_solution), TerminationCondition.other
+
+        if not has_solution:
+            return SolveResult(status, termination_condition)
+
+        solution = highs.getSolution()
+        values = np.array(solution.col_value, dtype=np.float64)
+        if relaxed:
+            duals = np.array(solution.row_dual, dtype=np.float64) if solution.dual_valid else None
+            return SolveResult(status, termination_condition, values, info.objective_function_value, 0.0, duals)
+        nearest = np.round(values[:number_of_binaries])
+        values[:number_of_binaries] = np.where(np.abs(values[:number_of_binaries] - nearest) <= 1e-6, nearest, values[:number_of_binaries]) # same snapping as snap_integer_values
+        return SolveResult(status, termination_condition, values, info.objective_function_value, info.mip_gap)
+
+
+def snap_integer_values(model, tolerance=1e-6):
+    # HiGHS reports integer columns within its feasibility tolerance (0.9999999 for 1); snap them so
+    # code comparing .value == 1 keeps working
+    import pyomo.environ as pyo
+    for variable in model.component_data_objects(pyo.Var, active=True):
+        if variable.is_integer() and variable.value is not None:
+            nearest = round(variable.value)
+            if abs(variable.value - nearest) <= tolerance:
+                variable.set_value(nearest, skip_validation=True)
+
+
+def model_sense_is_max(model):
+    import pyomo.environ as pyo
+    objective = next(model.component_data_objects(pyo.Objective, active=True))
+    return objective.sense == pyo.maximize
+
+
+backends = {
+    "glpk": GlpkBackend,
+    "highs": HighsBackend
+}
+
+def default_backend_name():
+    # in process HiGHS when highspy is installed, otherwise the glpsol executable
+    return "highs" if highspy_available() else "glpk"
+
+gap_options = {
+    # the relative MIP gap option of each backend
+    "glpk": "mipgap",
+    "highs": "mip_rel_gap"
+}
+
+def get_backend(solver=None, time_limit=None, options=None):
+    # solver may be a backend instance (used as is), a backend name, or None for the default backend.
+    # time_limit and options only apply when the backend is created here.
+    if solver is None:
+        solver = default_backend_name()
+    if isinstance(solver, str):
+        if solver not in backends:
+            raise ValueError("unknown solver backend {}, expected one of {}".format(solver, list(backends)))
+        return backends[solver](time_limit=time_limit, options=options)
+    return solver
+
+def get_exact_backend(solver=None, time_limit=None):
+    # get_backend with the relative MIP gap at 0, for objectives whose small terms only break ties: at
+    # the default gap (1e-4 of the objective for highs) the solver may stop before it looks at them.
+    # a backend instance is copied with its time limit and options.
+    backend = get_backend(solver, time_limit)
+    if backend.name not in gap_options or not hasattr(backend, "options"):
+        return backend
+    options = dict(backend.options)
+    options[gap_options[backend.name]] = 0
+    return backends[backend.name](time_limit=backend.time_limit, options=options)
@@ -0,0 +1,183 @@
+import collections
+import concurrent.futures
+import os
+
+import numpy as np
+
+from .workouts import workouts as workout_library
+from . import batch
+from . import periodization
+from . import workout_planner
+from . import week_matrix
+from . import solvers
+from . import telemetry
+
+
+# speculative parallel planning of the week chain.
+#
+# every week starts from the outcomes of the week before, so weeks are solved one after the other.
+# here every week in a lookahead window is solved at once on a process pool, each from a guessed
+# incoming state, and weeks are committed in order:
+#
+#   1. roll the chain forward from the last committed week: every uncommitted week's incoming state is
+#      the outcome of the newest selection of the week before, and gives its right hand side b. for a
+#      week before that is not solved yet, the outcome is predicted: a guess_plan's outcomes when there
+#      is one, otherwise the outcome of the week's strategy's typical selection (the selection of the
+#      newest committed week of that strategy) from the guessed state, otherwise the state carried
+#      unchanged
+#   2. solve, in parallel, every week in the window whose last solve used a b more than tolerance
+#      away from its b now. the window starts at lookahead weeks and then follows how many weeks the
+#      last round committed, never below the number of workers
+#   3. commit weeks in order while the b a week was solved with matches the b of its true incoming
+#      state, computed from the committed weeks
+#
+# the first uncommitted week always starts from its true state, so every round commits at least one
+# week. the weekly model only sees the incoming state through b, so a week solved with the b of its
+# true incoming state is the week the sequential matrix engine plans, and with the default tolerance
+# the plan equals the sequential one. a larger tolerance commits weeks solved from nearby states,
+# which saves solves but may pick other selections than the sequential plan.
+#
+# guesses pay off when the chain is predictable. weeks of one strategy see the same workouts and
+# mostly the same limits, so they often repeat the selection before them, and a prediction from the
+# strategy's typical selection gives the exact b of the week after. weeks solved from a carried state
+# alone rarely match, since a slightly different b usually makes the solver pick another of the
+# week's optimal selections. rounds is the number of solves one after the other, and
+# critical_path_seconds the time they take (the slowest solve of every round, added up): what the plan
+# takes with enough workers. the sequential engine takes one solve per week.
+#
+# a week with no solution from its true state is planned by add_workouts_to_week_plan_matrix when it
+# is committed, which solves it softened as the sequential engine does.
+
+default_tolerance = 1e-9
+default_time_limit = 10 # as add_workouts_to_week_plan_matrix
+
+Speculation = collections.namedtuple("Speculation", ["week_plan", "rounds", "solves", "solve_seconds", "critical_path_seconds"])
+
+WeekSolve = collections.namedtuple("WeekSolve", ["b", "values", "solve_seconds", "error"])
+
+
+def week_problem(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max):
+    matrix = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(week["strategy"]))
+    return matrix, matrix.rhs(incoming_fatigue, incoming_fitness, week_matrix.weekly_hours_limit(week, is_last_week_of_block, weekly_hours_max))
+
+
+def same_problem(solve, b, tolerance):
+    return solve is not None and float(np.max(np.abs(solve.b - b), initial=0.0)) <= tolerance
+
+
+# worker side
+
+def init_worker(library_paths):
+    # the library the plan is made from, which spawned workers would not inherit
+    workout_library.use_library(*library_paths)
+    workout_library.fetch_workouts_with_cache()
+
+
+def solve_week(task):
+    strategy, b, solver = task
+    matrix = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(strategy))
+    backend = solvers.get_backend(solver, time_limit=default_time_limit)
+    solve_started = telemetry.clock()
+    results = backend.solve_arrays(matrix.c, matrix.A, b)
+    solve_seconds = telemetry.clock() - solve_started
+    if not results.has_solution():
+        # a guessed state may well be infeasible; only the week's true state has to have a solution
+        return WeekSolve(b, None, solve_seconds, "{} returned no solution ({})".format(backend.name, results.termination_condition))
+    return WeekSolve(b, results.values, solve_seconds, None)
+
+
+def add_workouts_to_weeks_speculative(week_plan, incoming_fatigue, incoming_fitness, weekly_hours_max, workers=None, solver=None,
+                                      tolerance=default_tolerance, lookahead=None, guess_plan=None):
+    # same result as add_workouts_to_weeks with the matrix engine. guess_plan, a planned season of the
+    # same weeks (an earlier plan of the athlete, say), seeds the guesses of weeks not solved yet.
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if lookahead is None:
+        lookahead = 2 * max(workers, 1)
+    solver_name = solver if solver is None or isinstance(solver, str) else solver.name # backends are not sent to workers
+
+    number_of_weeks = len(week_plan)
+    is_last_week_of_block = [week_number < number_of_weeks - 1 and week_plan[week_number+1]["start_block"] for week_number in range(number_of_weeks)]
+    solved = [None] * number_of_weeks
+    solves = [0] * number_of_weeks
+    typical_selections = {} # strategy -> selection of its newest committed week
+    committed = 0
+    rounds = 0
+    solve_seconds = 0.0
+    critical_path_seconds = 0.0
+    window = lookahead
+
+    executor = None
+    if workers > 0:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(workout_library.default_catalog.paths,))
+    try:
+        while committed < number_of_weeks:
+            rounds += 1
+
+            # 1. guessed right hand sides, rolled forward from the committed state
+            tasks = []
+            fatigue, fitness = incoming_fatigue, incoming_fitness
+            for week_number in range(committed, min(committed + window, number_of_weeks)):
+                week = week_plan[week_number]
+                matrix, b = week_problem(week, fatigue, fitness, is_last_week_of_block[week_number], weekly_hours_max)
+                if not same_problem(solved[week_number], b, tolerance):
+                    tasks.append((week_number, (week["strategy"], b, solver_name)))
+
+                selection = None
+                if solved[week_number] is not None and solved[week_number].values is not None:
+                    selection = week_matrix.selection_from_solution(matrix, solved[week_number].values)
+                elif guess_plan is not None:
+                    fatigue, fitness = guess_plan[week_number]["fatigue_outcome"], guess_plan[week_number]["fitness_outcome"]
+                else:
+                    selection = typical_selections.get(week["strategy"])
+                if selection is not None:
+                    guess = week_matrix.apply_selection_to_week({}, matrix.columns, selection, fitness)
+                    fatigue, fitness = guess["fatigue_outcome"], guess["fitness_outcome"]
+
+            # 2. solve the weeks whose guess changed
+            results = map(solve_week, [task for _, task in tasks]) if executor is None else executor.map(solve_week, [task for _, task in tasks])
+            round_seconds = 0.0
+            for (week_number, _), week_solve in zip(tasks, results):
+                solved[week_number] = week_solve
+                solves[week_number] += 1
+                solve_seconds += week_solve.solve_seconds
+                round_seconds = max(round_seconds, week_solve.solve_seconds)
+            critical_path_seconds += round_seconds
+
+            # 3. commit in order while the guesses held
+            committed_before = committed
+            while committed < number_of_weeks:
+                week = week_plan[committed]
+                matrix, b = week_problem(week, incoming_fatigue, incoming_fitness, is_last_week_of_block[committed], weekly_hours_max)
+                if not same_problem(solved[committed], b, tolerance):
+                    break
+                if solved[committed].values is None:
+                    # no solution from the true state: relaxed as by the sequential engine
+                    workout_planner.add_workouts_to_week_plan_matrix(week, incoming_fatigue, incoming_fitness, is_last_week_of_block[committed], weekly_hours_max, solver=solver)
+                else:
+                    extract_started = telemetry.clock()
+                    selection = week_matrix.selection_from_solution(matrix, solved[committed].values)
+                    week_matrix.apply_selection_to_week(week, matrix.columns, selection, incoming_fitness)
+                    typical_selections[week["strategy"]] = selection
+                    telemetry.report_week(
+                        week, "speculative", 0.0, solved[committed].solve_seconds, telemetry.clock() - extract_started,
+                        counts=telemetry.matrix_counts(matrix), solver=solver_name, solves=solves[committed], committed_in_round=rounds
+                    )
+                incoming_fatigue, incoming_fitness = week["fatigue_outcome"], week["fitness_outcome"]
+                committed += 1
+
+            # speculate further while guesses hold, and no further than the idle workers when they do not
+            window = min(lookahead, max(workers, 1, 2 * (committed - committed_before)))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return Speculation(week_plan, rounds, sum(solves), solve_seconds, critical_path_seconds)
+
+
+def create_training_plan_speculative(config, workers=None, solver=None, tolerance=default_tolerance, lookahead=None, guess_plan=None):
+    week_plan = periodization.create_linear_periodization_plan(config)
+    incoming_fatigue, incoming_fitness = batch.initial_state(config)
+    return add_workouts_to_weeks_speculative(
+        week_plan, incoming_fatigue, incoming_fitness, config["max_weekly_training"], workers, solver, tolerance, lookahead, guess_plan
+    )
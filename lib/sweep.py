@@ -0,0 +1,242 @@
+import collections
+import concurrent.futures
+import os
+
+import numpy as np
+
+from .workouts import workouts as workout_library
+from . import batch
+from . import periodization
+from . import workout_planner
+from . import week_matrix
+from . import relaxation
+from . import solvers
+from .replan import unplanned_copy
+from .week_matrix import sports
+
+
+# what-if sweeps over the weekly limits.
+#
+# a sweep point is the season planned with one limit changed: weekly_hours_max (the config's
+# max_weekly_training), fatigue_upper_bound, total_fatigue_upper_bound or max_divergence. the season
+# is planned once at the configured limits, keeping every week's selection x0, its right hand side b0
+# and the row duals y0 of its LP relaxation. a sweep point then walks the season again and, for each
+# week, computes its right hand side b from the changed limit and the incoming state. the stored
+# selection is reused without a solve when it is provably still optimal:
+#
+#   b <= b0 and A x0 <= b           the feasible set only shrank and still holds x0
+#   A x0 <= b and the LP bound      the LP value is concave in b, so lp0 + y0 (b - b0) bounds the LP
+#   lp0 + y0 (b - b0) leaves no     (and with it the MILP) at b; inside the ranging interval of the
+#   room above c x0                 basis the bound is exact. objective values lie on the grid of the
+#                                   fitness increases, so a bound below c x0 + one step is enough.
+#
+# every other week is solved again, warm started from x0 when x0 is still feasible. once a week picks
+# a different selection the incoming state of the weeks after it changes, and their b is compared with
+# b0 in the same way. sweep points are independent and run in parallel on a process pool.
+#
+# a week that cannot meet the changed limits (a fatigue limit below the incoming fatigue, say) is
+# solved softened, as by the weekly engines, and reports it as week["relaxation"].
+
+parameters = ("weekly_hours_max", "fatigue_upper_bound", "total_fatigue_upper_bound", "max_divergence")
+
+# the names these limits have in the pyomo model and the config
+parameter_aliases = {
+    "max_weekly_training": "weekly_hours_max",
+    "FatigueUpperBound": "fatigue_upper_bound",
+    "TotalFatigueUpperBound": "total_fatigue_upper_bound"
+}
+
+feasibility_tolerance = 1e-6
+
+WeekSensitivity = collections.namedtuple("WeekSensitivity", ["values", "objective", "lp_objective", "duals", "b"])
+
+
+def parameter_name(parameter):
+    parameter = parameter_aliases.get(parameter, parameter)
+    if parameter not in parameters:
+        raise ValueError("unknown sweep parameter {}, expected one of {}".format(parameter, list(parameters)))
+    return parameter
+
+
+def base_limits(config):
+    return {
+        "weekly_hours_max": config["max_weekly_training"],
+        "fatigue_upper_bound": week_matrix.fatigue_upper_bound,
+        "total_fatigue_upper_bound": week_matrix.total_fatigue_upper_bound,
+        "max_divergence": week_matrix.max_divergence
+    }
+
+
+def row_limits(limits):
+    # the limits taken by WeekMatrix.rhs and relaxation.precheck as keywords
+    return {
+        "fatigue_upper_bound": limits["fatigue_upper_bound"],
+        "total_fatigue_upper_bound": limits["total_fatigue_upper_bound"],
+        "max_divergence": limits["max_divergence"]
+    }
+
+
+def week_rhs(matrix, week, incoming_fatigue, incoming_fitness, is_last_week_of_block, limits):
+    return matrix.rhs(
+        incoming_fatigue, incoming_fitness, week_matrix.weekly_hours_limit(week, is_last_week_of_block, limits["weekly_hours_max"]), **row_limits(limits)
+    )
+
+
+def solve_week(matrix, week, b, incoming_fatigue, incoming_fitness, is_last_week_of_block, limits, backend, start=None):
+    # the week's selection at b, softened when the week cannot meet every limit
+    hours_limit = week_matrix.weekly_hours_limit(week, is_last_week_of_block, limits["weekly_hours_max"])
+    failures = relaxation.precheck(matrix.columns, incoming_fatigue, incoming_fitness, hours_limit, **row_limits(limits))
+    reason = "precheck"
+    if not failures:
+        results = backend.solve_arrays(matrix.c, matrix.A, b, start=start)
+        if results.has_solution():
+            return results.values
+        reason = results.status
+    results, week["relaxation"] = relaxation.relax_week(matrix, b, backend, failures, reason)
+    return results.values
+
+
+def is_feasible(matrix, values, b):
+    return bool(np.all(matrix.A @ values <= b + feasibility_tolerance))
+
+
+def still_optimal(matrix, base, b):
+    # True when the base week's selection is provably optimal for right hand side b as well
+    if not is_feasible(matrix, base.values, b):
+        return False
+    if np.all(b <= base.b + feasibility_tolerance):
+        return True
+    if base.duals is None:
+        return False
+    bound = base.lp_objective + base.duals @ (b - base.b)
+    step = week_matrix.objective_step(matrix.columns)
+    if step > 0:
+        return bound < base.objective + step - feasibility_tolerance
+    return bound <= base.objective + feasibility_tolerance
+
+
+def iter_season(config, week_plan):
+    # (week number, week, is_last_week_of_block) in planning order
+    for week_number, week in enumerate(week_plan):
+        is_last_week_of_block = False
+        if week_number < len(week_plan) - 1:
+            is_last_week_of_block = week_plan[week_number+1]["start_block"]
+        yield week_number, week, is_last_week_of_block
+
+
+def plan_base(config, solver=None):
+    # the season at the configured limits, with what every week's sensitivity check needs
+    limits = base_limits(config)
+    week_plan = periodization.create_linear_periodization_plan(config)
+    incoming_fatigue, incoming_fitness = batch.initial_state(config)
+    backend = solvers.get_backend(solver, time_limit=10)
+
+    sensitivities = []
+    for week_number, week, is_last_week_of_block in iter_season(config, week_plan):
+        if week_number > 0:
+            incoming_fatigue = week_plan[week_number-1]["fatigue_outcome"]
+            incoming_fitness = week_plan[week_number-1]["fitness_outcome"]
+
+        matrix = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(week["strategy"]))
+        b = week_rhs(matrix, week, incoming_fatigue, incoming_fitness, is_last_week_of_block, limits)
+        lp = backend.solve_arrays(matrix.c, matrix.A, b, relaxed=True)
+        values = solve_week(matrix, week, b, incoming_fatigue, incoming_fitness, is_last_week_of_block, limits, backend)
+        week_matrix.apply_selection_to_week(week, matrix.columns, week_matrix.selection_from_solution(matrix, values), incoming_fitness)
+
+        solved = lp.has_solution()
+        sensitivities.append(WeekSensitivity(
+            values, float(matrix.c @ values), lp.objective if solved else None, lp.duals if solved else None, b
+        ))
+
+    return week_plan, sensitivities
+
+
+def plan_point(config, limits, week_plan, sensitivities, solver=None):
+    # the season at `limits`, reusing every base week that is still optimal. returns the weeks and
+    # how many of them were reused.
+    incoming_fatigue, incoming_fitness = batch.initial_state(config)
+    backend = solvers.get_backend(solver, time_limit=10)
+
+    weeks = []
+    reused = 0
+    for week_number, base_week, is_last_week_of_block in iter_season(config, week_plan):
+        if week_number > 0:
+            incoming_fatigue = weeks[-1]["fatigue_outcome"]
+            incoming_fitness = weeks[-1]["fitness_outcome"]
+
+        week = unplanned_copy(base_week)
+        base = sensitivities[week_number]
+        matrix = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(week["strategy"]))
+        b = week_rhs(matrix, week, incoming_fatigue, incoming_fitness, is_last_week_of_block, limits)
+
+        if still_optimal(matrix, base, b):
+            values = base.values
+            reused += 1
+        else:
+            start = base.values if is_feasible(matrix, base.values, b) else None
+            values = solve_week(matrix, week, b, incoming_fatigue, incoming_fitness, is_last_week_of_block, limits, backend, start)
+
+        week_matrix.apply_selection_to_week(week, matrix.columns, week_matrix.selection_from_solution(matrix, values), incoming_fitness)
+        weeks.append(week)
+
+    return weeks, reused
+
+
+def sweep_row(parameter, value, weeks, reused):
+    fitness_outcome = dict(weeks[-1]["fitness_outcome"]) if weeks else {}
+    return {
+        "parameter": parameter,
+        "value": value,
+        "fitness_outcome": fitness_outcome,
+        "total_fitness": sum(fitness_outcome.values()),
+        "weeks_reused": reused,
+        "weeks_solved": len(weeks) - reused
+    }
+
+
+# worker side
+
+def init_worker():
+    workout_library.fetch_workouts_with_cache()
+
+
+def run_point(task):
+    config, parameter, value, week_plan, sensitivities, solver = task
+    limits = base_limits(config)
+    limits[parameter] = value
+    weeks, reused = plan_point(config, limits, week_plan, sensitivities, solver)
+    return sweep_row(parameter, value, weeks, reused)
+
+
+def sweep(config, grid, workers=None, solver=None):
+    # grid maps parameter names to the values to try, each changed on its own from the configured
+    # limits. returns one row per parameter value, in grid order, starting with the configured
+    # limits themselves as the "base" row.
+    grid = {parameter_name(parameter): list(values) for parameter, values in grid.items()}
+    solver_name = solver if solver is None or isinstance(solver, str) else solver.name # backends are not sent to workers
+
+    week_plan, sensitivities = plan_base(config, solver)
+    rows = [sweep_row("base", None, week_plan, 0)]
+
+    tasks = [(config, parameter, value, week_plan, sensitivities, solver_name) for parameter, values in grid.items() for value in values]
+    if workers == 0 or len(tasks) <= 1:
+        rows.extend(run_point(task) for task in tasks)
+        return rows
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=init_worker) as executor:
+        rows.extend(executor.map(run_point, tasks))
+    return rows
+
+
+def format_table(rows):
+    # fixed width text table of a sweep
+    lines = ["{:<26} {:>8} {:>9} {:>9} {:>9} {:>9} {:>7} {:>7}".format("parameter", "value", *sports, "total", "reused", "solved")]
+    for row in rows:
+        fitness = row["fitness_outcome"]
+        lines.append("{:<26} {:>8} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} {:>7} {:>7}".format(
+            row["parameter"], "" if row["value"] is None else row["value"],
+            *(fitness.get(sport, float("nan")) for sport in sports), row["total_fitness"], row["weeks_reused"], row["weeks_solved"]
+        ))
+    return "\n".join(lines)
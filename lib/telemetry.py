@@ -0,0 +1,143 @@
+import contextlib
+import json
+import time
+
+
+# instrumentation for the planners.
+#
+# a sink is any callable taking (kind, data). the planners emit
+#   "week"             per solved week: engine, build/solve/extraction seconds, solver status,
+#                      termination condition, MIP gap, variable and constraint counts
+#   "periodization"    the same for the periodization step
+#   "fatigue_outcome"  the week's fatigue outcome, which the planners used to print
+#   "replan"           per replan_from_week call: the weeks solved again and where the plan converged
+#   "library_row"      every row of a csv workout library as it is read, which the loader used to print
+#
+# with a sink registered the week record is also attached to the week dict as week["telemetry"].
+# with no sink registered nothing is collected beyond a few clock reads, and nothing is printed; add
+# print_fatigue_outcome and print_library_row as sinks to get the old output back.
+
+sinks = []
+
+def add_sink(sink):
+    sinks.append(sink)
+    return sink
+
+def remove_sink(sink):
+    if sink in sinks:
+        sinks.remove(sink)
+
+@contextlib.contextmanager
+def sink(sink):
+    add_sink(sink)
+    try:
+        yield sink
+    finally:
+        remove_sink(sink)
+
+def enabled():
+    return len(sinks) > 0
+
+def emit(kind, data):
+    for sink in list(sinks):
+        sink(kind, data)
+
+
+class MetricsRecorder:
+    # sink that keeps every event, for inspection after a run
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, kind, data):
+        self.events.append((kind, data))
+
+    def of_kind(self, kind):
+        return [data for event_kind, data in self.events if event_kind == kind]
+
+
+class JsonLinesSink:
+    # sink writing every event to a text file as one JSON line, {"kind": ..., "data": ...}
+
+    def __init__(self, file):
+        self.file = file
+
+    def __call__(self, kind, data):
+        self.file.write(json.dumps({"kind": kind, "data": data}, default=str) + "\n")
+
+
+def print_fatigue_outcome(kind, data):
+    if kind == "fatigue_outcome":
+        print(data)
+
+
+def print_library_row(kind, data):
+    if kind == "library_row":
+        print(data["row"])
+
+
+clock = time.perf_counter
+
+
+def solver_fields(results):
+    # status fields of a solvers.SolveResult (or None when the engine did not call a solver)
+    if results is None:
+        return {"status": None, "termination_condition": None, "mip_gap": None, "objective": None}
+    return {
+        "status": results.status,
+        "termination_condition": str(getattr(results.termination_condition, "name", results.termination_condition)), # pyomo and appsi enums alike
+        "mip_gap": results.mip_gap,
+        "objective": results.objective
+    }
+
+
+def report_week(week, engine, build_seconds, solve_seconds, extract_seconds, results=None, counts=None, **fields):
+    # emits the week record and attaches it to the week. counts is a callable returning (variables,
+    # constraints), only called when a sink is listening.
+    if not sinks:
+        return None
+    number_of_variables, number_of_constraints = counts() if counts is not None else (None, None)
+    record = {
+        "start_date": week.get("start_date"),
+        "strategy": week.get("strategy"),
+        "engine": engine,
+        "build_seconds": build_seconds,
+        "solve_seconds": solve_seconds,
+        "extract_seconds": extract_seconds,
+        "number_of_variables": number_of_variables,
+        "number_of_constraints": number_of_constraints
+    }
+    record.update(solver_fields(results))
+    record.update(fields)
+    week["telemetry"] = record
+    emit("week", record)
+    emit("fatigue_outcome", week["fatigue_outcome"])
+    return record
+
+
+def report_periodization(method, number_of_weeks, max_block_weeks, build_seconds, solve_seconds, extract_seconds, results=None, counts=None):
+    if not sinks:
+        return None
+    number_of_variables, number_of_constraints = counts() if counts is not None else (None, None)
+    record = {
+        "method": method,
+        "number_of_weeks": number_of_weeks,
+        "max_block_weeks": max_block_weeks,
+        "build_seconds": build_seconds,
+        "solve_seconds": solve_seconds,
+        "extract_seconds": extract_seconds,
+        "number_of_variables": number_of_variables,
+        "number_of_constraints": number_of_constraints
+    }
+    record.update(solver_fields(results))
+    emit("periodization", record)
+    return record
+
+
+def model_counts(model):
+    return lambda: (model.nvariables(), model.nconstraints())
+
+
+def matrix_counts(matrix):
+    # rows without terms are never written out, as in the pyomo models
+    return lambda: (matrix.number_of_variables, int((matrix.A.getnnz(axis=1) > 0).sum()))
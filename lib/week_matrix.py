@@ -0,0 +1,273 @@
+import math
+
+import numpy as np
+
+
+# sparse, array based form of the weekly planning model in workout_planner.add_workouts_to_week_plan
+#
+# variables are the same binary SelectedWorkouts[day, workout_id], flattened day-major:
+#   x[day * number_of_workouts + workout_id]
+#
+# the model is: maximize c @ x subject to A @ x <= b, with x binary
+
+sports = ["swim", "bike", "run"]
+
+sport_to_int = {
+    "swim": 0,
+    "bike": 1,
+    "run": 2
+}
+
+number_of_days = 7
+
+fatigue_upper_bound = 70 # upper limit to fatigue for each sports
+total_fatigue_upper_bound = 120 # upper limit to fatigue for all sports together
+max_divergence = 10 # fitness for sports should not diverge more than this
+fitness_multiplier = 1 # fitness accumulates slowly
+fitness_carryover = .95 # share of incoming fitness kept at the end of the week
+fatigue_outcome_days = slice(3, 6) # days whose fatigue is carried into the next week
+integrality_tolerance = 1e-5 # largest distance from 0 or 1 of a binary in a reported solution
+
+
+class WeekColumns:
+    # numeric columns of the workouts available for one week, indexed by workout_id
+
+    def __init__(self, available_workouts):
+        self.workouts = available_workouts
+
+        library = getattr(available_workouts[0], "library", None) if len(available_workouts) > 0 else None
+        if library is not None and all(getattr(workout, "library", None) is library for workout in available_workouts):
+            # workouts from one memory-mapped library: slice its packed columns directly
+            idx = np.array([workout.index for workout in available_workouts], dtype=np.int64)
+            self.sport = library.sport[idx].astype(np.int64)
+            self.duration = np.array(library.duration[idx], dtype=np.float64)
+            self.fatigue_increase = np.array(library.fatigue_increase[idx], dtype=np.float64)
+            self.fitness_increase = np.array(library.fitness_increase[idx], dtype=np.float64)
+            return
+
+        self.sport = np.array([sport_to_int[workout["sport"]] for workout in available_workouts], dtype=np.int64)
+        self.duration = np.array([workout["duration"] for workout in available_workouts], dtype=np.float64)
+        self.fatigue_increase = np.array([workout["fatigue_increase"] for workout in available_workouts], dtype=np.float64)
+        self.fitness_increase = np.array([workout["fitness_increase"] for workout in available_workouts], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.workouts)
+
+    def workouts_for_sport(self, sport):
+        return np.flatnonzero(self.sport == sport_to_int[sport])
+
+
+def fatigue_window(day):
+    # days whose selections count toward the fatigue limit checked on `day` (constraints 2 and 2a)
+    if day == 0:
+        return range(0, 1)
+    if day > 4:
+        return range(day - 5, day)
+    return range(0, day)
+
+
+def incoming_fatigue_coef(day):
+    # share of incoming fatigue still present on `day` (constraints 2 and 2a)
+    if day == 0:
+        return 1
+    if day > 4:
+        return 0
+    return 1 - (day * .25)
+
+
+def variability_window(day):
+    # days on which the same workout may be selected at most once (constraint 5)
+    return range(max(0, day - 3), day)
+
+
+def _window_mask(window, days):
+    mask = np.zeros((number_of_days, number_of_days), dtype=bool)
+    for day in days:
+        mask[day, list(window(day))] = True
+    return mask
+
+
+fatigue_window_mask = _window_mask(fatigue_window, range(number_of_days))
+variability_window_mask = _window_mask(variability_window, range(1, number_of_days))
+incoming_fatigue_coefs = np.array([incoming_fatigue_coef(day) for day in range(number_of_days)], dtype=np.float64)
+
+divergence_pairs = [(sport_a, sport_b) for sport_a in sports for sport_b in sports if sport_a != sport_b]
+
+
+class WeekMatrix:
+    # coefficient arrays for one set of available workouts. only the right hand side b depends on the
+    # incoming state, so one WeekMatrix can be reused for every week that shares a workout set.
+    #
+    # multiplicity (one per workout, default 1) is how often a workout may be selected within one
+    # constraint 5 window. a workout standing in for several identical ones (see presolve.py) may be
+    # selected as often as there are copies.
+
+    def __init__(self, columns, multiplicity=None):
+        self.columns = columns
+        self.number_of_workouts = len(columns)
+        self.multiplicity = np.ones(self.number_of_workouts) if multiplicity is None else np.asarray(multiplicity, dtype=np.float64)
+        self.number_of_variables = number_of_days * self.number_of_workouts
+
+        self.c = np.tile(columns.fitness_increase, number_of_days)
+
+        rows = []
+        cols = []
+        coefs = []
+        self.row_groups = {}
+        self._next_row = 0
+
+        n = self.number_of_workouts
+        workout_ids = np.arange(n)
+        all_variables = np.arange(self.number_of_variables)
+        variable_days = all_variables // max(n, 1)
+        variable_sports = np.tile(columns.sport, number_of_days)
+
+        # constraint 1: no more than 2 workouts per day
+        start = self._add_group("max_workouts_per_day", number_of_days)
+        rows.append(start + variable_days)
+        cols.append(all_variables)
+        coefs.append(np.ones(self.number_of_variables))
+
+        # constraint 1a: no more than 1 workout of each sport per day
+        start = self._add_group("max_workouts_per_day_by_sport", number_of_days * len(sports))
+        rows.append(start + variable_days * len(sports) + variable_sports)
+        cols.append(all_variables)
+        coefs.append(np.ones(self.number_of_variables))
+
+        # constraint 2: fatigue must remain below maximum for each sport
+        window_days, window_selected_days = np.nonzero(fatigue_window_mask)
+        window_rows = np.repeat(window_days, n)
+        window_cols = (window_selected_days[:, None] * n + workout_ids).ravel()
+        window_workouts = np.tile(workout_ids, len(window_days))
+
+        start = self._add_group("must_not_exceed_max_fatigue_by_sport", number_of_days * len(sports))
+        rows.append(start + window_rows * len(sports) + columns.sport[window_workouts])
+        cols.append(window_cols)
+        coefs.append(columns.fatigue_increase[window_workouts])
+
+        # constraint 2a: total fatigue across sports must remain below maximum
+        start = self._add_group("must_not_exceed_max_total_fatigue", number_of_days)
+        rows.append(start + window_rows)
+        cols.append(window_cols)
+        coefs.append(columns.fatigue_increase[window_workouts])
+
+        # constraint 3: must not exceed weekly duration limit
+        start = self._add_group("must_not_exceed_weekly_duration_limit", 1)
+        rows.append(np.full(self.number_of_variables, start))
+        cols.append(all_variables)
+        coefs.append(np.tile(columns.duration, number_of_days))
+
+        # constraint 4: fitness for sports should not diverge more than max_divergence
+        start = self._add_group("must_not_exceed_divergence_limit", len(divergence_pairs))
+        variable_fitness = self.c * fitness_multiplier
+        for pair_idx, (sport_a, sport_b) in enumerate(divergence_pairs):
+            for sport, sign in ((sport_a, 1), (sport_b, -1)):
+                in_sport = np.flatnonzero(variable_sports == sport_to_int[sport])
+                rows.append(np.full(len(in_sport), start + pair_idx))
+                cols.append(in_sport)
+                coefs.append(sign * variable_fitness[in_sport])
+
+        # constraint 5: must have variability in workouts
+        window_days, window_selected_days = np.nonzero(variability_window_mask)
+        start = self._add_group("must_have_variability_in_workouts", (number_of_days - 1) * n)
+        rows.append(start + np.repeat((window_days - 1) * n, n) + np.tile(workout_ids, len(window_days)))
+        cols.append((window_selected_days[:, None] * n + workout_ids).ravel())
+        coefs.append(np.ones(len(window_days) * n))
+
+        self.number_of_rows = self._next_row
+        import scipy.sparse as sp # deferred: importing this module should stay cheap for code that only reads plans
+        self.A = sp.csr_matrix(
+            (np.concatenate(coefs), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(self.number_of_rows, self.number_of_variables)
+        )
+
+    def _add_group(self, name, size):
+        start = self._next_row
+        self.row_groups[name] = slice(start, start + size)
+        self._next_row += size
+        return start
+
+    def rhs(self, incoming_fatigue, incoming_fitness, weekly_hours_limit,
+            fatigue_upper_bound=fatigue_upper_bound, total_fatigue_upper_bound=total_fatigue_upper_bound, max_divergence=max_divergence):
+        # right hand side b for the given incoming state. weekly_hours_limit is already adjusted for
+        # peak weeks and the last week of a block. the limits default to the module constants.
+        b = np.empty(self.number_of_rows, dtype=np.float64)
+
+        b[self.row_groups["max_workouts_per_day"]] = 2
+        b[self.row_groups["max_workouts_per_day_by_sport"]] = 1
+
+        incoming_by_sport = np.array([incoming_fatigue[sport] for sport in sports], dtype=np.float64)
+        b[self.row_groups["must_not_exceed_max_fatigue_by_sport"]] = \
+            (fatigue_upper_bound - incoming_fatigue_coefs[:, None] * incoming_by_sport).ravel()
+
+        incoming_fatigue_total = sum(incoming_fatigue[sport] for sport in sports)
+        b[self.row_groups["must_not_exceed_max_total_fatigue"]] = \
+            total_fatigue_upper_bound - incoming_fatigue_coefs * incoming_fatigue_total
+
+        b[self.row_groups["must_not_exceed_weekly_duration_limit"]] = weekly_hours_limit * 60
+
+        b[self.row_groups["must_not_exceed_divergence_limit"]] = [
+            max_divergence - (incoming_fitness[sport_a] * fitness_carryover - incoming_fitness[sport_b] * fitness_carryover)
+            for sport_a, sport_b in divergence_pairs
+        ] # 10 + x <= 20 on both sides is like abs(x) <= 10
+
+        b[self.row_groups["must_have_variability_in_workouts"]] = np.tile(self.multiplicity, number_of_days - 1)
+
+        return b
+
+
+def weekly_hours_limit(week, is_last_week_of_block, weekly_hours_max):
+    if week["strategy"] == "peak" or is_last_week_of_block:
+        return weekly_hours_max * .5
+    return weekly_hours_max
+
+
+def objective_step(columns, resolution=1e-6):
+    # smallest positive difference between two objective values: the greatest common divisor of the
+    # fitness increases, on a grid of `resolution`
+    steps = np.unique(np.abs(np.round(columns.fitness_increase * fitness_multiplier / resolution)).astype(np.int64))
+    return math.gcd(*steps.tolist()) * resolution if steps.any() else 0.0
+
+
+def round_solution(values, tolerance=integrality_tolerance):
+    # a binary solution vector from any backend as exact 0s and 1s. solvers report binaries within
+    # their feasibility tolerance (0.9999999 for 1); values further than tolerance from 0 and 1, or
+    # missing ones (None, nan), are an error rather than a guess.
+    values = np.asarray(values, dtype=np.float64)
+    rounded = np.round(values)
+    off = ~(np.abs(values - rounded) <= tolerance) | (rounded < 0) | (rounded > 1)
+    if off.any():
+        raise ValueError("{} of {} solution values are not within {} of 0 or 1".format(int(off.sum()), len(values), tolerance))
+    return rounded
+
+
+def selection_from_solution(matrix, values, tolerance=integrality_tolerance):
+    # the flat solution vector, rounded, as a (days, workouts) array
+    return round_solution(values, tolerance).reshape(number_of_days, matrix.number_of_workouts)
+
+
+def apply_selection_to_week(week, columns, selection, incoming_fitness):
+    # fill week["workouts"], week["fitness_outcome"] and week["fatigue_outcome"] from a (days, workouts)
+    # 0/1 selection array, in one pass of vectorized sums
+    selection = np.asarray(selection)
+    days, workout_ids = np.nonzero(selection)
+    day_starts = np.searchsorted(days, np.arange(number_of_days + 1)).tolist()
+    workout_ids = workout_ids.tolist()
+    week["workouts"] = [[columns.workouts[workout_id] for workout_id in workout_ids[day_starts[day]:day_starts[day+1]]] for day in range(number_of_days)]
+
+    fitness_gain = np.bincount(columns.sport, weights=selection.sum(axis=0) * columns.fitness_increase * fitness_multiplier, minlength=len(sports)).tolist()
+    fatigue = np.bincount(columns.sport, weights=selection[fatigue_outcome_days].sum(axis=0) * columns.fatigue_increase, minlength=len(sports)).tolist()
+
+    week["fitness_outcome"] = {
+        "run": incoming_fitness["run"] * fitness_carryover + fitness_gain[sport_to_int["run"]], # depreciate a bit of incoming fitness and add on gains
+        "bike": incoming_fitness["bike"] * fitness_carryover + fitness_gain[sport_to_int["bike"]],
+        "swim": incoming_fitness["swim"] * fitness_carryover + fitness_gain[sport_to_int["swim"]]
+    }
+
+    week["fatigue_outcome"] = {
+        "swim": fatigue[sport_to_int["swim"]],
+        "bike": fatigue[sport_to_int["bike"]],
+        "run": fatigue[sport_to_int["run"]]
+    }
+
+    return week
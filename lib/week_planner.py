@@ -0,0 +1,225 @@
+import numpy as np
+
+from .workouts import workouts as workout_library
+from . import week_matrix
+from . import workout_planner
+from . import solvers
+from . import telemetry
+from .week_matrix import sports
+
+
+# weekly planning with one model per strategy, kept alive for the whole horizon.
+#
+# the model is the same as add_workouts_to_week_plan, but the values that change from week to week
+# (incoming fatigue and fitness, weekly hours) are mutable parameters. each week only those are
+# updated and the model is re-solved through a persistent solver, warm-started from the previous
+# week's selection.
+
+
+def build_persistent_week_model(matrix):
+    import pyomo.environ as pyo # deferred until a persistent model is built
+    from pyomo.core.expr.numeric_expr import LinearExpression
+    model = pyo.ConcreteModel()
+
+    model.Days = pyo.RangeSet(0,6)
+    model.Sports = pyo.Set(initialize=sports)
+    model.WorkoutIds = pyo.RangeSet(0,matrix.number_of_workouts-1)
+
+    model.IncomingFatigue = pyo.Param(model.Sports, initialize=0, mutable=True)
+    model.IncomingFitness = pyo.Param(model.Sports, initialize=0, mutable=True)
+    model.WeeklyHoursMax = pyo.Param(initialize=0, mutable=True) # already adjusted for peak weeks and the last week of a block
+
+    model.SelectedWorkouts = pyo.Var(model.Days, model.WorkoutIds, domain=pyo.Boolean)
+    variables = list(model.SelectedWorkouts.values()) # day-major, same order as the matrix columns
+
+    model.obj = pyo.Objective(expr=LinearExpression(constant=0, linear_coefs=matrix.c.tolist(), linear_vars=variables), sense=pyo.maximize)
+
+    # the parts of each row that depend on the incoming state, moved to the left hand side
+    def incoming_fatigue_term(row):
+        day, sport_idx = divmod(row, len(sports))
+        return week_matrix.incoming_fatigue_coefs[day] * model.IncomingFatigue[sports[sport_idx]]
+
+    def incoming_total_fatigue_term(row):
+        return week_matrix.incoming_fatigue_coefs[row] * sum(model.IncomingFatigue[sport] for sport in sports)
+
+    def weekly_duration_term(row):
+        return -60 * model.WeeklyHoursMax
+
+    def divergence_term(row):
+        sport_a, sport_b = week_matrix.divergence_pairs[row]
+        return model.IncomingFitness[sport_a] * week_matrix.fitness_carryover - model.IncomingFitness[sport_b] * week_matrix.fitness_carryover
+
+    incoming_terms = {
+        "must_not_exceed_max_fatigue_by_sport": incoming_fatigue_term,
+        "must_not_exceed_max_total_fatigue": incoming_total_fatigue_term,
+        "must_not_exceed_weekly_duration_limit": weekly_duration_term,
+        "must_not_exceed_divergence_limit": divergence_term
+    }
+
+    # with no incoming state and no weekly hours, b is just the fixed upper bound of every row
+    upper_bounds = matrix.rhs({sport: 0 for sport in sports}, {sport: 0 for sport in sports}, 0).tolist()
+    indptr = matrix.A.indptr.tolist()
+    indices = matrix.A.indices.tolist()
+    data = matrix.A.data.tolist()
+
+    for name, rows in matrix.row_groups.items():
+        incoming_term = incoming_terms.get(name)
+
+        def row_rule(m, row, incoming_term=incoming_term, group_start=rows.start):
+            start, end = indptr[row], indptr[row+1]
+            if start == end:
+                return pyo.Constraint.Skip
+            body = LinearExpression(constant=0, linear_coefs=data[start:end], linear_vars=[variables[col] for col in indices[start:end]])
+            if incoming_term is not None:
+                body = body + incoming_term(row - group_start)
+            return body <= upper_bounds[row]
+
+        model.add_component(name + "_constraint", pyo.Constraint(range(rows.start, rows.stop), rule=row_rule))
+
+    return model
+
+
+class PersistentWeekModel:
+    # one strategy's model together with the persistent solver instance that holds it
+
+    def __init__(self, available_workouts, solver_factory, time_limit):
+        self.matrix = week_matrix.WeekMatrix(week_matrix.WeekColumns(available_workouts))
+        self.model = build_persistent_week_model(self.matrix)
+        self.variables = list(self.model.SelectedWorkouts.values())
+
+        self.solver = solver_factory()
+        self.solver.config.time_limit = time_limit
+        self.solver.config.warmstart = self.solver.warm_start_capable()
+        self.solver.config.load_solution = False
+
+        # only parameter values change between solves, so skip the structural checks on update
+        update_config = self.solver.update_config
+        update_config.check_for_new_or_removed_constraints = False
+        update_config.check_for_new_or_removed_vars = False
+        update_config.check_for_new_or_removed_params = False
+        update_config.check_for_new_objective = False
+        update_config.update_constraints = False
+        update_config.update_vars = False
+        update_config.update_named_expressions = False
+        update_config.update_objective = False
+        update_config.update_params = True
+
+    def reset_solver(self):
+        # load the model into a fresh solver instance, dropping any basis or start kept from earlier solves
+        self.solver.set_instance(self.model)
+
+    def set_state(self, incoming_fatigue, incoming_fitness, weekly_hours_limit):
+        for sport in sports:
+            self.model.IncomingFatigue[sport] = incoming_fatigue[sport]
+            self.model.IncomingFitness[sport] = incoming_fitness[sport]
+        self.model.WeeklyHoursMax = weekly_hours_limit
+
+    def set_warm_start(self, previous_workouts):
+        # previous week's selection mapped onto this model's workouts; workouts this strategy does not
+        # offer are left out
+        selection = np.zeros((week_matrix.number_of_days, self.matrix.number_of_workouts))
+        if previous_workouts is not None:
+            workout_ids = {id(workout): workout_id for workout_id, workout in enumerate(self.matrix.columns.workouts)}
+            for day, day_workouts in enumerate(previous_workouts):
+                for workout in day_workouts:
+                    if id(workout) in workout_ids:
+                        selection[day, workout_ids[id(workout)]] = 1
+
+        for variable, value in zip(self.variables, selection.ravel().tolist()):
+            variable.set_value(value, skip_validation=True)
+
+    def solve(self):
+        # the selection, or None when the solver found no solution
+        results = self.solver.solve(self.model)
+        self.last_results = results
+
+        if results.best_feasible_objective is None:
+            return None
+
+        results.solution_loader.load_vars(self.variables)
+        return week_matrix.selection_from_solution(self.matrix, [variable.value for variable in self.variables])
+
+
+def persistent_solve_result(results):
+    # appsi results in the shape of solvers.SolveResult, for telemetry
+    from pyomo.contrib import appsi
+    termination_condition = results.termination_condition
+    has_solution = results.best_feasible_objective is not None
+    if termination_condition == appsi.base.TerminationCondition.optimal:
+        status = solvers.status_optimal
+    elif termination_condition == appsi.base.TerminationCondition.infeasible:
+        status = solvers.status_infeasible
+    else:
+        status = solvers.status_feasible if has_solution else solvers.status_no_solution
+    mip_gap = None
+    if has_solution and results.best_objective_bound is not None and np.isfinite(results.best_objective_bound):
+        mip_gap = abs(results.best_objective_bound - results.best_feasible_objective) / max(abs(results.best_feasible_objective), 1e-10)
+    return solvers.SolveResult(status, termination_condition, objective=results.best_feasible_objective, mip_gap=mip_gap)
+
+
+class WeekPlanner:
+    # builds each strategy's weekly model once and re-solves it for every week of the horizon
+
+    def __init__(self, solver_factory=None, time_limit=10):
+        if solver_factory is None:
+            from pyomo.contrib import appsi # deferred, like the rule model's pyomo import
+            solver_factory = appsi.solvers.Highs
+        self.solver_factory = solver_factory
+        self.time_limit = time_limit
+        self.models = {}
+        self.previous_workouts = None
+
+    def reset(self):
+        # forget everything carried over from earlier solves, so the next plan does not depend on
+        # which plans this planner solved before. the pyomo models themselves are kept.
+        self.previous_workouts = None
+        for week_model in self.models.values():
+            week_model.reset_solver()
+
+    def get_model(self, strategy):
+        available_workouts = workout_library.GetWorkoutsForWeek(strategy)
+        week_model = self.models.get(strategy)
+        if week_model is None or week_model.matrix.columns.workouts is not available_workouts:
+            week_model = PersistentWeekModel(available_workouts, self.solver_factory, self.time_limit)
+            self.models[strategy] = week_model
+        return week_model
+
+    def add_workouts_to_week_plan(self, week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max):
+        # same inputs and outputs as workout_planner.add_workouts_to_week_plan
+        build_started = telemetry.clock()
+        week_model = self.get_model(week["strategy"])
+        available_workouts = week_model.matrix.columns.workouts
+        hours_limit = week_matrix.weekly_hours_limit(week, is_last_week_of_block, weekly_hours_max)
+
+        # weeks that cannot meet every limit are solved softened by the matrix engine's relaxation
+        backend = solvers.get_backend(time_limit=self.time_limit)
+        relaxed = workout_planner.add_relaxed_workouts_if_precheck_fails(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, backend, "persistent", build_started)
+        if relaxed is not None:
+            self.previous_workouts = relaxed["workouts"]
+            return relaxed
+
+        week_model.set_state(incoming_fatigue, incoming_fitness, hours_limit)
+        week_model.set_warm_start(self.previous_workouts)
+
+        solve_started = telemetry.clock()
+        selection = week_model.solve()
+        solve_finished = telemetry.clock()
+        if selection is None:
+            status = persistent_solve_result(week_model.last_results).status
+            relaxed = workout_planner.add_relaxed_workouts_to_week_plan(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, backend, None, status, "persistent", build_started)
+            self.previous_workouts = relaxed["workouts"]
+            return relaxed
+        week_matrix.apply_selection_to_week(week, week_model.matrix.columns, selection, incoming_fitness)
+        self.previous_workouts = week["workouts"]
+
+        if telemetry.enabled():
+            telemetry.report_week(
+                week, "persistent", solve_started - build_started, solve_finished - solve_started, telemetry.clock() - solve_finished,
+                persistent_solve_result(week_model.last_results), telemetry.model_counts(week_model.model), solver=type(week_model.solver).__name__
+            )
+
+        return week
+
+    def add_workouts_to_weeks(self, week_plan, incoming_fatigue, incoming_fitness, weekly_hours_max):
+        self.previous_workouts = None
+        return workout_planner.add_workouts_to_weeks(week_plan, incoming_fatigue, incoming_fitness, weekly_hours_max, self.add_workouts_to_week_plan)
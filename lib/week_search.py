@@ -0,0 +1,397 @@
+import numpy as np
+
+from .workouts import workouts as workout_library
+from . import week_matrix
+from . import solvers
+from . import workout_planner
+from . import telemetry
+from .week_matrix import sports, number_of_days, fatigue_window_mask, divergence_pairs, sport_to_int
+
+
+# branch and bound engine for the weekly model, an alternative to handing the MILP to a solver.
+#
+# the week is searched day by day. a day takes one of its options: no workout, one workout, or two
+# workouts of different sports, which covers constraints 1 and 1a by construction. the fatigue rows
+# (2, 2a) only have non negative coefficients, so every partial week is checked against them as the
+# days are filled in; the duration cap (3) works the same way; the spacing rule (5) forbids a workout
+# on the two days after it was selected, except on day 6 which no spacing row covers; the divergence
+# rows (4) are checked exactly on full weeks and used to prune partial weeks that can no longer reach
+# them. every day's options are bounded together, tried best bound first, and cut when their fitness
+# plus an optimistic bound for the remaining days cannot beat the incumbent.
+#
+# the search is exact when it finishes within its node limit (or reaches the LP bound) and every
+# workout was a candidate. otherwise its best week is a feasible starting point for the MILP. bounds
+# round down to the grid of the objective (week_matrix.objective_step), which proves a week that is
+# less than one step below the LP bound.
+#
+# on real libraries the LP bound sits a few steps above the best week and the tree is far too big to
+# finish, so proofs are rare and the search mostly pays off as a MIP start: a good week early lets the
+# MILP cut most of its tree, which matters most where it would otherwise run into its time limit. the
+# search stops once stall_nodes nodes in a row found no better week (depth first, its later weeks come
+# slowly), and it is skipped for backends that take no MIP start.
+
+default_node_limit = 5000
+default_stall_nodes = 200 # nodes in a row without a better week before the search hands over to the MILP
+default_candidates_per_sport = 60 # workouts per sport considered by the search, best fitness first
+max_repeats_per_week = 3 # the spacing rows allow a workout on at most two of days 0-5, plus day 6
+
+tolerance = 1e-9
+
+
+class SearchResult:
+
+    def __init__(self, values, objective, proven_optimal, nodes):
+        self.values = values # flat 0/1 vector in WeekMatrix variable order, None when no week was found
+        self.objective = objective
+        self.proven_optimal = proven_optimal
+        self.nodes = nodes
+
+
+class WeekSearch:
+
+    def __init__(self, matrix, b, candidates_per_sport=default_candidates_per_sport):
+        self.matrix = matrix
+        self.b = b
+        columns = matrix.columns
+        groups = matrix.row_groups
+
+        self.fatigue_limits = b[groups["must_not_exceed_max_fatigue_by_sport"]].reshape(number_of_days, len(sports))
+        self.total_fatigue_limits = b[groups["must_not_exceed_max_total_fatigue"]]
+        self.duration_limit = b[groups["must_not_exceed_weekly_duration_limit"]][0]
+        self.divergence_limits = b[groups["must_not_exceed_divergence_limit"]]
+        self.divergence_sports = np.array([[sport_to_int[sport_a], sport_to_int[sport_b]] for sport_a, sport_b in divergence_pairs])
+
+        # fatigue rows whose window contains each day
+        self.rows_for_day = [np.flatnonzero(fatigue_window_mask[:, day]) for day in range(number_of_days)]
+
+        # every week's objective lies on this grid, so bounds round down to it
+        self.objective_step = week_matrix.objective_step(columns)
+
+        self.complete = True
+        self.candidates = self._select_candidates(columns, candidates_per_sport)
+        self._build_options(columns)
+        self._build_bounds(columns)
+
+    def _select_candidates(self, columns, candidates_per_sport):
+        candidates = []
+        for sport in sports:
+            workout_ids = columns.workouts_for_sport(sport)
+            fitness = columns.fitness_increase[workout_ids]
+            # a workout without fitness never improves the objective and only uses up capacity, unless
+            # it has negative coefficients somewhere, which the bounds here do not account for
+            negative = (fitness < 0) | (columns.fatigue_increase[workout_ids] < 0) | (columns.duration[workout_ids] < 0)
+            if negative.any():
+                self.complete = False
+            workout_ids = workout_ids[(fitness > 0) & ~negative]
+            order = np.lexsort((columns.fatigue_increase[workout_ids], columns.duration[workout_ids], -columns.fitness_increase[workout_ids]))
+            if len(order) > candidates_per_sport:
+                self.complete = False
+                order = order[:candidates_per_sport]
+            candidates.append(workout_ids[order])
+        return candidates
+
+    def _build_options(self, columns):
+        first = [np.array([-1])]
+        second = [np.array([-1])]
+        for workout_ids in self.candidates:
+            first.append(workout_ids)
+            second.append(np.full(len(workout_ids), -1))
+        for sport_a in range(len(sports)):
+            for sport_b in range(sport_a + 1, len(sports)):
+                ids_a, ids_b = np.meshgrid(self.candidates[sport_a], self.candidates[sport_b], indexing="ij")
+                first.append(ids_a.ravel())
+                second.append(ids_b.ravel())
+        first = np.concatenate(first)
+        second = np.concatenate(second)
+
+        # workout -1 is "no workout": index it into an extra zero row of every column
+        def column(values):
+            return np.append(values, 0)
+
+        sport = np.append(columns.sport, 0)
+        fatigue = column(columns.fatigue_increase)
+        fitness = column(columns.fitness_increase * week_matrix.fitness_multiplier)
+
+        option_fatigue = np.zeros((len(first), len(sports)))
+        option_gain = np.zeros((len(first), len(sports)))
+        for ids in (first, second):
+            present = ids >= 0
+            option_fatigue[np.flatnonzero(present), sport[ids[present]]] += fatigue[ids[present]]
+            option_gain[np.flatnonzero(present), sport[ids[present]]] += fitness[ids[present]]
+        option_duration = column(columns.duration)[first] + column(columns.duration)[second]
+        option_fitness = column(columns.fitness_increase)[first] + column(columns.fitness_increase)[second]
+
+        order = np.argsort(-option_fitness, kind="stable")
+        self.option_first = first[order]
+        self.option_second = second[order]
+        self.option_fatigue = option_fatigue[order]
+        self.option_fatigue_total = self.option_fatigue.sum(axis=1)
+        self.option_gain = option_gain[order]
+        self.option_duration = option_duration[order]
+        self.option_fitness = option_fitness[order]
+        self.option_fitness_list = self.option_fitness.tolist()
+        self.option_duration_list = self.option_duration.tolist()
+
+    def _build_bounds(self, columns):
+        # optimistic fitness for the days still open, from knapsack tables over integer weights rounded
+        # down (so the tables can only overestimate). the smallest of three bounds wins:
+        #   - the duration left, at most two workouts per open day
+        #   - for the open days up to day 5: the fatigue left in the last fatigue row (days 1-5), per
+        #     sport with one workout per day, and in total with two per day. day 6 is in no fatigue
+        #     row and adds at most the best option.
+        #   - the best workouts of each sport, one per open day
+        workout_ids = np.concatenate(self.candidates)
+        fitness = columns.fitness_increase[workout_ids]
+        duration = columns.duration[workout_ids]
+        fatigue = columns.fatigue_increase[workout_ids]
+        sport = columns.sport[workout_ids]
+
+        self.duration_knapsack = knapsack_table(duration, fitness, max_repeats_per_week, 2 * number_of_days, self.duration_limit)
+        last_row = number_of_days - 1
+        # days 0-5 take a workout at most twice
+        self.total_fatigue_knapsack = knapsack_table(fatigue, fitness, 2, 2 * (number_of_days - 1), self.total_fatigue_limits[last_row])
+        self.sport_fatigue_knapsack = [
+            knapsack_table(fatigue[sport == sport_idx], fitness[sport == sport_idx], 2, number_of_days - 1, self.fatigue_limits[last_row, sport_idx])
+            for sport_idx in range(len(sports))
+        ]
+        self.sport_slots = np.array([
+            [np.repeat(columns.fitness_increase[candidates], min(days, max_repeats_per_week))[:days].sum() for candidates in self.candidates]
+            for days in range(number_of_days + 1)
+        ])
+        self.best_option_fitness = float(self.option_fitness.max()) if len(self.option_fitness) > 0 else 0.0
+        self.max_gain = np.array([
+            columns.fitness_increase[candidates].max() * week_matrix.fitness_multiplier if len(candidates) > 0 else 0.0
+            for candidates in self.candidates
+        ])
+
+    def bound(self, first_open_day, duration_left, fatigue_left, total_fatigue_left):
+        # bound for days first_open_day..6, vectorized over the leading axis of the arguments.
+        # fatigue_left (k, sports) and total_fatigue_left (k,) are the slack of the day 1-5 row.
+        open_days = number_of_days - first_open_day
+        bound = np.minimum(knapsack_bound(self.duration_knapsack, 2 * open_days, duration_left), self.sport_slots[open_days].sum())
+
+        fatigue_days = max(number_of_days - 1 - first_open_day, 0)
+        if fatigue_days == 0:
+            return np.minimum(bound, self.best_option_fitness)
+
+        by_sport = sum(
+            knapsack_bound(self.sport_fatigue_knapsack[sport_idx], fatigue_days, fatigue_left[:, sport_idx])
+            for sport_idx in range(len(sports))
+        )
+        by_fatigue = np.minimum(by_sport, knapsack_bound(self.total_fatigue_knapsack, 2 * fatigue_days, total_fatigue_left))
+        return np.minimum(bound, by_fatigue + self.best_option_fitness)
+
+    def run(self, node_limit=default_node_limit, upper_bound=None, stall_nodes=default_stall_nodes):
+        # depth first search. upper_bound (the LP bound, say) stops the search as soon as the
+        # incumbent reaches it; stall_nodes stops it when that many nodes in a row found no better week.
+        self.node_limit = node_limit
+        self.upper_bound = np.inf if upper_bound is None else self.round_down(upper_bound)
+        self.stall_nodes = stall_nodes
+        self.nodes = 0
+        self.last_improvement = 0
+        self.exhausted = True
+        self.stopped_at_bound = False
+        self.best_objective = -np.inf
+        self.best_options = None
+
+        self.chosen = [0] * number_of_days
+        self._visit(
+            0,
+            0.0,
+            self.duration_limit,
+            np.zeros((number_of_days, len(sports))),
+            np.zeros(number_of_days),
+            np.zeros(len(sports)),
+            np.zeros(len(self.matrix.columns) + 1, dtype=np.int64) - 10
+        )
+
+        proven_optimal = self.complete and (self.exhausted or self.stopped_at_bound)
+        if self.best_options is None:
+            return SearchResult(None, None, proven_optimal, self.nodes)
+        return SearchResult(self.values(self.best_options), self.best_objective, proven_optimal, self.nodes)
+
+    def round_down(self, bound):
+        if self.objective_step <= 0:
+            return bound
+        return np.floor(np.asarray(bound) / self.objective_step + 1e-6) * self.objective_step
+
+    def values(self, options):
+        n = self.matrix.number_of_workouts
+        values = np.zeros(self.matrix.number_of_variables)
+        for day, option in enumerate(options):
+            for workout_id in (self.option_first[option], self.option_second[option]):
+                if workout_id >= 0:
+                    values[day * n + workout_id] = 1
+        return values
+
+    def _visit(self, day, fitness, duration_left, fatigue_sums, total_fatigue_sums, gains, last_selected_day):
+        if self.best_objective >= self.upper_bound - tolerance:
+            self.stopped_at_bound = True
+            return
+        self.nodes += 1
+        if self.nodes > self.node_limit or self.nodes - self.last_improvement > self.stall_nodes:
+            self.exhausted = False
+            return
+
+        if day == number_of_days:
+            divergence = gains[self.divergence_sports[:, 0]] - gains[self.divergence_sports[:, 1]]
+            if np.all(divergence <= self.divergence_limits + tolerance) and fitness > self.best_objective + tolerance:
+                self.best_objective = fitness
+                self.best_options = list(self.chosen)
+                self.last_improvement = self.nodes
+            return
+
+        rows = self.rows_for_day[day]
+        feasible = self.option_duration <= duration_left + tolerance
+        if len(rows) > 0:
+            fatigue_slack = (self.fatigue_limits[rows] - fatigue_sums[rows]).min(axis=0)
+            total_fatigue_slack = (self.total_fatigue_limits[rows] - total_fatigue_sums[rows]).min()
+            feasible &= np.all(self.option_fatigue <= fatigue_slack + tolerance, axis=1)
+            feasible &= self.option_fatigue_total <= total_fatigue_slack + tolerance
+
+        if day < number_of_days - 1:
+            # spacing: a workout selected on one of the two previous days is not available
+            blocked = last_selected_day >= day - 2
+            blocked[-1] = False
+            feasible &= ~blocked[self.option_first] & ~blocked[self.option_second]
+
+        # divergence: a sport already ahead by more than the other sport can still catch up
+        remaining = number_of_days - day - 1
+        new_gains = gains + self.option_gain
+        catch_up = new_gains[:, self.divergence_sports[:, 0]] - new_gains[:, self.divergence_sports[:, 1]] - remaining * self.max_gain[self.divergence_sports[:, 1]]
+        feasible &= np.all(catch_up <= self.divergence_limits + tolerance, axis=1)
+
+        options = np.flatnonzero(feasible)
+        if len(options) == 0:
+            return
+
+        # bound every child at once; the last fatigue row (days 1-5) limits what days up to 5 can add
+        last_row = number_of_days - 1
+        fatigue_left = np.broadcast_to(self.fatigue_limits[last_row] - fatigue_sums[last_row], (len(options), len(sports)))
+        total_fatigue_left = np.broadcast_to(self.total_fatigue_limits[last_row] - total_fatigue_sums[last_row], (len(options),))
+        if fatigue_window_mask[last_row, day]:
+            fatigue_left = fatigue_left - self.option_fatigue[options]
+            total_fatigue_left = total_fatigue_left - self.option_fatigue_total[options]
+        child_bounds = self.round_down(fitness + self.option_fitness[options] + self.bound(day + 1, duration_left - self.option_duration[options], fatigue_left, total_fatigue_left))
+
+        promising = child_bounds > self.best_objective + tolerance
+        options = options[promising]
+        child_bounds = child_bounds[promising]
+        order = np.argsort(-child_bounds, kind="stable")
+
+        for option, child_bound in zip(options[order].tolist(), child_bounds[order].tolist()):
+            if child_bound <= self.best_objective + tolerance:
+                break # children are sorted by bound, none of the rest can do better
+
+            self.chosen[day] = option
+            next_fatigue_sums = fatigue_sums
+            next_total_fatigue_sums = total_fatigue_sums
+            if len(rows) > 0:
+                next_fatigue_sums = fatigue_sums.copy()
+                next_fatigue_sums[rows] += self.option_fatigue[option]
+                next_total_fatigue_sums = total_fatigue_sums.copy()
+                next_total_fatigue_sums[rows] += self.option_fatigue_total[option]
+            next_last_selected_day = last_selected_day
+            if day < number_of_days - 1:
+                next_last_selected_day = last_selected_day.copy()
+                next_last_selected_day[self.option_first[option]] = day
+                next_last_selected_day[self.option_second[option]] = day
+                next_last_selected_day[-1] = -10
+
+            self._visit(day + 1, fitness + self.option_fitness_list[option], duration_left - self.option_duration_list[option], next_fatigue_sums, next_total_fatigue_sums, new_gains[option], next_last_selected_day)
+            if not self.exhausted or self.stopped_at_bound:
+                return
+
+
+def knapsack_table(weight, value, repeats, max_count, capacity):
+    # best[count, c]: most value from at most `count` items of total weight at most c, every item
+    # available `repeats` times. weights are rounded down to integers, which only loosens the table.
+    capacity = int(np.floor(max(capacity, 0) + tolerance))
+    best = np.zeros((max_count + 1, capacity + 1))
+    for item_weight, item_value in zip(np.repeat(np.floor(weight + tolerance).astype(np.int64), repeats).tolist(), np.repeat(value, repeats).tolist()):
+        if item_weight > capacity:
+            continue
+        best[1:, item_weight:] = np.maximum(best[1:, item_weight:], best[:-1, :capacity + 1 - item_weight] + item_value)
+    return best
+
+
+def knapsack_bound(table, count, capacity):
+    # table value for one or many capacities; capacities past the table get its last column
+    capacity = np.floor(np.asarray(capacity, dtype=np.float64) + tolerance)
+    idx = np.clip(capacity, 0, table.shape[1] - 1).astype(np.int64)
+    return table[min(count, table.shape[0] - 1), idx]
+
+
+def optimality_gap(objective, bound):
+    if objective is None or bound is None:
+        return None
+    return max(bound - objective, 0.0) / max(abs(bound), 1e-10)
+
+
+def add_workouts_to_week_plan_search(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max, solver=None, node_limit=default_node_limit, stall_nodes=default_stall_nodes):
+    # drop-in for add_workouts_to_week_plan. the search answers on its own when it proves its week
+    # optimal; otherwise its week is handed to the MILP as a starting solution. week["search"] reports
+    # the search objective against the LP bound.
+
+    build_started = telemetry.clock()
+    available_workouts = workout_library.GetWorkoutsForWeek(week["strategy"])
+
+    matrix = workout_planner.get_week_matrix(available_workouts)
+    hours_limit = week_matrix.weekly_hours_limit(week, is_last_week_of_block, weekly_hours_max)
+    backend = solvers.get_backend(solver, time_limit=10)
+    relaxed = workout_planner.add_relaxed_workouts_if_precheck_fails(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, backend, "search", build_started)
+    if relaxed is not None:
+        return relaxed
+    b = matrix.rhs(incoming_fatigue, incoming_fitness, hours_limit)
+
+    solve_started = telemetry.clock()
+    if backend.takes_start:
+        relaxation = backend.solve_arrays(matrix.c, matrix.A, b, relaxed=True)
+        search_started = telemetry.clock()
+        if relaxation.status == solvers.status_infeasible:
+            return workout_planner.add_relaxed_workouts_to_week_plan(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, backend, None, relaxation.status, "search", build_started)
+        lp_bound = relaxation.objective if relaxation.has_solution() else None
+
+        search = WeekSearch(matrix, b)
+        result = search.run(node_limit, lp_bound, stall_nodes)
+    else:
+        # a search that proves nothing is only worth its week as a MIP start, and proofs are rare on
+        # real libraries: without starts the MILP is solved on its own
+        search_started = telemetry.clock()
+        lp_bound = None
+        result = SearchResult(None, None, False, 0)
+    search_finished = telemetry.clock()
+
+    engine = "search"
+    values = result.values
+    results = solvers.SolveResult(solvers.status_optimal, "search", values, result.objective, 0.0)
+    if not result.proven_optimal:
+        results = backend.solve_arrays(matrix.c, matrix.A, b, start=result.values)
+        if not results.has_solution():
+            return workout_planner.add_relaxed_workouts_to_week_plan(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, backend, None, results.status, "search", build_started)
+        engine = backend.name
+        values = results.values
+    elif values is None:
+        return workout_planner.add_relaxed_workouts_to_week_plan(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, backend, None, solvers.status_infeasible, "search", build_started)
+    solve_finished = telemetry.clock()
+
+    #parse results and add workouts to week
+    selection = week_matrix.selection_from_solution(matrix, values)
+    week_matrix.apply_selection_to_week(week, matrix.columns, selection, incoming_fitness)
+
+    week["search"] = {
+        "engine": engine,
+        "objective": result.objective,
+        "lp_bound": lp_bound,
+        "gap": optimality_gap(result.objective, lp_bound),
+        "proven_optimal": result.proven_optimal,
+        "nodes": result.nodes
+    }
+
+    search_seconds = search_finished - search_started
+    telemetry.report_week(
+        week, engine, solve_started - build_started, solve_finished - solve_started - search_seconds, telemetry.clock() - solve_finished,
+        results, telemetry.matrix_counts(matrix), solver=backend.name, search_seconds=search_seconds
+    )
+
+    return week
@@ -1,20 +1,18 @@
 import csv
-import pyomo.environ as pyo
 import datetime
 
 from .workouts import workouts as workout_library
+from . import week_matrix
+from . import relaxation
+from . import solvers
+from . import telemetry
+from .week_matrix import sport_to_int
 
 
+def add_workouts_to_week_plan(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max, solver=None):
 
-sport_to_int = {
-    "swim": 0,
-    "bike": 1,
-    "run": 2
-}
+    build_started = telemetry.clock()
 
-
-def add_workouts_to_week_plan(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max):
-    
     # import workout options from library
 
     available_workouts = workout_library.GetWorkoutsForWeek(week["strategy"])
@@ -45,7 +43,15 @@ def add_workouts_to_week_plan(week, incoming_fatigue, incoming_fitness, is_last_
             case "run":
                 run_workouts.append(workout_id)
 
+    # weeks no selection can make feasible are solved softened, without building the model
+    hours_limit = week_matrix.weekly_hours_limit(week, is_last_week_of_block, weekly_hours_max)
+    columns = week_matrix.WeekColumns(available_workouts)
+    relaxed = add_relaxed_workouts_if_precheck_fails(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, solvers.get_backend(solver, time_limit=10), "rule", build_started)
+    if relaxed is not None:
+        return relaxed
+
     # initialize weekly planning model
+    import pyomo.environ as pyo # deferred until a rule model is built
     model = pyo.ConcreteModel()
 
     model.IncomingFitness = incoming_fitness
@@ -204,10 +210,14 @@ def add_workouts_to_week_plan(week, incoming_fatigue, incoming_fitness, is_last_
     model.must_have_variability_in_workouts_constraint = pyo.Constraint(model.Days, model.WorkoutIds, rule=must_have_variability_in_workouts_rule)
 
 
-    # solve
-    solver = pyo.SolverFactory('glpk')
-    solver.options['tmlim'] = 10
-    results = solver.solve(model)
+    # solve - solver is a backend name or instance from solvers.py, None for the default backend
+    backend = solvers.get_backend(solver, time_limit=10)
+    solve_started = telemetry.clock()
+    results = backend.solve_model(model)
+    solve_finished = telemetry.clock()
+    if not results.has_solution():
+        # nothing to read back from the variables, their values are None
+        return add_relaxed_workouts_to_week_plan(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, backend, None, results.status, "rule", build_started)
 
 
     
@@ -217,53 +227,107 @@ def add_workouts_to_week_plan(week, incoming_fatigue, incoming_fitness, is_last_
     
 
 
+    #parse results and add workouts to week: the whole solution vector at once, in the day-major order
+    #of the matrix model
+    values = [variable.value for variable in model.SelectedWorkouts.values()]
+    selection = week_matrix.round_solution(values).reshape(week_matrix.number_of_days, len(available_workouts))
+    week_matrix.apply_selection_to_week(week, columns, selection, incoming_fitness)
+
+    telemetry.report_week(week, "rule", solve_started - build_started, solve_finished - solve_started, telemetry.clock() - solve_finished, results, telemetry.model_counts(model), solver=backend.name)
+    
+    return week
+
+
+
+# same model as add_workouts_to_week_plan, assembled as sparse coefficient arrays instead of rule callbacks
+
+week_matrix_cache = {}
+
+def get_week_matrix(available_workouts):
+    # the coefficient matrix only depends on the workout set. the catalog hands out the same tuple for
+    # a strategy until the library changes, so an identity check is enough to reuse it.
+    matrix = week_matrix_cache.get(id(available_workouts))
+    if matrix is None or matrix.columns.workouts is not available_workouts:
+        if len(week_matrix_cache) > 16:
+            week_matrix_cache.clear()
+        matrix = week_matrix.WeekMatrix(week_matrix.WeekColumns(available_workouts))
+        week_matrix_cache[id(available_workouts)] = matrix
+    return matrix
+
+
+def add_workouts_to_week_plan_matrix(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max, solver=None):
+
+    build_started = telemetry.clock()
+    available_workouts = workout_library.GetWorkoutsForWeek(week["strategy"])
+
+    matrix = get_week_matrix(available_workouts)
+    hours_limit = week_matrix.weekly_hours_limit(week, is_last_week_of_block, weekly_hours_max)
+    backend = solvers.get_backend(solver, time_limit=10)
+    relaxed = add_relaxed_workouts_if_precheck_fails(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, backend, "matrix", build_started)
+    if relaxed is not None:
+        return relaxed
+    b = matrix.rhs(incoming_fatigue, incoming_fitness, hours_limit)
+
+    # solve
+    solve_started = telemetry.clock()
+    results = backend.solve_arrays(matrix.c, matrix.A, b)
+    solve_finished = telemetry.clock()
+    if not results.has_solution():
+        return add_relaxed_workouts_to_week_plan(week, available_workouts, incoming_fatigue, incoming_fitness, hours_limit, backend, None, results.status, "matrix", build_started)
+
     #parse results and add workouts to week
-    workouts = []
+    selection = week_matrix.selection_from_solution(matrix, results.values)
+    week_matrix.apply_selection_to_week(week, matrix.columns, selection, incoming_fitness)
 
-    for day in model.Days:
-        workouts_for_day = []
-        for workout_id in model.WorkoutIds:
-            if model.SelectedWorkouts[(day,workout_id)].value == 1:
-                workouts_for_day.append(available_workouts[workout_id])
-        workouts.append(workouts_for_day)
+    telemetry.report_week(week, "matrix", solve_started - build_started, solve_finished - solve_started, telemetry.clock() - solve_finished, results, telemetry.matrix_counts(matrix), solver=backend.name)
 
-    week["workouts"] = workouts
+    return week
 
 
-    def fitness_gain(sport):
-        match sport:
-            case "swim":
-                return sum(model.SelectedWorkouts[(day,workout_id)].value*fitness_increase_dict[workout_id]*fitness_multiplier for workout_id in swim_workouts for day in model.Days)
-            case "bike":
-                return sum(model.SelectedWorkouts[(day,workout_id)].value*fitness_increase_dict[workout_id]*fitness_multiplier for workout_id in bike_workouts for day in model.Days)
-            case "run":
-                return sum(model.SelectedWorkouts[(day,workout_id)].value*fitness_increase_dict[workout_id]*fitness_multiplier for workout_id in run_workouts for day in model.Days)
+def add_relaxed_workouts_to_week_plan(week, available_workouts, incoming_fatigue, incoming_fitness, weekly_hours_limit, backend, failures, reason, engine, build_started, **limits):
+    # the week with the rows it cannot meet softened (see relaxation.py), reported as week["relaxation"].
+    # limits are the keyword limits of WeekMatrix.rhs, for callers that change them.
+    matrix = get_week_matrix(available_workouts)
+    b = matrix.rhs(incoming_fatigue, incoming_fitness, weekly_hours_limit, **limits)
 
-    
-    week["fitness_outcome"] = { 
-        "run": incoming_fitness["run"]*.95 + fitness_gain("run"), # depreciate a bit of incoming fitness and add on gains
-        "bike": incoming_fitness["bike"]*.95 + fitness_gain("bike"),
-        "swim": incoming_fitness["swim"]*.95 + fitness_gain("swim")
-    }
+    solve_started = telemetry.clock()
+    results, week_relaxation = relaxation.relax_week(matrix, b, backend, failures, reason)
+    solve_finished = telemetry.clock()
 
-    
-    def fatigue_outcome(sport):
-        day_range = range(3,6)
-        match sport:
-            case "swim":
-                return sum(model.SelectedWorkouts[(day,workout_id)].value*fatigue_increase_dict[workout_id] for workout_id in swim_workouts  for day in day_range) 
-            case "bike":
-                return sum(model.SelectedWorkouts[(day,workout_id)].value*fatigue_increase_dict[workout_id] for workout_id in bike_workouts  for day in day_range)
-            case "run":
-                return sum(model.SelectedWorkouts[(day,workout_id)].value*fatigue_increase_dict[workout_id] for workout_id in run_workouts  for day in day_range)
-    
-    week["fatigue_outcome"] = {
-        "swim":  fatigue_outcome("swim"),
-        "bike": fatigue_outcome("bike"),
-        "run": fatigue_outcome("run")
-    }
+    week_matrix.apply_selection_to_week(week, matrix.columns, week_matrix.selection_from_solution(matrix, results.values), incoming_fitness)
+    week["relaxation"] = week_relaxation
+
+    telemetry.report_week(week, engine, solve_started - build_started, solve_finished - solve_started, telemetry.clock() - solve_finished, results, telemetry.matrix_counts(matrix), solver=backend.name, relaxed=reason)
 
-    print(week["fatigue_outcome"])
-    
     return week
 
+
+def add_relaxed_workouts_if_precheck_fails(week, available_workouts, incoming_fatigue, incoming_fitness, weekly_hours_limit, backend, engine, build_started, **limits):
+    # every engine starts here: a week relaxation.precheck finds rows no selection can meet is solved
+    # softened right away. returns the relaxed week, or None when the engine should solve the week.
+    failures = relaxation.precheck(get_week_matrix(available_workouts).columns, incoming_fatigue, incoming_fitness, weekly_hours_limit, **limits)
+    if not failures:
+        return None
+    return add_relaxed_workouts_to_week_plan(week, available_workouts, incoming_fatigue, incoming_fitness, weekly_hours_limit, backend, failures, "precheck", engine, build_started, **limits)
+
+
+def iter_weeks_with_workouts(week_plan, incoming_fatigue, incoming_fitness, weekly_hours_max, add_workouts_to_week_plan=add_workouts_to_week_plan):
+    # the notebook planning loop as a generator: each week is yielded as soon as it is solved, and
+    # starts from the previous week's outcomes
+    for week_number, week in enumerate(week_plan):
+        if week_number > 0:
+            incoming_fatigue = week_plan[week_number-1]["fatigue_outcome"]
+            incoming_fitness = week_plan[week_number-1]["fitness_outcome"]
+
+        is_last_week_of_block = False
+        if week_number < len(week_plan) - 1:
+            is_last_week_of_block = week_plan[week_number+1]["start_block"]
+
+        add_workouts_to_week_plan(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max)
+        yield week
+
+
+def add_workouts_to_weeks(week_plan, incoming_fatigue, incoming_fitness, weekly_hours_max, add_workouts_to_week_plan=add_workouts_to_week_plan):
+    for week in iter_weeks_with_workouts(week_plan, incoming_fatigue, incoming_fitness, weekly_hours_max, add_workouts_to_week_plan):
+        pass
+    return week_plan
@@ -0,0 +1,187 @@
+import argparse
+import struct
+from collections.abc import Mapping
+
+import numpy as np
+
+from . import workouts
+
+# compact binary workout library.
+#
+# a library file holds every numeric column as a packed array, the names and week_blocks strings in
+# one string table, and a bitmask per workout telling which week strategies it is available for.
+# files are memory-mapped read only, so process pool workers share the pages instead of each
+# parsing the csv into its own list of dicts.
+#
+# layout (little endian, every section starts on an 8 byte boundary):
+#   header            magic, workout count, strategy count, strategy table size, string table size
+#   strategy table    strategy names joined by "\n"
+#   intensity         float64[n]
+#   duration          float64[n]
+#   fatigue_increase  float64[n]
+#   fitness_increase  float64[n]
+#   strategy_mask     uint64[n], bit i set when the workout is available in strategies[i]
+#   name_offsets      uint64[n+1] into the string table
+#   blocks_offsets    uint64[n+1] into the string table
+#   sport             uint8[n], index into workouts.sports
+#   string table      utf-8 bytes
+
+binary_suffix = ".twl"
+
+magic = b"TRIWKT01"
+header_format = "<8sQQQQ"
+header_size = struct.calcsize(header_format)
+
+numeric_fields = ["intensity", "duration", "fatigue_increase", "fitness_increase"]
+
+
+def _padding(size):
+	return -size % 8
+
+
+def compile_library(csv_paths, out_path, strategies=workouts.week_strategies):
+	records = []
+	for path in csv_paths:
+		records.extend(workouts.read_csv_library(path))
+
+	if len(strategies) > 64:
+		raise ValueError("at most 64 strategies fit in the strategy mask")
+
+	n = len(records)
+	strings = bytearray()
+	name_offsets = np.zeros(n + 1, dtype="<u8")
+	blocks_offsets = np.zeros(n + 1, dtype="<u8")
+	for idx, record in enumerate(records):
+		name_offsets[idx] = len(strings)
+		strings += record.workout_name.encode("utf-8")
+		name_offsets[idx + 1] = len(strings)
+	for idx, record in enumerate(records):
+		blocks_offsets[idx] = len(strings)
+		strings += record.week_blocks.encode("utf-8")
+		blocks_offsets[idx + 1] = len(strings)
+
+	strategy_mask = np.zeros(n, dtype="<u8")
+	for bit, week_strategy in enumerate(strategies):
+		matches = workouts.strategy_matches(week_strategy)
+		available = np.array([matches(record.as_dict()) for record in records], dtype=bool)
+		strategy_mask[available] |= np.uint64(1 << bit)
+
+	sport = np.array([workouts.sports.index(record.sport) for record in records], dtype="u1")
+	strategy_table = "\n".join(strategies).encode("utf-8")
+
+	with open(out_path, "wb") as file:
+		file.write(struct.pack(header_format, magic, n, len(strategies), len(strategy_table), len(strings)))
+
+		def write_section(data):
+			file.write(data)
+			file.write(b"\0" * _padding(len(data)))
+
+		write_section(strategy_table)
+		for field in numeric_fields:
+			write_section(np.array([getattr(record, field) for record in records], dtype="<f8").tobytes())
+		write_section(strategy_mask.tobytes())
+		write_section(name_offsets.tobytes())
+		write_section(blocks_offsets.tobytes())
+		write_section(sport.tobytes())
+		write_section(bytes(strings))
+
+	return n
+
+
+class BinaryWorkoutLibrary:
+	# read only, memory-mapped view of a compiled library file
+
+	def __init__(self, path):
+		self.path = path
+		self.buffer = np.memmap(path, dtype=np.uint8, mode="r")
+
+		file_magic, n, strategy_count, strategy_table_size, strings_size = struct.unpack_from(header_format, self.buffer, 0)
+		if file_magic != magic:
+			raise ValueError("{} is not a compiled workout library".format(path))
+		self.number_of_workouts = n
+
+		offset = header_size
+
+		def section(size):
+			nonlocal offset
+			start = offset
+			offset += size + _padding(size)
+			return self.buffer[start:start + size]
+
+		self.strategies = bytes(section(strategy_table_size)).decode("utf-8").split("\n") if strategy_count else []
+		for field in numeric_fields:
+			setattr(self, field, section(8 * n).view("<f8"))
+		self.strategy_mask = section(8 * n).view("<u8")
+		self.name_offsets = section(8 * (n + 1)).view("<u8")
+		self.blocks_offsets = section(8 * (n + 1)).view("<u8")
+		self.sport = section(n)
+		self.strings = section(strings_size)
+
+		self.workouts = tuple(WorkoutView(self, idx) for idx in range(n))
+
+	def __len__(self):
+		return self.number_of_workouts
+
+	def string(self, offsets, idx):
+		return bytes(self.strings[int(offsets[idx]):int(offsets[idx + 1])]).decode("utf-8")
+
+	def field(self, key, idx):
+		if key == "sport":
+			return workouts.sports[self.sport[idx]]
+		if key == "workout_name":
+			return self.string(self.name_offsets, idx)
+		if key == "week_blocks":
+			return self.string(self.blocks_offsets, idx)
+		if key in numeric_fields:
+			return float(getattr(self, key)[idx])
+		raise KeyError(key)
+
+	def select(self, week_strategy=None, sport=None):
+		selected = np.ones(self.number_of_workouts, dtype=bool)
+		if week_strategy is not None:
+			if week_strategy in self.strategies:
+				bit = np.uint64(1 << self.strategies.index(week_strategy))
+				selected &= (self.strategy_mask & bit) != 0
+			else:
+				# strategies compiled without a mask bit fall back to the substring test
+				selected &= np.array(list(map(workouts.strategy_matches(week_strategy), self.workouts)), dtype=bool)
+		if sport is not None:
+			selected &= self.sport == workouts.sports.index(sport)
+		return tuple(self.workouts[idx] for idx in np.flatnonzero(selected).tolist())
+
+
+class WorkoutView(Mapping):
+	# lazy stand in for a workout dict: fields are read from the mapped file on access
+
+	__slots__ = ("library", "index")
+
+	fields = ["sport", "workout_name", "intensity", "duration", "fatigue_increase", "fitness_increase", "week_blocks"]
+
+	def __init__(self, library, index):
+		self.library = library
+		self.index = index
+
+	def __getitem__(self, key):
+		return self.library.field(key, self.index)
+
+	def __iter__(self):
+		return iter(self.fields)
+
+	def __len__(self):
+		return len(self.fields)
+
+	def __repr__(self):
+		return repr(dict(self))
+
+	def __reduce__(self):
+		# plans sent between processes carry plain dicts, not references to a mapped file
+		return (dict, (dict(self),))
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description="compile csv workout libraries into one binary library file")
+	parser.add_argument("csv_paths", nargs="+")
+	parser.add_argument("-o", "--output", required=True)
+	args = parser.parse_args()
+	count = compile_library(args.csv_paths, args.output)
+	print("compiled {} workouts into {}".format(count, args.output))
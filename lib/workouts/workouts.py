@@ -1,35 +1,65 @@
 import csv
+import hashlib
+import os
+from collections.abc import Mapping
 
-workout_path = './workout_library/workouts_test.csv'
-cached_workouts = []
+from .. import telemetry
+
+# default library, resolved next to the repository instead of the current working directory.
+# TRISCHEDULE_WORKOUT_LIBRARY can point at one or more library files (separated by os.pathsep).
+workout_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'workout_library', 'workouts_test.csv')
+
+week_strategies = ["rest", "peak", "base", "build"]
+sports = ["swim", "bike", "run"]
+
+
+class Workout(Mapping):
+	# typed, read only workout record. it reads like the workout dicts the planner has always used
+	# (workout["sport"], dict(workout), == against a dict), so records go into week plans as they are.
+
+	fields = ("sport", "workout_name", "intensity", "duration", "fatigue_increase", "fitness_increase", "week_blocks")
+	__slots__ = fields
+
+	def __init__(self, sport, workout_name, intensity, duration, fatigue_increase, fitness_increase, week_blocks):
+		for field, value in zip(self.fields, (sport, workout_name, intensity, duration, fatigue_increase, fitness_increase, week_blocks)):
+			object.__setattr__(self, field, value)
+
+	def __setattr__(self, name, value):
+		raise AttributeError("workouts are read only")
+
+	def __getitem__(self, key):
+		if key not in self.fields:
+			raise KeyError(key)
+		return getattr(self, key)
+
+	def __iter__(self):
+		return iter(self.fields)
+
+	def __len__(self):
+		return len(self.fields)
+
+	def __repr__(self):
+		return repr(dict(self))
+
+	def __reduce__(self):
+		return (Workout, tuple(getattr(self, field) for field in self.fields))
+
+	@classmethod
+	def from_row(cls, row):
+		# possible improvement: use headers to generate dictionary
+		return cls(
+			sport=row[0],
+			workout_name=row[1],
+			intensity=float(row[2]),
+			duration=float(row[3]),
+			fatigue_increase=float(row[4]),
+			fitness_increase=float(row[5]),
+			week_blocks=row[6]
+		)
+
+	def as_dict(self):
+		return dict(self)
 
-def fetch_workouts_with_cache():
-	if len(cached_workouts) > 0:
-		return cached_workouts
-	else:
-		with open(workout_path, 'r') as file: 
-			workout_csv_reader = csv.reader(file)
-			line_num = 0
-			for row in workout_csv_reader:
-				# possible improvement: use headers to generate dictionary
-
-				if line_num != 0:
-					print(row)
-					# parse row and add workout to library
-					new_workout = {
-						"sport": row[0],
-						"workout_name": row[1],
-						"intensity": float(row[2]),
-						"duration": float(row[3]),
-						"fatigue_increase": float(row[4]),
-						"fitness_increase": float(row[5]),
-						"week_blocks": row[6]
-					}
-					cached_workouts.append(new_workout)
-
-				line_num += 1
-
-		return cached_workouts
 
 def strategy_matches(week_strategy):
 	def filter_function(workout):
@@ -37,10 +67,151 @@ def strategy_matches(week_strategy):
 		return not (week_strategy in workout["week_blocks"])
 	return filter_function
 
-def GetWorkoutsForWeek(week_strategy):
-	all_workouts = fetch_workouts_with_cache()
-	
-	# filter by week strategy 
-	filtered_workouts = list(filter(strategy_matches(week_strategy), all_workouts))
 
-	return filtered_workouts
+fingerprint_fields = ("sport", "workout_name", "intensity", "duration", "fatigue_increase", "fitness_increase")
+fingerprint_cache = {}
+
+def library_fingerprint(workouts):
+	# content hash of a set of workouts, for caches and files that must not be used with another
+	# library. the catalog hands out the same tuple until the library changes, so it is hashed once
+	# per tuple.
+	cached = fingerprint_cache.get(id(workouts))
+	if cached is not None and cached[0] is workouts:
+		return cached[1]
+
+	digest = hashlib.sha256()
+	for workout in workouts:
+		digest.update(repr(tuple(workout[field] for field in fingerprint_fields)).encode("utf-8"))
+	fingerprint = digest.hexdigest()
+
+	if len(fingerprint_cache) > 16:
+		fingerprint_cache.clear()
+	fingerprint_cache[id(workouts)] = (workouts, fingerprint)
+	return fingerprint
+
+
+def read_csv_library(path):
+	workouts = []
+	report_rows = telemetry.enabled()
+	with open(path, 'r') as file:
+		workout_csv_reader = csv.reader(file)
+		next(workout_csv_reader, None) # header
+		for row in workout_csv_reader:
+			if len(row) == 0:
+				continue
+			if report_rows:
+				telemetry.emit("library_row", {"path": path, "row": row})
+			workouts.append(Workout.from_row(row))
+	return workouts
+
+
+class CsvWorkoutLibrary:
+	# csv library file parsed into Workout records
+
+	def __init__(self, path):
+		self.path = path
+		self.workouts = tuple(read_csv_library(path))
+
+	def select(self, week_strategy=None, sport=None):
+		selected = self.workouts
+		if week_strategy is not None:
+			selected = filter(strategy_matches(week_strategy), selected)
+		if sport is not None:
+			selected = (workout for workout in selected if workout["sport"] == sport)
+		return tuple(selected)
+
+
+def load_library_file(path):
+	# compiled libraries (see binary_library.py) are memory-mapped, anything else is read as csv
+	from . import binary_library
+	if path.endswith(binary_library.binary_suffix):
+		return binary_library.BinaryWorkoutLibrary(path)
+	return CsvWorkoutLibrary(path)
+
+
+def library_paths():
+	paths = os.environ.get("TRISCHEDULE_WORKOUT_LIBRARY")
+	if paths:
+		return paths.split(os.pathsep)
+	return [workout_path]
+
+
+class WorkoutCatalog:
+	# workouts parsed once from one or more library files, with lookup tables by strategy and sport.
+	# lookups return the same tuple of workout records until a library file changes on disk, at which
+	# point the whole catalog is reloaded. csv libraries give Workout records, compiled libraries
+	# their lazy WorkoutView records (binary_library.py); both read like workout dicts.
+
+	def __init__(self, paths=None):
+		self.paths = list(paths) if paths is not None else library_paths()
+		self.mtimes = None
+		self.sources = []
+		self.workouts = ()
+		self.by_strategy = {}
+		self.by_sport = {}
+		self.by_strategy_and_sport = {}
+
+	def current_mtimes(self):
+		return [os.stat(path).st_mtime_ns for path in self.paths]
+
+	def reload_if_changed(self):
+		mtimes = self.current_mtimes()
+		if mtimes != self.mtimes:
+			self.load()
+			self.mtimes = mtimes
+
+	def load(self):
+		sources = [load_library_file(path) for path in self.paths]
+
+		self.workouts = tuple(workout for source in sources for workout in source.workouts)
+
+		self.by_strategy = {}
+		self.by_strategy_and_sport = {}
+		self.sources = sources
+		for week_strategy in week_strategies:
+			self.index_strategy(week_strategy)
+
+		self.by_sport = {sport: self.select(sport=sport) for sport in sports}
+
+	def select(self, week_strategy=None, sport=None):
+		return tuple(workout for source in self.sources for workout in source.select(week_strategy, sport))
+
+	def index_strategy(self, week_strategy):
+		matching = self.select(week_strategy)
+		self.by_strategy[week_strategy] = matching
+		self.by_strategy_and_sport[week_strategy] = {sport: self.select(week_strategy, sport) for sport in sports}
+		return matching
+
+	def all_workouts(self):
+		self.reload_if_changed()
+		return self.workouts
+
+	def workouts_for_week(self, week_strategy):
+		self.reload_if_changed()
+		matching = self.by_strategy.get(week_strategy)
+		if matching is None:
+			# strategies outside week_strategies are indexed the first time they are asked for
+			matching = self.index_strategy(week_strategy)
+		return matching
+
+	def workouts_for_sport(self, sport, week_strategy=None):
+		if week_strategy is None:
+			self.reload_if_changed()
+			return self.by_sport.get(sport, ())
+		self.workouts_for_week(week_strategy)
+		return self.by_strategy_and_sport[week_strategy].get(sport, ())
+
+
+default_catalog = WorkoutCatalog()
+
+def use_library(*paths):
+	# point the module level lookups at other library files
+	global default_catalog
+	default_catalog = WorkoutCatalog(paths)
+	return default_catalog
+
+def fetch_workouts_with_cache():
+	return default_catalog.all_workouts()
+
+def GetWorkoutsForWeek(week_strategy):
+	return default_catalog.workouts_for_week(week_strategy)
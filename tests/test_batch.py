@@ -0,0 +1,25 @@
+import multiprocessing
+
+import pytest
+
+from lib.workouts import workouts as workout_library
+from lib import batch
+from lib.benchmark import synthetic_config
+
+
+def athletes():
+    return [dict(synthetic_config(4, weekly_hours), current_fitness=current_fitness) for weekly_hours, current_fitness in [(5, 50), (6, 40), (4, 60)]]
+
+
+@pytest.mark.parametrize("engine", batch.engines)
+def test_plans_do_not_depend_on_the_number_of_workers(small_library_path, monkeypatch, engine):
+    # spawned workers load the library named in the environment, not the one this process uses
+    monkeypatch.setenv("TRISCHEDULE_WORKOUT_LIBRARY", small_library_path)
+    spawn = multiprocessing.get_context("spawn")
+    one_worker = dict(batch.plan_athletes(athletes(), workers=1, engine=engine, mp_context=spawn))
+    two_workers = dict(batch.plan_athletes(athletes(), workers=2, engine=engine, mp_context=spawn))
+    assert sorted(one_worker) == [0, 1, 2]
+    assert two_workers == one_worker
+    assert all(len(plan) == 4 for plan in one_worker.values())
+    library = workout_library.WorkoutCatalog([small_library_path]).all_workouts()
+    assert all(workout in library for plan in one_worker.values() for week in plan for day in week["workouts"] for workout in day)
@@ -0,0 +1,48 @@
+import pickle
+
+import pytest
+
+from lib.workouts import workouts as workout_library
+from lib import batch
+from lib import benchmark
+from lib import compact_plan
+from lib.benchmark import synthetic_config
+
+
+@pytest.fixture
+def planned_weeks(small_library):
+    return batch.create_training_plan(synthetic_config(6, 5))
+
+
+def week_fields(week):
+    return {key: week[key] for key in compact_plan.CompactWeek.keys_of_week}
+
+
+def test_week_views_read_like_the_planned_weeks(planned_weeks):
+    plan = compact_plan.CompactPlan.from_week_plan(planned_weeks)
+    assert len(plan) == len(planned_weeks)
+    for week, view in zip(planned_weeks, plan):
+        assert dict(view) == week_fields(week)
+        assert list(view["fitness_outcome"]) == list(week["fitness_outcome"])
+        assert all(compact is original for compact_day, day in zip(view["workouts"], week["workouts"]) for compact, original in zip(compact_day, day))
+    assert dict(plan[-1]) == week_fields(planned_weeks[-1])
+    assert [dict(view) for view in plan[1:3]] == [week_fields(week) for week in planned_weeks[1:3]]
+    with pytest.raises(IndexError):
+        plan[len(plan)]
+
+
+def test_bytes_and_pickles_round_trip(planned_weeks):
+    plan = compact_plan.CompactPlan.from_week_plan(planned_weeks)
+    expected = [week_fields(week) for week in planned_weeks]
+    assert compact_plan.CompactPlan.from_bytes(plan.to_bytes()).to_week_plan() == expected
+    assert pickle.loads(pickle.dumps(plan)).to_week_plan() == expected
+
+
+def test_plan_is_refused_by_another_library(planned_weeks, tmp_path):
+    data = compact_plan.CompactPlan.from_week_plan(planned_weeks).to_bytes()
+    other = workout_library.WorkoutCatalog([benchmark.synthetic_library(str(tmp_path), 30, seed=1)]).all_workouts()
+    assert workout_library.library_fingerprint(other) != workout_library.library_fingerprint(workout_library.fetch_workouts_with_cache())
+    with pytest.raises(ValueError):
+        compact_plan.CompactPlan.from_bytes(data, other)
+    with pytest.raises(ValueError):
+        compact_plan.CompactPlan.from_bytes(b"NOTAPLAN" + data[8:])
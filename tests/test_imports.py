@@ -0,0 +1,23 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from lib import cli
+
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("name", cli.light_modules)
+def test_light_module_imports_within_budget(name):
+    # each module in a fresh interpreter, as cli check-imports measures it
+    measured = cli.measure_import("lib." + name)
+    assert measured["loaded"] == []
+    assert measured["seconds"] <= cli.default_import_budget
+
+
+def test_check_imports_command_passes():
+    completed = subprocess.run([sys.executable, "-m", "lib.cli", "check-imports"], cwd=root, capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stdout
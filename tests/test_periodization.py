@@ -0,0 +1,35 @@
+import datetime
+
+import pytest
+
+from lib import periodization
+from lib.benchmark import synthetic_config
+
+
+def notebook_config():
+    return {
+        "start_date": datetime.date(2025, 1, 31),
+        "race_date": datetime.date(2025, 6, 28),
+        "max_block_weeks": 4
+    }
+
+
+def test_table_keeps_the_plan_the_milp_gave_through_glpk():
+    # the season of TriSchedule.ipynb, as the original MILP planned it
+    weeks = periodization.create_linear_periodization_plan(notebook_config())
+    assert [week_number for week_number, week in enumerate(weeks) if week["start_block"]] == [0, 4, 7, 10, 13, 17]
+    assert [week["strategy"] for week in weeks] == ["base"] * 13 + ["build"] * 7 + ["peak"] * 2
+
+
+@pytest.mark.parametrize("max_block_weeks", [2, 3, 4, 5])
+@pytest.mark.parametrize("number_of_weeks", [1, 4, 9, 14, 17, 22, 30])
+def test_table_matches_the_milp_objective(number_of_weeks, max_block_weeks):
+    config = dict(synthetic_config(number_of_weeks), max_block_weeks=max_block_weeks)
+    table = periodization.create_linear_periodization_plan(config)
+    milp = periodization.create_linear_periodization_plan(config, method="milp", solver="highs")
+    assert periodization.periodization_objective(table) == periodization.periodization_objective(milp)
+
+
+def test_ties_go_to_the_longest_first_block():
+    assignment = periodization.periodization_table(12, 4)
+    assert [week for week, (_, start_block) in enumerate(assignment) if start_block] == [0, 4, 8]
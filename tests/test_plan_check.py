@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from lib.workouts import workouts as workout_library
+from lib import batch
+from lib import periodization
+from lib import plan_check
+from lib import workout_planner
+from lib import week_matrix
+from lib.benchmark import synthetic_config
+from lib.week_matrix import sports, number_of_days
+
+
+def state(values):
+    return {sport: float(value) for sport, value in zip(sports, values)}
+
+
+# rows the evaluator reports with the same shape as the WeekMatrix row group
+row_groups = ["max_workouts_per_day", "max_workouts_per_day_by_sport", "must_not_exceed_max_fatigue_by_sport",
+              "must_not_exceed_max_total_fatigue", "must_not_exceed_weekly_duration_limit", "must_not_exceed_divergence_limit"]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_evaluation_matches_solver_rows(small_library, seed):
+    # random (mostly infeasible) selections: every row's excess is max(A x - b, 0) of the weekly model,
+    # with each week's b from the evaluated outcomes of the week before
+    rng = np.random.default_rng(seed)
+    config = synthetic_config(4)
+    week_plan = periodization.create_linear_periodization_plan(config)
+    initial_fatigue, initial_fitness = batch.initial_state(config)
+    check = plan_check.PlanCheck(week_plan, config["max_weekly_training"])
+
+    week_selections = []
+    rows = []
+    for week_number, week in enumerate(week_plan):
+        available_workouts = workout_library.GetWorkoutsForWeek(week["strategy"])
+        selection = (rng.random((number_of_days, len(available_workouts))) < .1).astype(np.float64)
+        week_selections.append(selection)
+        catalog_ids = check.workout_ids(available_workouts)
+        for day, workout_id in zip(*np.nonzero(selection)):
+            rows.append((week_number, day, catalog_ids[workout_id]))
+    evaluation = check.evaluate(np.array(rows), initial_fatigue, initial_fitness)
+
+    incoming_fatigue, incoming_fitness = initial_fatigue, initial_fitness
+    for week_number, (week, selection) in enumerate(zip(week_plan, week_selections)):
+        matrix = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(week["strategy"]))
+        b = matrix.rhs(incoming_fatigue, incoming_fitness, check.hours_limit[week_number])
+        excess = np.maximum(matrix.A @ selection.ravel() - b, 0)
+        for group in row_groups:
+            expected = excess[matrix.row_groups[group]]
+            assert evaluation.excess[group][0, week_number].ravel() == pytest.approx(expected, abs=1e-9), group
+        variability = excess[matrix.row_groups["must_have_variability_in_workouts"]]
+        assert bool(evaluation.excess["must_have_variability_in_workouts"][0, week_number] > 0) == bool((variability > 0).any())
+
+        planned = week_matrix.apply_selection_to_week({}, matrix.columns, selection, incoming_fitness)
+        assert evaluation.fitness[0, week_number] == pytest.approx([planned["fitness_outcome"][sport] for sport in sports])
+        assert evaluation.fatigue[0, week_number] == pytest.approx([planned["fatigue_outcome"][sport] for sport in sports])
+        incoming_fatigue, incoming_fitness = state(evaluation.fatigue[0, week_number]), state(evaluation.fitness[0, week_number])
+
+
+def test_solved_plan_has_no_violations(small_library):
+    config = synthetic_config(4)
+    week_plan = batch.create_training_plan(config)
+    assert plan_check.check_training_plan(config, week_plan) == []
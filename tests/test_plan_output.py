@@ -0,0 +1,98 @@
+import csv
+import datetime
+import json
+
+import pytest
+
+from lib import batch
+from lib import cli
+from lib import plan_output
+from lib.benchmark import synthetic_config
+
+
+@pytest.fixture
+def planned_weeks(small_library):
+    return batch.create_training_plan(synthetic_config(4, 5))
+
+
+def print_to_csv(filename, week_plan):
+    # the notebook's writer, one file per week
+    with open(filename, "wt") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Plan for {} week starting {}".format(week_plan["strategy"],week_plan["start_date"])])
+        writer.writerow(["date", "sport", "name", "intensity", "duration"])
+        for day, day_workouts in enumerate(week_plan["workouts"]):
+            for workout in day_workouts:
+                writer.writerow([week_plan["start_date"] + datetime.timedelta(days=day), workout["sport"], workout["workout_name"], workout["intensity"], workout["duration"]])
+
+
+def read_rows(path):
+    with open(path, newline="") as file:
+        return list(csv.reader(file))
+
+
+def read_text(path):
+    with open(path, newline="") as file:
+        return file.read()
+
+
+def test_csv_rows_match_the_notebooks_files(planned_weeks, tmp_path):
+    path = str(tmp_path / "plan.csv")
+    with plan_output.CsvPlanWriter(path) as writer:
+        assert writer.write_weeks(planned_weeks, plan=7) == len(planned_weeks)
+
+    rows = read_rows(path)
+    assert rows[0] == plan_output.csv_header
+    for week_number, week in enumerate(planned_weeks):
+        week_path = str(tmp_path / "week_{}.csv".format(week_number))
+        print_to_csv(week_path, week)
+        week_rows = [row[3:] for row in rows[1:] if row[1] == str(week_number)]
+        assert week_rows == read_rows(week_path)[2:]
+        assert all(row[:3] == ["7", str(week_number), week["strategy"]] for row in rows[1:] if row[1] == str(week_number))
+
+
+@pytest.mark.parametrize("writer_class", [plan_output.CsvPlanWriter, plan_output.JsonlPlanWriter])
+def test_appending_writers_continue_one_file(planned_weeks, tmp_path, writer_class):
+    whole = str(tmp_path / "whole")
+    with writer_class(whole) as writer:
+        writer.write_weeks(planned_weeks)
+
+    appended = str(tmp_path / "appended")
+    with writer_class(appended) as writer:
+        writer.write_weeks(planned_weeks[:2])
+    with writer_class(appended) as writer:
+        kept = list(writer.write_plan(planned_weeks[2:]))
+    assert kept == planned_weeks[2:]
+
+    # week numbers restart in the second writer, everything else is the same
+    def without_week_numbers(text):
+        if writer_class is plan_output.CsvPlanWriter:
+            return [row[:1] + row[2:] for row in csv.reader(text.splitlines())]
+        return [dict(json.loads(line), week=None) for line in text.splitlines()]
+
+    assert without_week_numbers(read_text(appended)) == without_week_numbers(read_text(whole))
+    if writer_class is plan_output.CsvPlanWriter:
+        assert read_rows(appended).count(plan_output.csv_header) == 1
+
+
+@pytest.mark.parametrize("output_format", cli.output_formats)
+def test_stdout_gets_what_a_file_gets(planned_weeks, tmp_path, capsys, output_format):
+    path = str(tmp_path / "plan")
+    with cli.plan_writer(path, output_format) as writer:
+        writer.write_weeks(planned_weeks)
+    with cli.plan_writer("-", output_format) as writer:
+        writer.write_weeks(planned_weeks)
+    assert capsys.readouterr().out == read_text(path)
+
+
+def test_jsonl_records_are_the_weeks(planned_weeks, tmp_path):
+    path = str(tmp_path / "plan.jsonl")
+    with plan_output.JsonlPlanWriter(path) as writer:
+        writer.write_weeks(planned_weeks, plan=3)
+    records = [json.loads(line) for line in read_text(path).splitlines()]
+    assert [record["week"] for record in records] == list(range(len(planned_weeks)))
+    assert all(record["plan"] == 3 for record in records)
+    for record, week in zip(records, planned_weeks):
+        assert record["start_date"] == week["start_date"].isoformat()
+        assert [[workout["workout_name"] for workout in day] for day in record["workouts"]] == [[workout["workout_name"] for workout in day] for day in week["workouts"]]
+        assert record["fatigue_outcome"] == week["fatigue_outcome"]
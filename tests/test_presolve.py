@@ -0,0 +1,65 @@
+import csv
+
+import pytest
+
+from lib.workouts import workouts as workout_library
+from lib import presolve
+from lib import workout_planner
+from lib.replan import week_selection
+from lib.week_matrix import fitness_carryover, sports
+
+
+@pytest.fixture
+def library_with_copies(small_library_path, tmp_path):
+    # the small library, with its first workouts of every sport copied six times and each given a
+    # longer, more tiring variant with the same fitness, which the copies dominate
+    with open(small_library_path, newline="") as file:
+        rows = list(csv.reader(file))
+    header, rows = rows[0], rows[1:]
+    extra = []
+    for row in rows[:6]:
+        extra.extend([list(row) for _ in range(5)])
+        dominated = list(row)
+        dominated[3] = str(int(row[3]) + 15)
+        dominated[4] = str(int(row[4]) + 5)
+        dominated[1] = row[1] + " long"
+        extra.append(dominated)
+    path = tmp_path / "library_with_copies.csv"
+    with open(path, "wt", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows + extra)
+
+    catalog = workout_library.default_catalog
+    workout_library.use_library(str(path))
+    yield workout_library.default_catalog
+    workout_library.default_catalog = catalog
+
+
+def fitness_gain(week, incoming_fitness):
+    return sum(week["fitness_outcome"][sport] - incoming_fitness[sport] * fitness_carryover for sport in sports)
+
+
+@pytest.mark.parametrize("strategy", ["base", "build", "peak", "rest"])
+@pytest.mark.parametrize("incoming_fatigue", [{"swim": 30, "bike": 30, "run": 30}, {"swim": 65, "bike": 5, "run": 40}])
+def test_presolved_week_matches_full_week(library_with_copies, strategy, incoming_fatigue):
+    incoming_fitness = {"swim": 50, "bike": 48, "run": 53}
+    presolved = presolve.presolve(workout_library.GetWorkoutsForWeek(strategy))
+    stats = presolved.stats()
+    assert stats["merged_duplicates"] > 0
+    assert stats["variables_after"] < stats["variables_before"]
+
+    full = workout_planner.add_workouts_to_week_plan_matrix({"strategy": strategy}, incoming_fatigue, incoming_fitness, False, 8)
+    reduced = presolve.add_workouts_to_week_plan_presolved({"strategy": strategy}, incoming_fatigue, incoming_fitness, False, 8)
+    assert fitness_gain(reduced, incoming_fitness) == pytest.approx(fitness_gain(full, incoming_fitness), abs=1e-6)
+
+    # the expanded week meets every row of the full model
+    matrix = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(strategy))
+    b = matrix.rhs(incoming_fatigue, incoming_fitness, 8)
+    assert (matrix.A @ week_selection(matrix.columns, reduced).ravel() <= b + 1e-9).all()
+
+
+def test_dominated_workouts_are_dropped(library_with_copies):
+    presolved = presolve.presolve(workout_library.GetWorkoutsForWeek("base"))
+    assert presolved.stats()["dominated"] > 0
+    assert not any(workout["workout_name"].endswith(" long") for workout in presolved.representatives)
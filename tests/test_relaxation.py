@@ -0,0 +1,64 @@
+import pytest
+
+from lib.workouts import workouts as workout_library
+from lib import relaxation
+from lib import solvers
+from lib import sweep
+from lib import week_matrix
+from lib import workout_planner
+from lib.benchmark import synthetic_config
+
+
+fitness = {"swim": 50, "bike": 50, "run": 50}
+over_swim_limit = {"swim": 100, "bike": 30, "run": 30} # above fatigue_upper_bound on days 0 and 1, and the total on day 0
+
+
+def base_week():
+    return {"strategy": "base", "start_block": False}
+
+
+def week_engines():
+    from lib import presolve
+    from lib import replan
+    from lib import solve_budget
+    from lib import week_planner
+    from lib import week_search
+    return {
+        "rule": workout_planner.add_workouts_to_week_plan,
+        "matrix": workout_planner.add_workouts_to_week_plan_matrix,
+        "presolve": presolve.add_workouts_to_week_plan_presolved,
+        "search": week_search.add_workouts_to_week_plan_search,
+        "replan": replan.add_workouts_to_week_plan_near(base_week()),
+        "budget": solve_budget.SolveBudget(60, [base_week()]).add_workouts_to_week_plan,
+        "persistent": week_planner.WeekPlanner().add_workouts_to_week_plan
+    }
+
+
+@pytest.mark.parametrize("engine", ["rule", "matrix", "presolve", "search", "replan", "budget", "persistent"])
+def test_every_engine_solves_a_week_failing_precheck_softened(small_library, engine):
+    week = week_engines()[engine](base_week(), over_swim_limit, fitness, False, 8)
+    assert week["relaxation"]["reason"] == "precheck"
+    assert {failure["constraint"] for failure in week["relaxation"]["failed_checks"]} == {"must_not_exceed_max_fatigue_by_sport", "must_not_exceed_max_total_fatigue"}
+    assert len(week["workouts"]) == week_matrix.number_of_days
+
+
+def test_relax_week_softens_every_row_when_the_failed_rows_are_not_enough(small_library):
+    matrix = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek("base"))
+    b = matrix.rhs(over_swim_limit, fitness, 8)
+    failures = relaxation.precheck(matrix.columns, over_swim_limit, fitness, 8)
+    assert len(failures) == 3
+
+    backend = solvers.get_backend()
+    partial, _ = relaxation.solve_relaxed(matrix, b, backend, failures[:1])
+    assert not partial.has_solution()
+
+    results, week_relaxation = relaxation.relax_week(matrix, b, backend, failures[:1])
+    assert results.has_solution()
+    assert week_relaxation["failed_checks"] == failures[:1]
+    assert week_relaxation["relaxed_rows"]
+
+
+def test_sweep_below_incoming_fatigue_relaxes_weeks(small_library):
+    rows = sweep.sweep(synthetic_config(2), {"fatigue_upper_bound": [20]}, workers=0)
+    assert [row["parameter"] for row in rows] == ["base", "fatigue_upper_bound"]
+    assert rows[1]["weeks_solved"] == 2
@@ -0,0 +1,75 @@
+import copy
+
+from lib.workouts import workouts as workout_library
+from lib import replan
+from lib import solvers
+from lib import week_matrix
+from lib import workout_planner
+
+
+fitness = {"swim": 50, "bike": 50, "run": 50}
+fatigue = {"swim": 30, "bike": 30, "run": 30}
+
+
+def test_exact_backend_copies_a_backend_at_zero_gap():
+    backend = solvers.HighsBackend(time_limit=5, options={"mip_rel_gap": .01, "threads": 1})
+    exact = solvers.get_exact_backend(backend)
+    assert exact.time_limit == 5
+    assert exact.options == {"mip_rel_gap": 0, "threads": 1}
+    assert backend.options["mip_rel_gap"] == .01
+    assert solvers.get_exact_backend("glpk").options == {"mipgap": 0}
+
+
+def test_near_engine_keeps_the_stored_week(small_library):
+    for strategy in ["base", "peak"]:
+        stored = workout_planner.add_workouts_to_week_plan_matrix({"strategy": strategy, "start_block": False}, fatigue, fitness, False, 8)
+        week = replan.add_workouts_to_week_plan_near(stored)(replan.unplanned_copy(copy.deepcopy(stored)), fatigue, fitness, False, 8)
+        columns = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(strategy)).columns
+        assert (replan.week_selection(columns, week) == replan.week_selection(columns, stored)).all()
+        assert week["fitness_outcome"] == stored["fitness_outcome"]
+        assert len(week["workouts"]) == week_matrix.number_of_days
+
+
+def planned_season(number_of_weeks=8):
+    from lib import batch
+    from lib.benchmark import synthetic_config
+    return batch.create_training_plan(synthetic_config(number_of_weeks, 5))
+
+
+def test_replan_keeps_the_weeks_before_the_changed_one(small_library):
+    plan = planned_season()
+    stored = copy.deepcopy(plan)
+    result = replan.replan_from_week(plan, 3, dict(plan[2]["fatigue_outcome"], run=0), plan[2]["fitness_outcome"], 5)
+    assert all(result.week_plan[week_number] is plan[week_number] for week_number in range(3))
+    assert result.resolved_weeks[0] == 3
+    assert plan == stored
+
+
+def test_replan_reuses_the_stored_weeks_once_outcomes_converge(small_library):
+    plan = planned_season()
+    incoming_fatigue = {sport: fatigue - .5 for sport, fatigue in plan[2]["fatigue_outcome"].items()}
+    result = replan.replan_from_week(plan, 3, incoming_fatigue, plan[2]["fitness_outcome"], 5)
+    assert result.resolved_weeks == [3]
+    assert result.converged_at == 4
+    assert replan.outcome_difference(result.week_plan[3], plan[3]) <= replan.default_tolerance
+    assert all(result.week_plan[week_number] is plan[week_number] for week_number in range(4, len(plan)))
+
+
+def test_replan_carries_a_change_that_does_not_fade_to_the_end(small_library):
+    plan = planned_season()
+    incoming_fitness = {sport: fitness + 20 for sport, fitness in plan[2]["fitness_outcome"].items()}
+    states = []
+
+    def near(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max):
+        states.append((dict(incoming_fatigue), dict(incoming_fitness)))
+        week_number = len(states) + 2
+        return replan.add_workouts_to_week_plan_near(plan[week_number])(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max)
+
+    result = replan.replan_from_week(plan, 3, plan[2]["fatigue_outcome"], incoming_fitness, 5, near)
+    assert result.resolved_weeks == list(range(3, len(plan)))
+    assert result.converged_at is None
+    assert states[0][1] == incoming_fitness
+    for week_number, (incoming_fatigue, week_incoming_fitness) in enumerate(states[1:], start=4):
+        assert incoming_fatigue == result.week_plan[week_number - 1]["fatigue_outcome"]
+        assert week_incoming_fitness == result.week_plan[week_number - 1]["fitness_outcome"]
+    assert all(replan.outcome_difference(result.week_plan[week_number], plan[week_number]) > replan.default_tolerance for week_number in result.resolved_weeks)
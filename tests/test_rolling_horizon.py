@@ -0,0 +1,49 @@
+import copy
+
+import pytest
+
+from lib import batch
+from lib import periodization
+from lib import plan_check
+from lib import rolling_horizon
+from lib import workout_planner
+from lib.benchmark import synthetic_config
+from lib.week_matrix import sports
+
+
+def season(number_of_weeks=4):
+    config = synthetic_config(number_of_weeks)
+    incoming_fatigue, incoming_fitness = batch.initial_state(config)
+    return config, periodization.create_linear_periodization_plan(config), incoming_fatigue, incoming_fitness
+
+
+def plan_summary(week_plan):
+    return [
+        ([[workout["workout_name"] for workout in day] for day in week["workouts"]], week["fatigue_outcome"], week["fitness_outcome"], week.get("relaxation"))
+        for week in week_plan
+    ]
+
+
+@pytest.mark.parametrize("incoming_fatigue", [None, {"swim": 100, "bike": 30, "run": 30}])
+def test_horizon_one_matches_matrix_engine(small_library, incoming_fatigue):
+    config, week_plan, initial_fatigue, incoming_fitness = season()
+    incoming_fatigue = incoming_fatigue or initial_fatigue
+    sequential = workout_planner.add_workouts_to_weeks(copy.deepcopy(week_plan), incoming_fatigue, incoming_fitness, config["max_weekly_training"], workout_planner.add_workouts_to_week_plan_matrix)
+    rolling = rolling_horizon.add_workouts_to_weeks_rolling(copy.deepcopy(week_plan), incoming_fatigue, incoming_fitness, config["max_weekly_training"], horizon=1)
+    assert plan_summary(rolling) == plan_summary(sequential)
+
+
+@pytest.mark.parametrize("horizon, commit_weeks", [(2, 1), (2, 2)])
+def test_windows_meet_every_constraint_and_do_not_lose_fitness(small_library, horizon, commit_weeks):
+    # a window holds the sequential plan of its weeks, so its objective is never worse
+    config, week_plan, incoming_fatigue, incoming_fitness = season(2)
+    sequential = batch.create_training_plan(config)
+    rolling = rolling_horizon.add_workouts_to_weeks_rolling(copy.deepcopy(week_plan), incoming_fatigue, incoming_fitness, config["max_weekly_training"], horizon, commit_weeks)
+    assert plan_check.check_training_plan(config, rolling) == []
+    if horizon == len(week_plan):
+        assert sum(rolling[-1]["fitness_outcome"][sport] for sport in sports) >= sum(sequential[-1]["fitness_outcome"][sport] for sport in sports) - 1e-6
+
+
+def test_window_sizes_are_checked():
+    with pytest.raises(ValueError):
+        list(rolling_horizon.iter_windows([], {}, {}, 8, horizon=2, commit_weeks=3))
@@ -0,0 +1,156 @@
+import asyncio
+import concurrent.futures
+import json
+
+import pytest
+
+from lib import batch
+from lib import service as plan_service
+
+
+class RecordingWriter:
+
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def is_closing(self):
+        return False
+
+    def close(self):
+        pass
+
+
+def idle_service():
+    # a service with one job in flight that never solves a week
+    service = plan_service.PlanningService(executor=concurrent.futures.ThreadPoolExecutor(1))
+    job = plan_service.PlanJob("key")
+    job.task = asyncio.ensure_future(asyncio.sleep(3600))
+    service.jobs[job.key] = job
+    return service, job
+
+
+def test_cancelled_stream_ends_the_response_and_cancels_the_job():
+    async def cancel_stream():
+        service, job = idle_service()
+        writer = RecordingWriter()
+        stream = asyncio.ensure_future(plan_service.stream_plan(writer, service, job))
+        await asyncio.sleep(0.01)
+        assert job.subscribers == 1
+        stream.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await stream
+        await asyncio.sleep(0)
+        service.executor.shutdown()
+        return writer, job
+
+    writer, job = asyncio.run(cancel_stream())
+    assert job.subscribers == 0
+    assert job.task.cancelled()
+    assert b'"error": "cancelled"' in writer.data
+    assert writer.data.endswith(b"0\r\n\r\n")
+
+
+@pytest.mark.parametrize("content_length", ["ten", "-1"])
+def test_malformed_content_length_is_a_bad_request(content_length):
+    async def post():
+        service = plan_service.PlanningService(executor=concurrent.futures.ThreadPoolExecutor(1))
+        server = await asyncio.start_server(lambda reader, writer: plan_service.handle_connection(service, reader, writer), "127.0.0.1", 0)
+        async with server:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write("POST /plan HTTP/1.1\r\nContent-Length: {}\r\n\r\n".format(content_length).encode("latin-1"))
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        service.close()
+        return response
+
+    response = asyncio.run(post())
+    assert response.startswith(b"HTTP/1.1 400 Bad Request")
+    assert b"Content-Length" in response
+
+
+class StalledExecutor(concurrent.futures.Executor):
+    # an executor whose calls never finish, so submitted plans stay in flight
+
+    def submit(self, fn, *args, **kwargs):
+        return concurrent.futures.Future()
+
+
+def plan_request(number_of_weeks, weekly_hours=5):
+    from lib.benchmark import synthetic_config
+    return json.dumps({"config": synthetic_config(number_of_weeks, weekly_hours)}, default=str).encode("utf-8")
+
+
+async def post(address, body):
+    reader, writer = await asyncio.open_connection(*address)
+    writer.write(b"POST /plan HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+def response_lines(response):
+    # the JSON lines of a chunked response, without the chunk sizes
+    body = response.partition(b"\r\n\r\n")[2]
+    return [json.loads(line) for line in body.split(b"\r\n") if line.startswith(b"{")]
+
+
+def test_identical_requests_share_one_plan(small_library):
+    async def post_twice():
+        service = plan_service.PlanningService(executor=concurrent.futures.ThreadPoolExecutor(1))
+        server = await asyncio.start_server(lambda reader, writer: plan_service.handle_connection(service, reader, writer), "127.0.0.1", 0)
+        async with server:
+            address = server.sockets[0].getsockname()[:2]
+            responses = await asyncio.gather(post(address, plan_request(3)), post(address, plan_request(3)))
+        status = service.status()
+        service.close()
+        return responses, status
+
+    responses, status = asyncio.run(post_twice())
+    assert status["coalesced"] == 1
+    assert status["in_flight"] == 0
+    first, second = [response_lines(response) for response in responses]
+    assert [line["week"] for line in first] == [0, 1, 2]
+    assert first == second
+
+
+def test_requests_beyond_max_pending_are_turned_away():
+    async def post_one_too_many():
+        service = plan_service.PlanningService(max_pending=2, executor=StalledExecutor())
+        for number_of_weeks in (3, 4):
+            service.submit(batch.config_from_json(json.loads(plan_request(number_of_weeks))))
+        server = await asyncio.start_server(lambda reader, writer: plan_service.handle_connection(service, reader, writer), "127.0.0.1", 0)
+        async with server:
+            response = await post(server.sockets[0].getsockname()[:2], plan_request(5))
+        status = service.status()
+        service.close()
+        await asyncio.sleep(0)
+        return response, status
+
+    response, status = asyncio.run(post_one_too_many())
+    assert response.startswith(b"HTTP/1.1 503 Service Unavailable")
+    assert "Retry-After: {}".format(plan_service.default_retry_after).encode("latin-1") in response
+    assert status == {"in_flight": 2, "max_pending": 2, "coalesced": 0, "rejected": 1}
+
+
+def test_cancelled_plan_finishes_its_job_and_stays_cancelled():
+    async def cancel_plan():
+        service = plan_service.PlanningService(executor=StalledExecutor())
+        job = service.submit(batch.config_from_json(json.loads(plan_request(3))))
+        await asyncio.sleep(0)
+        job.task.cancel()
+        await asyncio.gather(job.task, return_exceptions=True)
+        return service, job
+
+    service, job = asyncio.run(cancel_plan())
+    assert job.task.cancelled()
+    assert job.done
+    assert isinstance(job.error, asyncio.CancelledError)
+    assert service.jobs == {}
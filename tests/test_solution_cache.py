@@ -0,0 +1,131 @@
+import copy
+
+import numpy as np
+
+from lib.workouts import workouts as workout_library
+from lib import benchmark
+from lib import solution_cache
+from lib import week_matrix
+from lib import workout_planner
+
+
+fitness = {"swim": 50, "bike": 50, "run": 50}
+fatigue = {"swim": 30, "bike": 30, "run": 30}
+over_swim_limit = {"swim": 100, "bike": 30, "run": 30}
+
+
+def base_week():
+    return {"strategy": "base", "start_block": False}
+
+
+def entry(workout_id):
+    return {"selection": [[workout_id]] + [[] for _ in range(week_matrix.number_of_days - 1)], "relaxation": None}
+
+
+def rows_met(week, incoming_fatigue, hours):
+    available_workouts = workout_library.GetWorkoutsForWeek(week["strategy"])
+    matrix = workout_planner.get_week_matrix(available_workouts)
+    selection = solution_cache.selection_positions(week, available_workouts)
+    b = matrix.rhs(incoming_fatigue, fitness, hours)
+    return np.all(matrix.A @ solution_cache.selection_values(matrix, selection).ravel() <= b + 1e-9)
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    cache = solution_cache.WeeklySolutionCache(maxsize=2)
+    cache.put("a", entry(0))
+    cache.put("b", entry(1))
+    cache.get("a")
+    cache.put("c", entry(2))
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.get("b") is None
+
+
+def test_cache_info_counts_hits_and_misses():
+    cache = solution_cache.WeeklySolutionCache(maxsize=8)
+    cache.put("a", entry(0))
+    cache.get("a")
+    cache.get("a")
+    cache.get("b")
+    assert cache.cache_info() == solution_cache.CacheInfo(hits=2, misses=1, disk_hits=0, maxsize=8, currsize=1)
+    cache.clear()
+    assert cache.cache_info() == solution_cache.CacheInfo(hits=0, misses=0, disk_hits=0, maxsize=8, currsize=0)
+
+
+def test_entries_survive_in_sqlite_across_instances(tmp_path):
+    path = str(tmp_path / "weeks.sqlite")
+    first = solution_cache.WeeklySolutionCache(path=path)
+    first.put("a", entry(3))
+    first.close()
+
+    second = solution_cache.WeeklySolutionCache(path=path)
+    assert second.get("a") == entry(3)
+    assert second.get("a") == entry(3)
+    assert second.cache_info().disk_hits == 1
+    assert second.cache_info().hits == 2
+    second.close()
+
+
+def test_states_share_a_key_within_one_quantum():
+    cache = solution_cache.WeeklySolutionCache(fatigue_quantum=1.0, fitness_quantum=2.0)
+
+    def key(swim_fatigue, swim_fitness):
+        return cache.key("base", False, 8, dict(fatigue, swim=swim_fatigue), dict(fitness, swim=swim_fitness), "library")
+
+    assert key(30.4, 50) == key(29.6, 50)
+    assert key(30.4, 50) != key(30.6, 50)
+    assert key(30, 50.9) == key(30, 49.1)
+    assert key(30, 50.9) != key(30, 51.1)
+    exact = solution_cache.WeeklySolutionCache(fatigue_quantum=0)
+    assert exact.key("base", False, 8, dict(fatigue, swim=30.4), fitness, "library") != exact.key("base", False, 8, dict(fatigue, swim=30.41), fitness, "library")
+
+
+def test_hit_reproduces_the_solved_week(small_library):
+    cache = solution_cache.WeeklySolutionCache()
+    plan = cache.wrap(workout_planner.add_workouts_to_week_plan_matrix)
+    solved = plan(base_week(), fatigue, fitness, False, 8)
+    cached = plan(base_week(), fatigue, fitness, False, 8)
+    assert cache.cache_info().hits == 1
+    assert cached["workouts"] == solved["workouts"]
+    assert cached["fatigue_outcome"] == solved["fatigue_outcome"]
+
+
+def test_hit_that_breaks_a_row_for_the_actual_state_is_solved(small_library):
+    # one bucket for every fatigue: the week stored for fresh legs would overload tired ones
+    cache = solution_cache.WeeklySolutionCache(fatigue_quantum=1000)
+    plan = cache.wrap(workout_planner.add_workouts_to_week_plan_matrix)
+    plan(base_week(), {"swim": 0, "bike": 0, "run": 0}, fitness, False, 8)
+    tired = {"swim": 40, "bike": 40, "run": 40}
+    week = plan(base_week(), tired, fitness, False, 8)
+    assert cache.cache_info().hits == 0
+    assert cache.cache_info().misses == 2
+    assert rows_met(week, tired, 8)
+
+
+def test_relaxed_week_keeps_its_relaxation_on_a_hit(small_library):
+    cache = solution_cache.WeeklySolutionCache()
+    plan = cache.wrap(workout_planner.add_workouts_to_week_plan_matrix)
+    solved = plan(base_week(), over_swim_limit, fitness, False, 8)
+    cached = plan(base_week(), over_swim_limit, fitness, False, 8)
+    assert cache.cache_info().hits == 1
+    assert cached["relaxation"]["relaxed_rows"] == solved["relaxation"]["relaxed_rows"]
+    assert cached["relaxation"]["failed_checks"] == solved["relaxation"]["failed_checks"]
+
+
+def test_copies_of_available_workouts_are_cached_by_their_fields(small_library):
+    available_workouts = workout_library.GetWorkoutsForWeek("base")
+    week = workout_planner.add_workouts_to_week_plan_matrix(base_week(), fatigue, fitness, False, 8)
+    copied = copy.deepcopy(week)
+    assert solution_cache.selection_positions(copied, available_workouts) == solution_cache.selection_positions(week, available_workouts)
+
+    copied["workouts"][0].append(dict(available_workouts[0], workout_name="not in the library"))
+    assert solution_cache.selection_positions(copied, available_workouts) is None
+
+
+def test_another_library_misses(small_library, tmp_path):
+    cache = solution_cache.WeeklySolutionCache()
+    plan = cache.wrap(workout_planner.add_workouts_to_week_plan_matrix)
+    plan(base_week(), fatigue, fitness, False, 8)
+    workout_library.use_library(benchmark.synthetic_library(str(tmp_path), 30, seed=1))
+    plan(base_week(), fatigue, fitness, False, 8)
+    assert cache.cache_info().misses == 2
+    assert cache.cache_info().currsize == 2
@@ -0,0 +1,120 @@
+import pytest
+
+from lib import solve_budget
+from lib import solvers
+from lib import telemetry
+from lib.benchmark import synthetic_config
+
+
+fitness = {"swim": 50, "bike": 50, "run": 50}
+fatigue = {"swim": 30, "bike": 30, "run": 30}
+over_swim_limit = {"swim": 100, "bike": 30, "run": 30}
+
+
+class StoppedClock:
+    # telemetry.clock that only moves when a test moves it
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = StoppedClock()
+    monkeypatch.setattr(telemetry, "clock", clock)
+    return clock
+
+
+def weeks(*strategies):
+    return [{"strategy": strategy, "start_block": False} for strategy in strategies]
+
+
+def test_remaining_time_is_split_by_expected_seconds(clock):
+    budget = solve_budget.SolveBudget(10, weeks("base", "base", "peak", "peak"))
+    assert budget.week_time_limit() == pytest.approx(2.5)
+
+    budget.difficulty = {"base": 3.0, "peak": 1.0}
+    assert budget.week_time_limit() == pytest.approx(10 * 3 / 8)
+    clock.now = 4
+    budget.week_number = 2
+    assert budget.week_time_limit() == pytest.approx(3.0)
+
+
+def test_time_limit_leaves_later_weeks_their_minimum(clock):
+    budget = solve_budget.SolveBudget(1, weeks("base", "peak", "peak", "peak"), min_week_seconds=.2)
+    budget.difficulty = {"base": 10.0, "peak": 1.0}
+    assert budget.week_time_limit() == pytest.approx(1 - .2 * 3)
+    clock.now = 2
+    assert budget.week_time_limit() == .2
+
+
+def test_observed_seconds_are_smoothed_per_strategy():
+    budget = solve_budget.SolveBudget(10, weeks("base", "peak"))
+    budget.observe("base", 2.0, False)
+    assert budget.expected_seconds("base") == 2.0
+    budget.observe("base", 4.0, False)
+    assert budget.expected_seconds("base") == pytest.approx(3.0)
+    budget.observe("base", 1.0, True)
+    assert budget.expected_seconds("base") == pytest.approx(2.5)
+    # a strategy without solved weeks is expected to take as long as the average
+    budget.observe("peak", 1.5, False)
+    assert budget.expected_seconds("build") == pytest.approx(2.0)
+
+
+def test_backend_instance_keeps_its_options():
+    backend = solvers.HighsBackend(time_limit=30, options={"threads": 1, "mip_rel_gap": .5})
+    budget = solve_budget.SolveBudget(10, weeks("base"), mip_gap=1e-3, solver=backend)
+    week_backend = budget.backend(2.0)
+    assert week_backend.time_limit == 2.0
+    assert week_backend.options == {"threads": 1, "mip_rel_gap": 1e-3}
+    assert backend.options["mip_rel_gap"] == .5
+    assert solve_budget.SolveBudget(10, weeks("base"), solver="glpk").backend(2.0).options == {"mipgap": solve_budget.default_mip_gap}
+
+
+def plan_week(budget, incoming_fatigue=fatigue):
+    return budget.add_workouts_to_week_plan(weeks("base")[0], incoming_fatigue, fitness, False, 8)["solve_budget"]
+
+
+def test_week_solved_to_optimality_is_optimal(small_library, clock):
+    marked = plan_week(solve_budget.SolveBudget(60, weeks("base"), mip_gap=0))
+    assert marked["quality"] == solve_budget.quality_optimal
+    assert marked["engine"] == "highs"
+
+
+def test_week_without_a_reported_gap_is_gap_limited(small_library, clock, monkeypatch):
+    # what glpk reports for a solve stopped at its mipgap: optimal, with no gap
+    solve_arrays = solvers.HighsBackend.solve_arrays
+
+    def without_gap(self, *args, **kwargs):
+        results = solve_arrays(self, *args, **kwargs)
+        results.mip_gap = None
+        return results
+
+    monkeypatch.setattr(solvers.HighsBackend, "solve_arrays", without_gap)
+    marked = plan_week(solve_budget.SolveBudget(60, weeks("base")))
+    assert marked["quality"] == solve_budget.quality_gap_limited
+    assert marked["mip_gap"] is None
+
+
+def test_week_after_the_deadline_is_searched(small_library, clock):
+    budget = solve_budget.SolveBudget(1, weeks("base"))
+    clock.now = 5
+    marked = plan_week(budget)
+    assert marked["engine"] == "search"
+    assert marked["quality"] in (solve_budget.quality_heuristic, solve_budget.quality_optimal)
+    assert marked["time_limit"] == budget.min_week_seconds
+
+
+def test_week_failing_precheck_is_relaxed(small_library, clock):
+    marked = plan_week(solve_budget.SolveBudget(60, weeks("base")), over_swim_limit)
+    assert marked["quality"] == solve_budget.quality_relaxed
+
+
+def test_every_week_of_a_budgeted_plan_is_marked(small_library):
+    plan = solve_budget.create_training_plan_with_budget(synthetic_config(6, 5), 30)
+    qualities = {solve_budget.quality_optimal, solve_budget.quality_gap_limited, solve_budget.quality_heuristic, solve_budget.quality_relaxed}
+    assert len(plan) == 6
+    assert all(week["solve_budget"]["quality"] in qualities for week in plan)
@@ -0,0 +1,50 @@
+import io
+
+import numpy as np
+import pytest
+import scipy.sparse
+
+from lib import solvers
+
+
+c = np.array([1.0, 1.0])
+A = scipy.sparse.csr_matrix(np.array([[1.0, 1.0], [0.0, 0.0]]))
+
+
+def test_empty_row_with_negative_rhs_is_infeasible_for_every_backend():
+    b = np.array([1.0, -1.0])
+    assert solvers.HighsBackend().solve_arrays(c, A, b).status == solvers.status_infeasible
+    # answered before glpsol is run, so this holds without glpk installed
+    assert solvers.GlpkBackend().solve_arrays(c, A, b).status == solvers.status_infeasible
+    with pytest.raises(ValueError):
+        solvers.write_lp(c, A, b, io.StringIO())
+
+
+def test_empty_row_with_non_negative_rhs_is_skipped():
+    b = np.array([1.0, 0.0])
+    file = io.StringIO()
+    solvers.write_lp(c, A, b, file)
+    assert "r0:" in file.getvalue()
+    assert "r1:" not in file.getvalue()
+    assert solvers.HighsBackend().solve_arrays(c, A, b).objective == pytest.approx(1.0)
+
+
+@pytest.mark.skipif(not solvers.GlpkBackend().available(), reason="glpsol is not installed")
+def test_time_limited_glpk_keeps_the_rule_models_incumbent(small_library):
+    from lib import week_matrix
+    from lib import workout_planner
+
+    fitness = {"swim": 50, "bike": 50, "run": 50}
+    fatigue = {"swim": 30, "bike": 30, "run": 30}
+    backend = solvers.GlpkBackend(time_limit=1)
+    week = workout_planner.add_workouts_to_week_plan({"strategy": "base", "start_block": False}, fatigue, fitness, False, 8, solver=backend)
+    assert len(week["workouts"]) == week_matrix.number_of_days
+    assert "relaxation" not in week
+    assert sum(len(day) for day in week["workouts"]) > 0
+
+
+@pytest.mark.skipif(not solvers.GlpkBackend().available(), reason="glpsol is not installed")
+def test_glpk_reports_no_gap_when_one_was_allowed():
+    b = np.array([1.0, 0.0])
+    assert solvers.GlpkBackend().solve_arrays(c, A, b).mip_gap == 0.0
+    assert solvers.GlpkBackend(options={"mipgap": 1e-3}).solve_arrays(c, A, b).mip_gap is None
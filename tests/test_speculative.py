@@ -0,0 +1,50 @@
+import copy
+
+import pytest
+
+from lib import batch
+from lib import periodization
+from lib import speculative
+from lib import workout_planner
+from lib.benchmark import synthetic_config
+
+
+def season(number_of_weeks=4):
+    config = synthetic_config(number_of_weeks)
+    incoming_fatigue, incoming_fitness = batch.initial_state(config)
+    return periodization.create_linear_periodization_plan(config), incoming_fatigue, incoming_fitness, config["max_weekly_training"]
+
+
+def plan_sequential(week_plan, incoming_fatigue, incoming_fitness, weekly_hours_max):
+    return workout_planner.add_workouts_to_weeks(copy.deepcopy(week_plan), incoming_fatigue, incoming_fitness, weekly_hours_max, workout_planner.add_workouts_to_week_plan_matrix)
+
+
+def plan_summary(week_plan):
+    return [
+        ([[workout["workout_name"] for workout in day] for day in week["workouts"]], week["fatigue_outcome"], week["fitness_outcome"], week.get("relaxation"))
+        for week in week_plan
+    ]
+
+
+@pytest.mark.parametrize("incoming_fatigue", [None, {"swim": 100, "bike": 30, "run": 30}])
+def test_speculative_plan_matches_sequential(small_library, incoming_fatigue):
+    week_plan, initial_fatigue, incoming_fitness, weekly_hours_max = season()
+    incoming_fatigue = incoming_fatigue or initial_fatigue
+    sequential = plan_sequential(week_plan, incoming_fatigue, incoming_fitness, weekly_hours_max)
+
+    speculation = speculative.add_workouts_to_weeks_speculative(copy.deepcopy(week_plan), incoming_fatigue, incoming_fitness, weekly_hours_max, workers=0)
+    assert plan_summary(speculation.week_plan) == plan_summary(sequential)
+    assert speculation.rounds <= len(week_plan)
+    assert speculation.critical_path_seconds <= speculation.solve_seconds
+
+
+def test_speculative_commits_every_week_in_one_round_from_a_matching_guess_plan(small_library):
+    week_plan, incoming_fatigue, incoming_fitness, weekly_hours_max = season()
+    sequential = plan_sequential(week_plan, incoming_fatigue, incoming_fitness, weekly_hours_max)
+
+    speculation = speculative.add_workouts_to_weeks_speculative(
+        copy.deepcopy(week_plan), incoming_fatigue, incoming_fitness, weekly_hours_max, workers=0, lookahead=len(week_plan), guess_plan=sequential
+    )
+    assert plan_summary(speculation.week_plan) == plan_summary(sequential)
+    assert speculation.rounds == 1
+    assert speculation.solves == len(week_plan)
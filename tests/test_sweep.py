@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from lib.workouts import workouts as workout_library
+from lib import batch
+from lib import replan
+from lib import solvers
+from lib import sweep
+from lib import workout_planner
+from lib.benchmark import synthetic_config
+from lib.week_matrix import sports
+
+
+fitness = {sport: 50 for sport in sports}
+
+
+class CountingBackend(solvers.HighsBackend):
+
+    def __init__(self):
+        super().__init__(time_limit=10)
+        self.calls = 0
+
+    def solve_arrays(self, c, A, b, relaxed=False, start=None, continuous_columns=0):
+        self.calls += 1
+        return super().solve_arrays(c, A, b, relaxed, start, continuous_columns)
+
+
+def week_sensitivity(strategy, fatigue, hours):
+    # a week solved at b0 with what still_optimal needs, as plan_base keeps it
+    matrix = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(strategy))
+    b = matrix.rhs({sport: fatigue for sport in sports}, fitness, hours)
+    backend = solvers.get_backend()
+    lp = backend.solve_arrays(matrix.c, matrix.A, b, relaxed=True)
+    milp = backend.solve_arrays(matrix.c, matrix.A, b)
+    return matrix, sweep.WeekSensitivity(milp.values, float(matrix.c @ milp.values), lp.objective, lp.duals, b)
+
+
+@pytest.mark.parametrize("group", ["must_not_exceed_max_fatigue_by_sport", "must_not_exceed_weekly_duration_limit", "must_not_exceed_divergence_limit"])
+def test_lp_dual_bound_keeps_the_incumbent_optimal(small_library, group):
+    # the LP relaxation of this week is within one objective step of the MILP, so raising rows the
+    # optimum does not press against cannot make room for a better selection
+    matrix, base = week_sensitivity("build", 40, 20)
+    b = base.b.copy()
+    b[matrix.row_groups[group]] += 1
+    assert not np.all(b <= base.b)
+    assert sweep.still_optimal(matrix, base, b)
+    assert solvers.get_backend().solve_arrays(matrix.c, matrix.A, b).objective == pytest.approx(base.objective)
+
+
+def test_loose_lp_bound_does_not_keep_the_incumbent(small_library):
+    matrix, base = week_sensitivity("base", 30, 5)
+    b = base.b.copy()
+    b[matrix.row_groups["must_not_exceed_weekly_duration_limit"]] += 60
+    assert base.lp_objective + base.duals @ (b - base.b) >= base.objective + 0.1
+    assert not sweep.still_optimal(matrix, base, b)
+
+
+def fresh_objectives(config, limits, weeks):
+    # each week of a sweep point solved from scratch, from the point's own incoming states
+    incoming_fatigue, incoming_fitness = batch.initial_state(config)
+    objectives = []
+    for week_number, week, is_last_week_of_block in sweep.iter_season(config, weeks):
+        if week_number > 0:
+            incoming_fatigue, incoming_fitness = weeks[week_number-1]["fatigue_outcome"], weeks[week_number-1]["fitness_outcome"]
+        matrix = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(week["strategy"]))
+        b = sweep.week_rhs(matrix, week, incoming_fatigue, incoming_fitness, is_last_week_of_block, limits)
+        objectives.append(solvers.get_backend().solve_arrays(matrix.c, matrix.A, b).objective)
+    return objectives
+
+
+def week_objective(week):
+    matrix = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(week["strategy"]))
+    return float(matrix.c @ replan.week_selection(matrix.columns, week).ravel())
+
+
+@pytest.mark.parametrize("parameter, value, reused", [("total_fatigue_upper_bound", 119, 4), ("max_divergence", 9, 2), ("weekly_hours_max", 50, 0)])
+def test_points_solve_only_the_weeks_they_cannot_reuse(small_library, parameter, value, reused):
+    config = synthetic_config(4, 5)
+    week_plan, sensitivities = sweep.plan_base(config)
+    limits = sweep.base_limits(config)
+    limits[parameter] = value
+
+    backend = CountingBackend()
+    weeks, weeks_reused = sweep.plan_point(config, limits, week_plan, sensitivities, backend)
+    assert weeks_reused == reused
+    assert backend.calls == len(weeks) - reused
+    assert [week_objective(week) for week in weeks] == pytest.approx(fresh_objectives(config, limits, weeks))
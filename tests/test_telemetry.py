@@ -0,0 +1,80 @@
+import datetime
+import io
+import json
+
+import pytest
+
+from lib.workouts import workouts as workout_library
+from lib import telemetry
+
+
+def planned_week():
+    return {"start_date": datetime.date(2025, 1, 6), "strategy": "base", "fatigue_outcome": {"swim": 10, "bike": 20, "run": 30}}
+
+
+def test_sinks_receive_events_while_registered():
+    recorder = telemetry.MetricsRecorder()
+    assert not telemetry.enabled()
+    telemetry.add_sink(recorder)
+    assert telemetry.enabled()
+    telemetry.emit("replan", {"week_index": 2})
+    telemetry.remove_sink(recorder)
+    telemetry.remove_sink(recorder)
+    telemetry.emit("replan", {"week_index": 3})
+    assert not telemetry.enabled()
+    assert recorder.events == [("replan", {"week_index": 2})]
+
+
+def test_sink_context_removes_the_sink_on_errors():
+    recorder = telemetry.MetricsRecorder()
+    with pytest.raises(RuntimeError):
+        with telemetry.sink(recorder):
+            assert telemetry.sinks == [recorder]
+            raise RuntimeError
+    assert telemetry.sinks == []
+
+
+def test_week_record_is_attached_only_when_a_sink_listens():
+    counted = []
+
+    def counts():
+        counted.append(True)
+        return 5, 7
+
+    week = planned_week()
+    assert telemetry.report_week(week, "matrix", 1, 2, 3, counts=counts) is None
+    assert "telemetry" not in week
+    assert counted == []
+
+    with telemetry.sink(telemetry.MetricsRecorder()) as recorder:
+        record = telemetry.report_week(week, "matrix", 1, 2, 3, counts=counts, solver="highs")
+    assert week["telemetry"] is record
+    assert record["number_of_variables"] == 5
+    assert record["number_of_constraints"] == 7
+    assert record["status"] is None
+    assert record["solver"] == "highs"
+    assert recorder.of_kind("week") == [record]
+    assert recorder.of_kind("fatigue_outcome") == [week["fatigue_outcome"]]
+
+
+def test_json_lines_sink_writes_one_line_per_event():
+    file = io.StringIO()
+    with telemetry.sink(telemetry.JsonLinesSink(file)):
+        week = planned_week()
+        telemetry.report_week(week, "rule", .5, 1.5, .25)
+    lines = [json.loads(line) for line in file.getvalue().splitlines()]
+    assert [line["kind"] for line in lines] == ["week", "fatigue_outcome"]
+    assert lines[0]["data"]["start_date"] == "2025-01-06"
+    assert lines[0]["data"]["solve_seconds"] == 1.5
+    assert lines[1]["data"] == week["fatigue_outcome"]
+
+
+def test_csv_library_rows_are_reported(small_library_path):
+    assert telemetry.sinks == []
+    workouts = workout_library.read_csv_library(small_library_path)
+    with telemetry.sink(telemetry.MetricsRecorder()) as recorder:
+        assert workout_library.read_csv_library(small_library_path) == workouts
+    rows = recorder.of_kind("library_row")
+    assert len(rows) == len(workouts)
+    assert rows[0]["path"] == small_library_path
+    assert workout_library.Workout.from_row(rows[0]["row"]) == workouts[0]
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from lib.workouts import workouts as workout_library
+from lib import workout_planner
+from lib import week_matrix
+from lib.replan import week_selection
+from lib.week_matrix import fitness_carryover, sports
+
+
+states = [
+    ({"swim": 30, "bike": 30, "run": 30}, {"swim": 50, "bike": 50, "run": 50}),
+    ({"swim": 60, "bike": 10, "run": 45}, {"swim": 58, "bike": 49, "run": 52})
+]
+
+
+def fitness_gain(week, incoming_fitness):
+    return sum(week["fitness_outcome"][sport] - incoming_fitness[sport] * fitness_carryover for sport in sports)
+
+
+@pytest.mark.parametrize("strategy", ["base", "build", "peak", "rest"])
+@pytest.mark.parametrize("incoming_fatigue, incoming_fitness", states)
+@pytest.mark.parametrize("is_last_week_of_block", [False, True])
+def test_matrix_engine_matches_rule_engine(small_library, strategy, incoming_fatigue, incoming_fitness, is_last_week_of_block):
+    # both engines solve the same model to optimality; ties may pick other workouts, the gain is the same
+    rule = workout_planner.add_workouts_to_week_plan({"strategy": strategy}, incoming_fatigue, incoming_fitness, is_last_week_of_block, 8)
+    matrix = workout_planner.add_workouts_to_week_plan_matrix({"strategy": strategy}, incoming_fatigue, incoming_fitness, is_last_week_of_block, 8)
+    assert fitness_gain(matrix, incoming_fitness) == pytest.approx(fitness_gain(rule, incoming_fitness), abs=1e-6)
+
+    # and the rule engine's week meets every row of the matrix model
+    matrix_model = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(strategy))
+    hours_limit = week_matrix.weekly_hours_limit({"strategy": strategy}, is_last_week_of_block, 8)
+    b = matrix_model.rhs(incoming_fatigue, incoming_fitness, hours_limit)
+    assert (matrix_model.A @ week_selection(matrix_model.columns, rule).ravel() <= b + 1e-9).all()
+
+
+def reference_week(columns, selection, incoming_fitness):
+    # the loops the vectorized extractor replaced: every selected workout, one at a time
+    workouts = [[columns.workouts[workout_id] for workout_id in range(len(columns)) if selection[day, workout_id] == 1] for day in range(week_matrix.number_of_days)]
+    fitness_gain = {sport: 0.0 for sport in sports}
+    fatigue = {sport: 0.0 for sport in sports}
+    for day in range(week_matrix.number_of_days):
+        for workout_id in range(len(columns)):
+            if selection[day, workout_id] != 1:
+                continue
+            sport = sports[columns.sport[workout_id]]
+            fitness_gain[sport] += columns.fitness_increase[workout_id] * week_matrix.fitness_multiplier
+            if day in range(3, 6):
+                fatigue[sport] += columns.fatigue_increase[workout_id]
+    fitness = {sport: incoming_fitness[sport] * fitness_carryover + fitness_gain[sport] for sport in sports}
+    return workouts, fitness, fatigue
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_vectorized_extraction_matches_reference(small_library, seed):
+    rng = np.random.default_rng(seed)
+    matrix = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek("base"))
+    selection = (rng.random((week_matrix.number_of_days, matrix.number_of_workouts)) < .2).astype(np.float64)
+    incoming_fitness = {"swim": 51.5, "bike": 47.25, "run": 60.0}
+
+    # values as a solver reports them, a little off 0 and 1
+    noise = rng.uniform(-1e-7, 1e-7, selection.size)
+    values = selection.ravel() + noise
+    week = week_matrix.apply_selection_to_week({}, matrix.columns, week_matrix.selection_from_solution(matrix, values), incoming_fitness)
+
+    workouts, fitness, fatigue = reference_week(matrix.columns, selection, incoming_fitness)
+    assert week["workouts"] == workouts
+    assert week["fitness_outcome"] == pytest.approx(fitness, abs=1e-9)
+    assert week["fatigue_outcome"] == pytest.approx(fatigue, abs=1e-9)
+
+
+def test_round_solution_rejects_fractional_and_missing_values():
+    assert week_matrix.round_solution([0.9999999, 1e-8, 0.0]).tolist() == [1.0, 0.0, 0.0]
+    with pytest.raises(ValueError):
+        week_matrix.round_solution([0.5, 1.0])
+    with pytest.raises(ValueError):
+        week_matrix.round_solution([None, 1.0])
+    with pytest.raises(ValueError):
+        week_matrix.round_solution([2.0])
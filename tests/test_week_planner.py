@@ -0,0 +1,66 @@
+import pytest
+
+from lib.workouts import workouts as workout_library
+from lib import batch
+from lib import periodization
+from lib import replan
+from lib import week_matrix
+from lib import week_planner
+from lib import workout_planner
+from lib.benchmark import synthetic_config
+
+
+def athlete(number_of_weeks, weekly_hours, current_fitness):
+    return dict(synthetic_config(number_of_weeks, weekly_hours), current_fitness=current_fitness)
+
+
+def plan_weeks(config, add_workouts_to_weeks):
+    week_plan = periodization.create_linear_periodization_plan(config)
+    incoming_fatigue, incoming_fitness = batch.initial_state(config)
+    return add_workouts_to_weeks(week_plan, incoming_fatigue, incoming_fitness, config["max_weekly_training"])
+
+
+def objective(week):
+    matrix = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(week["strategy"]))
+    return float(matrix.c @ replan.week_selection(matrix.columns, week).ravel())
+
+
+def test_persistent_weeks_match_the_matrix_engine(small_library):
+    # both engines solve every week of one horizon from the same incoming state. equally fit weeks
+    # differ in the days their workouts fall on, so the engines agree on the objective, and on the
+    # outcomes and rows of the week the planner picked
+    planner = week_planner.WeekPlanner()
+    weeks = []
+
+    def both_engines(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max):
+        matrix_week = workout_planner.add_workouts_to_week_plan_matrix(dict(week), incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max)
+        planner.add_workouts_to_week_plan(week, incoming_fatigue, incoming_fitness, is_last_week_of_block, weekly_hours_max)
+        weeks.append((week, matrix_week, dict(incoming_fatigue), dict(incoming_fitness), week_matrix.weekly_hours_limit(week, is_last_week_of_block, weekly_hours_max)))
+
+    plan = plan_weeks(athlete(9, 5, 50), lambda *args: workout_planner.add_workouts_to_weeks(*args, both_engines))
+    assert len({week["strategy"] for week in plan}) > 1
+    assert any(week["start_block"] for week in plan[1:])
+
+    for persistent_week, matrix_week, incoming_fatigue, incoming_fitness, hours_limit in weeks:
+        assert objective(persistent_week) == pytest.approx(objective(matrix_week))
+        matrix = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(persistent_week["strategy"]))
+        selection = replan.week_selection(matrix.columns, persistent_week)
+        outcomes = week_matrix.apply_selection_to_week({}, matrix.columns, selection, incoming_fitness)
+        assert persistent_week["fatigue_outcome"] == pytest.approx(outcomes["fatigue_outcome"])
+        assert persistent_week["fitness_outcome"] == pytest.approx(outcomes["fitness_outcome"])
+        assert "relaxation" not in persistent_week
+        assert (matrix.A @ selection.ravel() <= matrix.rhs(incoming_fatigue, incoming_fitness, hours_limit) + 1e-9).all()
+
+
+def test_reset_planner_plans_the_next_athlete_as_a_new_one(small_library):
+    first, second = athlete(5, 8, 50), athlete(5, 5, 30)
+    fresh = plan_weeks(second, week_planner.WeekPlanner().add_workouts_to_weeks)
+
+    planner = week_planner.WeekPlanner()
+    plan_weeks(first, planner.add_workouts_to_weeks)
+    planner.reset()
+    assert planner.previous_workouts is None
+    reused = plan_weeks(second, planner.add_workouts_to_weeks)
+
+    assert [week["workouts"] for week in reused] == [week["workouts"] for week in fresh]
+    assert [week["fitness_outcome"] for week in reused] == [week["fitness_outcome"] for week in fresh]
@@ -0,0 +1,66 @@
+import pytest
+
+from lib.workouts import workouts as workout_library
+from lib import solvers
+from lib import week_matrix
+from lib import week_search
+from lib import workout_planner
+
+
+fitness = {"swim": 50, "bike": 50, "run": 50}
+fatigue = {"swim": 30, "bike": 30, "run": 30}
+
+
+def week_arrays(strategy, hours):
+    matrix = workout_planner.get_week_matrix(workout_library.GetWorkoutsForWeek(strategy))
+    return matrix, matrix.rhs(fatigue, fitness, hours)
+
+
+class NoStartBackend(solvers.HighsBackend):
+    takes_start = False
+
+    def __init__(self):
+        super().__init__(time_limit=10)
+        self.calls = []
+
+    def solve_arrays(self, c, A, b, relaxed=False, start=None, continuous_columns=0):
+        self.calls.append((relaxed, start))
+        return super().solve_arrays(c, A, b, relaxed, start, continuous_columns)
+
+
+@pytest.mark.parametrize("strategy", ["base", "build", "peak", "rest"])
+@pytest.mark.parametrize("hours", [1, 2, 3])
+def test_proven_weeks_match_the_milp(small_library, strategy, hours):
+    matrix, b = week_arrays(strategy, hours)
+    backend = solvers.get_backend("highs")
+    milp = backend.solve_arrays(matrix.c, matrix.A, b)
+    lp = backend.solve_arrays(matrix.c, matrix.A, b, relaxed=True)
+
+    result = week_search.WeekSearch(matrix, b).run(upper_bound=lp.objective)
+    assert result.objective <= milp.objective + 1e-6
+    if result.proven_optimal:
+        assert result.objective == pytest.approx(milp.objective)
+
+
+def test_short_weeks_are_proven_without_the_milp(small_library):
+    week = week_search.add_workouts_to_week_plan_search({"strategy": "peak", "start_block": False}, fatigue, fitness, False, 4)
+    assert week["search"]["proven_optimal"]
+    assert week["search"]["engine"] == "search"
+    assert week["search"]["nodes"] < 100
+
+
+def test_search_stops_once_it_stalls(small_library):
+    matrix, b = week_arrays("base", 8)
+    search = week_search.WeekSearch(matrix, b)
+    result = search.run(node_limit=10 ** 6, stall_nodes=50)
+    assert not result.proven_optimal
+    assert result.nodes == search.last_improvement + 51
+
+
+def test_search_is_skipped_for_backends_without_mip_starts(small_library):
+    backend = NoStartBackend()
+    week = week_search.add_workouts_to_week_plan_search({"strategy": "base", "start_block": False}, fatigue, fitness, False, 8, solver=backend)
+    assert backend.calls == [(False, None)]
+    assert week["search"]["nodes"] == 0
+    assert week["search"]["engine"] == "highs"
+    assert len(week["workouts"]) == week_matrix.number_of_days
@@ -0,0 +1,83 @@
+import os
+import pickle
+
+import pytest
+
+from lib.workouts import workouts as workout_library
+from lib.workouts import binary_library
+from lib import benchmark
+
+
+def test_catalog_hands_out_typed_records_built_once(small_library):
+    workouts = small_library.all_workouts()
+    assert all(isinstance(workout, workout_library.Workout) for workout in workouts)
+    assert small_library.all_workouts() is workouts
+    assert small_library.workouts is workouts
+
+    base = small_library.workouts_for_week("base")
+    assert all(isinstance(workout, workout_library.Workout) for workout in base)
+    assert {id(workout) for workout in base} <= {id(workout) for workout in workouts}
+    assert small_library.workouts_for_week("base") is base
+
+
+def test_records_read_like_workout_dicts(small_library):
+    workout = small_library.all_workouts()[0]
+    assert workout["sport"] == workout.sport
+    assert dict(workout) == workout
+    assert list(workout) == list(workout_library.Workout.fields)
+
+
+def test_reload_builds_new_records(tmp_path, small_library_path):
+    path = str(tmp_path / "library.csv")
+    with open(small_library_path) as source, open(path, "w") as copy:
+        copy.write(source.read())
+    catalog = workout_library.WorkoutCatalog([path])
+    workouts = catalog.all_workouts()
+
+    with open(path, "a") as file:
+        file.write("run,added run,5,30,20,2,\n")
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+    reloaded = catalog.all_workouts()
+    assert reloaded is not workouts
+    assert len(reloaded) == len(workouts) + 1
+    assert reloaded[-1].workout_name == "added run"
+
+
+def test_compiled_library_matches_the_csv(tmp_path, small_library_path):
+    binary_path = benchmark.synthetic_library(str(tmp_path), 30, "binary")
+    csv_workouts = workout_library.WorkoutCatalog([small_library_path]).workouts_for_week("build")
+    binary_workouts = workout_library.WorkoutCatalog([binary_path]).workouts_for_week("build")
+    assert [dict(workout) for workout in binary_workouts] == [dict(workout) for workout in csv_workouts]
+
+
+def test_memory_mapped_views_match_the_catalog_field_by_field(tmp_path, small_library_path):
+    csv_library = workout_library.CsvWorkoutLibrary(small_library_path)
+    binary_path = str(tmp_path / ("library" + binary_library.binary_suffix))
+    assert binary_library.compile_library([small_library_path], binary_path) == len(csv_library.workouts)
+
+    library = binary_library.BinaryWorkoutLibrary(binary_path)
+    assert len(library) == len(csv_library.workouts)
+    for view, workout in zip(library.workouts, csv_library.workouts):
+        for field in workout_library.Workout.fields:
+            assert view[field] == workout[field]
+            assert type(view[field]) is type(workout[field])
+    for week_strategy in workout_library.week_strategies + ["taper", None]:
+        for sport in workout_library.sports + [None]:
+            assert [dict(view) for view in library.select(week_strategy, sport)] == [dict(workout) for workout in csv_library.select(week_strategy, sport)]
+
+
+def test_views_pickle_as_plain_dicts(tmp_path, small_library_path):
+    binary_path = str(tmp_path / ("library" + binary_library.binary_suffix))
+    binary_library.compile_library([small_library_path], binary_path)
+    views = binary_library.BinaryWorkoutLibrary(binary_path).workouts[:3]
+    unpickled = pickle.loads(pickle.dumps(views))
+    assert all(type(workout) is dict for workout in unpickled)
+    assert list(unpickled) == [dict(view) for view in views]
+
+
+def test_other_files_are_not_read_as_compiled_libraries(tmp_path):
+    path = str(tmp_path / ("library" + binary_library.binary_suffix))
+    with open(path, "wb") as file:
+        file.write(b"\0" * 64)
+    with pytest.raises(ValueError):
+        binary_library.BinaryWorkoutLibrary(path)